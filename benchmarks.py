@@ -0,0 +1,695 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import tempfile
+import argparse
+import platform
+import tracemalloc
+import subprocess
+import multiprocessing
+import numpy as np
+from datetime import datetime as dt
+
+import personal_assistant as pa
+
+#Замеры производительности персонального помощника: python -m benchmarks [замер] [размеры...] [--backend ...] [--output results.json] [--compare old.json]
+#Без аргументов выполняется набор замеров всех разделов (sections). Результаты печатаются построчно, с --output сохраняются в JSON
+#вместе с версией (коммитом), Python и платформой; --compare печатает замеры, ставшие медленнее, чем в сохранённом файле.
+
+FINANCE_CATEGORIES = ['Еда', 'Транспорт', 'Жильё', 'Развлечения', 'Здоровье', 'Зарплата', 'Подарки', 'Прочее']
+
+SYNTHETIC_WORDS = ['отчёт', 'встреча', 'проект', 'бюджет', 'покупка', 'звонок', 'план', 'идея', 'ремонт', 'отпуск', 'врач', 'книга',
+                   'подарок', 'договор', 'счёт', 'поездка', 'обед', 'спорт', 'учёба', 'семья', 'работа', 'дача', 'машина', 'банк']
+SYNTHETIC_FIRST_NAMES = ['Иван', 'Пётр', 'Анна', 'Мария', 'Олег', 'Елена', 'Сергей', 'Ольга', 'Дмитрий', 'Наталья', 'Алексей', 'Ирина']
+SYNTHETIC_LAST_NAMES = ['Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев', 'Козлов', 'Новиков', 'Морозов']
+
+#Синтетические записи раздела в виде столбцов (как принимает compact хранилища): id подряд с first_id,
+#даты за 10 лет с 2015 года, тексты из SYNTHETIC_WORDS. Одинаковый seed даёт одинаковые данные.
+def synthetic_text(rng, count, words):
+    indices = rng.integers(0, len(SYNTHETIC_WORDS), (count, words)).tolist()
+    return [' '.join(SYNTHETIC_WORDS[i] for i in row) for row in indices]
+
+def generate_columns(section, count, seed=0, first_id=1):
+    rng = np.random.default_rng(seed)
+    ids = list(range(first_id, first_id + count))
+    dates = pa.format_finance_dates(np.datetime64('2015-01-01') + rng.integers(0, 3650, count)).tolist()
+    if section == 'notes':
+        times = rng.integers(0, 86400, count).tolist()
+        return {'id': ids, 'title': [f'Заметка {id}' for id in ids], 'content': synthetic_text(rng, count, 12),
+                'timestamp': [f'{date} {time // 3600:02d}:{time // 60 % 60:02d}:{time % 60:02d}' for date, time in zip(dates, times)]}
+    if section == 'tasks':
+        priorities = rng.integers(0, len(pa.PRIORITIES), count).tolist()
+        return {'id': ids, 'title': [f'Задача {id}' for id in ids], 'description': synthetic_text(rng, count, 4),
+                'done': (rng.random(count) < 0.3).tolist(), 'priority': [pa.PRIORITIES[i] for i in priorities], 'due_date': dates}
+    if section == 'contacts':
+        first = rng.integers(0, len(SYNTHETIC_FIRST_NAMES), count).tolist()
+        last = rng.integers(0, len(SYNTHETIC_LAST_NAMES), count).tolist()
+        phones = rng.integers(0, 10 ** 10, count).tolist()
+        return {'id': ids, 'name': [f'{SYNTHETIC_FIRST_NAMES[i]} {SYNTHETIC_LAST_NAMES[j]}' for i, j in zip(first, last)],
+                'phone': [f'+7{phone:010d}' for phone in phones], 'email': [f'user{id}@example.com' for id in ids]}
+    categories = rng.integers(0, len(FINANCE_CATEGORIES), count).tolist()
+    return {'id': ids, 'amount': rng.normal(0, 1000, count).round(2).tolist(), 'category': [FINANCE_CATEGORIES[i] for i in categories],
+            'description': synthetic_text(rng, count, 2), 'date': dates}
+
+def make_finance_table(count, seed=0):
+    rng = np.random.default_rng(seed)
+    table = pa.FinanceTable(count)
+    table.ids[:count] = np.arange(1, count + 1)
+    table.amounts[:count] = rng.normal(0, 1000, count).round(2)
+    table.dates[:count] = np.datetime64('2015-01-01') + rng.integers(0, 3650, count)
+    for category in FINANCE_CATEGORIES:
+        table.category_code(category)
+    table.category_codes[:count] = rng.integers(0, len(FINANCE_CATEGORIES), count)
+    table.alive[:count] = True
+    table.size = count
+    table.rollup.add(table.dates[:count], table.category_codes[:count], table.amounts[:count])
+    return table
+
+def timed(function, repeat=5):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+    return best, result
+
+def report_totals(table, rows):
+    amounts = table.amounts[rows]
+    return float(amounts[amounts > 0].sum()), float(amounts[amounts < 0].sum())
+
+#Отчёт за месяц: построчный strptime (как было), векторный просмотр всех дат, бинарный поиск по индексу дат и готовые суммы
+def bench_finance_reports(sizes):
+    start, end = np.datetime64('2020-03-01'), np.datetime64('2020-03-31')
+    results = []
+    for size in sizes:
+        table = make_finance_table(size)
+        result = {'records': size}
+        if size <= 1000000:
+            records = table.records()
+            date1, date2 = dt(2020, 3, 1), dt(2020, 3, 31)
+            result['strptime_ms'] = timed(lambda: sum(record.amount for record in records if date1 <= dt.strptime(record.date, '%d-%m-%Y') <= date2), 1)[0] * 1000
+            del records
+        result['scan_ms'] = timed(lambda: report_totals(table, np.flatnonzero(table.alive[:table.size] & (table.dates[:table.size] >= start) & (table.dates[:table.size] <= end))))[0] * 1000
+        result['index_build_ms'] = timed(lambda: (setattr(table, 'date_index', None), table.build_date_index()), 1)[0] * 1000
+        result['index_ms'] = timed(lambda: report_totals(table, table.date_range_rows(start, end)))[0] * 1000
+        result['rollup_ms'] = timed(lambda: table.totals().period(start, end))[0] * 1000
+        result['matched'] = len(table.date_range_rows(start, end))
+        results.append(result)
+        print_result(result)
+    return results
+
+#Нагрузка на HTTP API: сервер в отдельном процессе на временных данных, каждый клиент держит keep-alive соединение.
+#Размеры - число одновременных клиентов; 80% запросов читают задачу по id, 20% добавляют новую.
+HTTP_REQUESTS = 20000
+HTTP_SEED_TASKS = 10000
+HTTP_WRITE_SHARE = 0.2
+
+def start_server(directory):
+    with socket.socket() as probe:
+        probe.bind((pa.SERVER_HOST, 0))
+        port = probe.getsockname()[1]
+    script = os.path.abspath(pa.__file__)
+    seed = ''.join(json.dumps({'section': 'tasks', 'op': 'add', 'data': {'title': f'Задача {i}', 'due_date': '01-01-2025'}}) + '\n'
+                   for i in range(HTTP_SEED_TASKS))
+    subprocess.run([sys.executable, script, 'batch'], input=seed, text=True, cwd=directory, check=True, stdout=subprocess.DEVNULL)
+    server = subprocess.Popen([sys.executable, script, 'serve', '--port', str(port)], cwd=directory, stdout=subprocess.PIPE, text=True)
+    server.stdout.readline()
+    return server, port
+
+async def http_client(port, count, latencies, seed):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(pa.SERVER_HOST, port)
+    for i in range(count):
+        if rng.random() < HTTP_WRITE_SHARE:
+            body = json.dumps({'title': f'Новая задача {seed}-{i}', 'due_date': '01-01-2025'}).encode('utf-8')
+            request = f'POST /tasks HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body
+        else:
+            request = f'GET /tasks/{rng.randint(1, HTTP_SEED_TASKS)} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode('latin-1')
+        start = time.perf_counter()
+        writer.write(request)
+        head = await reader.readuntil(b'\r\n\r\n')
+        length = int(head.lower().split(b'content-length:')[1].split(b'\r\n')[0])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+        if not head.startswith(b'HTTP/1.1 20'):
+            raise RuntimeError(head.decode('latin-1'))
+    writer.close()
+
+async def http_load(port, clients, requests):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[http_client(port, requests // clients, latencies, seed) for seed in range(clients)])
+    return time.perf_counter() - start, latencies
+
+def bench_http_api(sizes):
+    results = []
+    for clients in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            server, port = start_server(directory)
+            try:
+                elapsed, latencies = asyncio.run(http_load(port, clients, HTTP_REQUESTS))
+            finally:
+                server.terminate()
+                server.wait()
+        latencies = np.array(latencies) * 1000
+        result = {'clients': clients, 'requests': len(latencies), 'rps': len(latencies) / elapsed,
+                  'p50_ms': float(np.percentile(latencies, 50)), 'p99_ms': float(np.percentile(latencies, 99))}
+        results.append(result)
+        print_result(result)
+    return results
+
+#Одновременная запись из нескольких процессов. Размеры - число процессов-писателей; каждый добавляет задачи через BatchExecutor
+#и увеличивает общий счётчик (содержимое заметки 1) чтением-изменением-записью с проверкой версии и повтором при конфликте.
+#В конце число задач и значение счётчика должны точно совпасть с числом операций. Параллельный читатель без блокировок
+#проверяет, что число задач и счётчик никогда не уменьшаются.
+STRESS_OPS_PER_WRITER = 200
+
+def stress_writer(directory, writer, count, start_event):
+    os.chdir(directory)
+    start_event.wait()
+    repository = pa.notes_repository
+    conflicts = 0
+    for i in range(count):
+        executor = pa.BatchExecutor()
+        executor.execute({'section': 'tasks', 'op': 'add', 'data': {'title': f'{writer}-{i}', 'due_date': '01-01-2025'}})
+        executor.flush()
+        while True:
+            note = repository.get(1)
+            before = note.to_dict()
+            try:
+                repository.commit([('update', pa.Note(1, note.title, str(int(note.content) + 1), note.timestamp))], {1: before})
+                break
+            except pa.ConflictError:
+                conflicts += 1
+    return conflicts
+
+def stress_reader(directory, stop_event, start_event):
+    os.chdir(directory)
+    start_event.wait()
+    reads, violations, last = 0, 0, (0, 0)
+    while not stop_event.is_set():
+        state = (len(pa.tasks_repository), int(pa.notes_repository.get(1).content))
+        if state[0] < last[0] or state[1] < last[1]:
+            violations += 1
+        last = state
+        reads += 1
+    return reads, violations
+
+def bench_concurrent_writers(sizes):
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for writers in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            subprocess.run([sys.executable, os.path.abspath(pa.__file__), 'add', 'notes', 'title=Счётчик', 'content=0'],
+                           cwd=directory, check=True, stdout=subprocess.DEVNULL)
+            manager = context.Manager()
+            start_event, stop_event = manager.Event(), manager.Event()
+            with context.Pool(writers + 1) as pool:
+                reader = pool.apply_async(stress_reader, (directory, stop_event, start_event))
+                jobs = [pool.apply_async(stress_writer, (directory, writer, STRESS_OPS_PER_WRITER, start_event)) for writer in range(writers)]
+                time.sleep(0.5)
+                start = time.perf_counter()
+                start_event.set()
+                conflicts = sum(job.get() for job in jobs)
+                elapsed = time.perf_counter() - start
+                stop_event.set()
+                reads, violations = reader.get()
+            manager.shutdown()
+            check = subprocess.run([sys.executable, '-c', 'import personal_assistant as pa; tasks = pa.tasks_repository.all(); '
+                                    'print(len(tasks), len({task.title for task in tasks}), pa.notes_repository.get(1).content)'],
+                                   cwd=directory, env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(pa.__file__))),
+                                   check=True, capture_output=True, text=True)
+            tasks, titles, counter = [int(value) for value in check.stdout.split()]
+        expected = writers * STRESS_OPS_PER_WRITER
+        result = {'writers': writers, 'ops': 2 * expected, 'ops_per_s': 2 * expected / elapsed, 'conflicts': conflicts,
+                  'lost_tasks': expected - titles, 'tasks': tasks,
+                  'lost_increments': expected - int(counter), 'reads': reads, 'read_violations': violations}
+        results.append(result)
+        print_result(result)
+    return results
+
+#Одни и те же операции над финансовыми записями в хранилищах journal и sqlite: запись всех данных, чтение всех данных,
+#одиночное изменение, пачка из 1000 вставок и выборки за месяц и по категории без загруженного кэша
+#(журналу для этого нужно прочитать всё, SQLite использует индексы).
+STORAGE_SINGLE_UPDATES = 200
+
+def bench_storage_backends(sizes):
+    results = []
+    cwd = os.getcwd()
+    for size in sizes:
+        records = make_finance_table(size).to_dicts()
+        for backend in ['journal', 'sqlite']:
+            with tempfile.TemporaryDirectory() as directory:
+                os.chdir(directory)
+                try:
+                    storage = pa.STORAGE_BACKENDS[backend](pa.FINANCE_FILE)
+                    result = {'backend': backend, 'records': size}
+                    result['write_all_ms'] = timed(lambda: storage.compact(records), 1)[0] * 1000
+                    result['read_all_ms'] = timed(lambda: pa.STORAGE_BACKENDS[backend](pa.FINANCE_FILE).read(), 1)[0] * 1000
+                    updates = [dict(records[i], description='изменено') for i in range(STORAGE_SINGLE_UPDATES)]
+                    result['update_one_ms'] = timed(lambda: [storage.apply([{'op': 'update', 'data': record}]) for record in updates], 1)[0] * 1000 / len(updates)
+                    batch = [{'op': 'insert', 'data': dict(record, id=size + i + 1)} for i, record in enumerate(records[:1000])]
+                    result['insert_1000_ms'] = timed(lambda: storage.apply(batch), 1)[0] * 1000
+                    if backend == 'sqlite':
+                        month = lambda: storage.query('date_key BETWEEN ? AND ?', ('2020-03-01', '2020-03-31'))
+                        category = lambda: storage.query('category = ?', ('Подарки',))
+                    else:
+                        month = lambda: [record for record in storage.load().values() if '2020-03-01' <= pa.to_date_key(record['date']) <= '2020-03-31']
+                        category = lambda: [record for record in storage.load().values() if record['category'] == 'Подарки']
+                    result['month_query_ms'], found = timed(month, 1)
+                    result['month_query_ms'] *= 1000
+                    result['month_rows'] = len(found)
+                    result['category_query_ms'] = timed(category, 1)[0] * 1000
+                    result['disk_mb'] = sum(os.path.getsize(name) for name in os.listdir('.') if not name.endswith(pa.LOCK_SUFFIX)) / 2 ** 20
+                finally:
+                    connection = pa.sqlite_connections.pop(os.path.abspath(pa.SQLITE_FILE), None)
+                    if connection != None:
+                        connection.close()
+                    os.chdir(cwd)
+            results.append(result)
+            print_result(result)
+    return results
+
+#Время до первой страницы списка задач (сортировка по сроку): прежний вывод всего списка, первая страница без загруженного кэша,
+#первая и следующая страницы из кэша. Для sqlite страница без кэша берётся из базы по индексу, раздел целиком не читается.
+def make_task_records(count, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pa.format_finance_dates(np.datetime64('2015-01-01') + rng.integers(0, 3650, count)).tolist()
+    priorities = rng.integers(0, len(pa.PRIORITIES), count).tolist()
+    return [{'id': i + 1, 'title': f'Задача {i}', 'description': '', 'done': False, 'priority': pa.PRIORITIES[priorities[i]], 'due_date': dates[i]}
+            for i in range(count)]
+
+def bench_list_pages(sizes):
+    results = []
+    cwd = os.getcwd()
+    for size in sizes:
+        records = make_task_records(size)
+        for backend in ['journal', 'sqlite']:
+            with tempfile.TemporaryDirectory() as directory:
+                os.chdir(directory)
+                backend_before = pa.STORAGE_BACKEND
+                pa.STORAGE_BACKEND = backend
+                pa.storages.clear()
+                try:
+                    pa.get_storage('tasks').compact(records)
+                    repository = pa.tasks_repository
+                    result = {'backend': backend, 'records': size}
+                    repository.invalidate()
+                    #Как в view_tasks: проверка пустого раздела, затем первая страница
+                    result['first_page_cold_ms'], (page, cursor) = timed(lambda: repository.is_empty() or repository.page('due_date'), 1)
+                    result['first_page_cold_ms'] *= 1000
+                    repository.refresh()
+                    result['full_list_ms'] = timed(lambda: [pa.format_task(task) for task in sorted(repository.all(), key=lambda task: pa.to_date_key(task.due_date))], 1)[0] * 1000
+                    result['first_page_warm_ms'] = timed(lambda: [pa.format_task(task) for task in repository.page('due_date')[0]])[0] * 1000
+                    result['next_page_ms'] = timed(lambda: [pa.format_task(task) for task in repository.page('due_date', after=cursor)[0]])[0] * 1000
+                finally:
+                    connection = pa.sqlite_connections.pop(os.path.abspath(pa.SQLITE_FILE), None)
+                    if connection != None:
+                        connection.close()
+                    pa.STORAGE_BACKEND = backend_before
+                    pa.storages.clear()
+                    repository.invalidate()
+                    os.chdir(cwd)
+            results.append(result)
+            print_result(result)
+    return results
+
+#Открытие раздела финансов и задач в хранилищах journal и binary: время до первой записи (перечитывание снимка и журнала),
+#чтение 100 случайных записей, первый отчёт за год (для binary суммы считаются при первом обращении) и размер снимка.
+#JSON-снимок больше SNAPSHOT_JSON_LIMIT записей не строится: его запись и загрузка на таком объёме слишком долги.
+SNAPSHOT_JSON_LIMIT = 1000000
+SNAPSHOT_TOUCHED = 100
+
+def write_snapshot(backend, section, size):
+    if section == 'tasks':
+        records = make_task_records(size)
+        pa.get_storage(section).compact(records)
+        return
+    table = make_finance_table(size)
+    if backend == 'binary':
+        columns = {'id': table.ids[:size], 'amount': table.amounts[:size], 'date': table.dates[:size],
+                   'category': np.array(table.categories, object)[table.category_codes[:size]].tolist(), 'description': [''] * size}
+        pa.write_binary_snapshot(pa.get_storage(section).snapshot_file, section, columns)
+    else:
+        pa.get_storage(section).compact(table.to_dicts())
+
+def bench_snapshot_load(sizes):
+    results = []
+    cwd = os.getcwd()
+    for size in sizes:
+        for section in ['finance', 'tasks']:
+            for backend in ['journal', 'binary']:
+                if (backend == 'journal' or section == 'tasks') and size > SNAPSHOT_JSON_LIMIT:
+                    continue
+                with tempfile.TemporaryDirectory() as directory:
+                    os.chdir(directory)
+                    backend_before = pa.STORAGE_BACKEND
+                    pa.STORAGE_BACKEND = backend
+                    pa.storages.clear()
+                    repository = pa.repositories[section]
+                    try:
+                        write_snapshot(backend, section, size)
+                        result = {'section': section, 'backend': backend, 'records': size}
+                        result['snapshot_mb'] = os.path.getsize(pa.get_storage(section).snapshot_file) / 2 ** 20
+                        ids = random.Random(0).sample(range(1, size + 1), SNAPSHOT_TOUCHED)
+                        repository.invalidate()
+                        result['open_ms'] = timed(lambda: repository.get(1), 1)[0] * 1000
+                        result['touch_100_ms'] = timed(lambda: [repository.get(id) for id in ids], 1)[0] * 1000
+                        if section == 'finance':
+                            start, end = np.datetime64('2020-01-01'), np.datetime64('2020-12-31')
+                            result['first_report_ms'] = timed(lambda: repository.refresh().totals().period(start, end), 1)[0] * 1000
+                    finally:
+                        pa.STORAGE_BACKEND = backend_before
+                        pa.storages.clear()
+                        repository.invalidate()
+                        os.chdir(cwd)
+                results.append(result)
+                print_result(result)
+    return results
+
+#Память на объект и скорость загрузки/сохранения записей задач и финансов: прежние модели с __dict__ (тот же __init__ и to_dict,
+#но без __slots__) против моделей со __slots__. Загрузка - из словарей (JSON) именованными аргументами, как раньше,
+#и фабрикой раздела, а также прямо из столбцов (двоичный снимок); сохранение - to_dict на запись против столбцов.
+#Байты на объект - прирост памяти по tracemalloc при создании списка объектов (строки общие со словарями и не считаются).
+def plain_model(model):
+    return type(model.__name__, (), {'__init__': model.__init__, 'to_dict': model.to_dict})
+
+def traced_size(function):
+    tracemalloc.start()
+    try:
+        result = function()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return size, result
+
+#Репозиторий загружает раздел с приостановленным сборщиком мусора (PausedGC)
+def without_gc(function):
+    with pa.PausedGC():
+        return function()
+
+def bench_record_memory(sizes):
+    results = []
+    for size in sizes:
+        for section, factory in [('tasks', pa.dict_to_task), ('finance', pa.dict_to_finance_record)]:
+            records = make_task_records(size) if section == 'tasks' else make_finance_table(size).to_dicts()
+            model, names = pa.SECTION_MODELS[section], pa.SECTION_COLUMNS[section]
+            plain = plain_model(model)
+            columns = pa.records_to_columns(records, names)
+            result = {'section': section, 'records': size}
+            size_before, plain_objs = traced_size(lambda: [plain(**record) for record in records])
+            size_after, objs = traced_size(lambda: list(map(factory, records)))
+            result['bytes_before'] = size_before / size
+            result['bytes_after'] = size_after / size
+            result['load_before_ms'] = timed(lambda: [plain(**record) for record in records], 3)[0] * 1000
+            result['load_after_ms'] = timed(lambda: without_gc(lambda: list(map(factory, records))), 3)[0] * 1000
+            result['load_columns_ms'] = timed(lambda: without_gc(lambda: pa.objects_from_columns(model, columns)), 3)[0] * 1000
+            result['save_before_ms'] = timed(lambda: [obj.to_dict() for obj in plain_objs], 3)[0] * 1000
+            result['save_after_ms'] = timed(lambda: pa.objects_to_columns(objs, names), 3)[0] * 1000
+            del plain_objs, objs, records, columns
+            results.append(result)
+            print_result(result)
+    return results
+
+#Выгрузка финансовых записей: прежний путь (DataFrame из списка to_dict и to_csv) против потоковой выгрузки частями
+#в csv, csv.gz и parquet (если установлен pyarrow), затем дельта-выгрузки: первая (все записи и состояние)
+#и после изменения EXPORT_CHANGED_SHARE записей.
+EXPORT_CHANGED_SHARE = 0.01
+
+def bench_exports(sizes):
+    results = []
+    cwd = os.getcwd()
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            repository = pa.finance_records_repository
+            try:
+                pa.get_storage('finance').compact(make_finance_table(size).columns())
+                repository.invalidate()
+                repository.refresh()
+                result = {'records': size}
+                result['pandas_csv_ms'] = timed(lambda: pa.pd.DataFrame([record.to_dict() for record in repository.all()]).to_csv('pandas.csv', index=False), 1)[0] * 1000
+                formats = ['csv', 'csv.gz'] + (['parquet'] if pa.importlib.util.find_spec('pyarrow') != None else [])
+                for format in formats:
+                    filename = 'export' + pa.EXPORT_EXTENSIONS[format]
+                    result[f'{format}_ms'] = timed(lambda: pa.export_section('finance', filename, format), 1)[0] * 1000
+                    result[f'{format}_mb'] = os.path.getsize(filename) / 2 ** 20
+                format = formats[-1]
+                result['delta_first_ms'] = timed(lambda: pa.export_section('finance', 'delta' + pa.EXPORT_EXTENSIONS[format], format, delta=True), 1)[0] * 1000
+                ids = random.Random(0).sample(range(1, size + 1), int(size * EXPORT_CHANGED_SHARE))
+                changed = repository.find(ids)
+                for record in changed:
+                    record.amount += 1
+                repository.commit([('update', record) for record in changed])
+                result['delta_changed_ms'], (count, deleted, elapsed) = timed(lambda: pa.export_section('finance', 'delta' + pa.EXPORT_EXTENSIONS[format], format, delta=True), 1)
+                result['delta_changed_ms'] *= 1000
+                result['delta_rows'] = count
+            finally:
+                repository.invalidate()
+                os.chdir(cwd)
+        results.append(result)
+        print_result(result)
+    return results
+
+#Калькулятор: прежний путь (проверка символов и eval) против скомпилированных выражений - первая компиляция,
+#повтор из кэша и пакетное вычисление формулы с переменными: построчно через eval, построчно через Expression.evaluate
+#и одним вызовом над столбцами NumPy, а также время отказа на 9 ** 9 ** 9. Размер - число строк.
+CALC_FORMULA = '(a * 1.2 - b) / 3 + a ** 2 // 7'
+
+def eval_calculate(s):
+    if all(c in '0123456789+-/*(). ' for c in s):
+        return eval(s)
+
+#Время отказа на выражении с огромным результатом (без кэша); eval считал бы его бесконечно
+def rejected(source):
+    try:
+        pa.compile_expression.__wrapped__(source)
+    except pa.CalcError:
+        return True
+
+def bench_calculator(sizes):
+    results = []
+    rng = random.Random(0)
+    for size in sizes:
+        sources = [f'({rng.randint(1, 999)} + {rng.randint(1, 999)}) * {rng.randint(1, 99)} / 7 - {rng.randint(1, 99)} ** 2' for i in range(size)]
+        a, b = np.arange(size, dtype=np.float64), np.random.default_rng(0).random(size)
+        result = {'rows': size}
+        result['eval_ms'] = timed(lambda: [eval_calculate(s) for s in sources], 1)[0] * 1000
+        pa.compile_expression.cache_clear()
+        result['compile_ms'] = timed(lambda: [pa.compile_expression(s).evaluate() for s in sources], 1)[0] * 1000
+        cached = sources[-pa.CALC_CACHE_SIZE:]
+        result['cached_ms'] = timed(lambda: [pa.compile_expression(s).evaluate() for s in cached])[0] * 1000 * size / len(cached)
+        rows = list(zip(a.tolist(), b.tolist()))
+        result['formula_eval_ms'] = timed(lambda: [eval(CALC_FORMULA, {}, {'a': x, 'b': y}) for x, y in rows], 1)[0] * 1000
+        expression = pa.compile_expression(CALC_FORMULA)
+        result['formula_rows_ms'] = timed(lambda: [expression.evaluate({'a': x, 'b': y}) for x, y in rows], 1)[0] * 1000
+        result['formula_columns_ms'] = timed(lambda: expression.evaluate({'a': a, 'b': b}))[0] * 1000
+        result['guard_ms'] = timed(lambda: rejected('9 ** 9 ** 9'))[0] * 1000
+        results.append(result)
+        print_result(result)
+    return results
+
+#Набор замеров всех разделов в выбранном хранилище: запись снимка, загрузка (get_*), сохранение (save_*), get_free_id,
+#чтение по id, поиск (заметки - полнотекстовый, задачи - ближайшие, контакты - по началу имени и концу телефона,
+#финансы - записи за месяц; первый поиск строит индекс), импорт csv (до SUITE_IMPORT_LIMIT строк), выгрузка в csv
+#и отчёт за год для финансов (как get_finance_analysis: суммы, помесячно и файл с записями периода).
+SUITE_SECTIONS = ['notes', 'tasks', 'contacts', 'finance']
+SUITE_LOOKUPS = 1000
+SUITE_FREE_IDS = 100
+SUITE_IMPORT_LIMIT = 100000
+SUITE_GETTERS = {'notes': (pa.get_notes, pa.save_notes), 'tasks': (pa.get_tasks, pa.save_tasks),
+                 'contacts': (pa.get_contacts, pa.save_contacts), 'finance': (pa.get_finance_records, pa.save_finance_records)}
+
+def suite_search(section, repository):
+    if section == 'notes':
+        return repository.index().search('бюджет отпуск')
+    if section == 'tasks':
+        return repository.index().next(10)
+    if section == 'contacts':
+        index = repository.index()
+        return index.find_name_prefix('Ольга Соко', 20) + index.find_phone_suffix('4567', 20)
+    return repository.refresh().date_range_rows(np.datetime64('2020-03-01'), np.datetime64('2020-03-31'))
+
+def suite_report(repository):
+    start, end = np.datetime64('2020-01-01'), np.datetime64('2020-12-31')
+    table = repository.refresh()
+    totals = table.totals().period(start, end), table.totals().months_in_period(start, end)
+    pa.write_csv('report.csv', pa.SECTION_COLUMNS['finance'], zip(*table.columns(table.date_range_rows(start, end)).values()))
+    return totals
+
+def bench_sections(sizes, sections=SUITE_SECTIONS):
+    results = []
+    cwd = os.getcwd()
+    for size in sizes:
+        for section in sections:
+            with tempfile.TemporaryDirectory() as directory:
+                os.chdir(directory)
+                pa.storages.clear()
+                repository = pa.repositories[section]
+                get, save = SUITE_GETTERS[section]
+                try:
+                    result = {'section': section, 'backend': pa.STORAGE_BACKEND, 'records': size}
+                    result['generate_ms'], columns = timed(lambda: generate_columns(section, size), 1)
+                    result['generate_ms'] *= 1000
+                    result['write_ms'] = timed(lambda: pa.get_storage(section).compact(columns), 1)[0] * 1000
+                    del columns
+                    repository.invalidate()
+                    result['load_ms'], objs = timed(get, 1)
+                    result['load_ms'] *= 1000
+                    result['save_ms'] = timed(lambda: save(objs), 1)[0] * 1000
+                    del objs
+                    result['free_id_ms'] = timed(lambda: [pa.get_free_id(section) for i in range(SUITE_FREE_IDS)], 1)[0] * 1000 / SUITE_FREE_IDS
+                    ids = random.Random(0).sample(range(1, size + 1), min(size, SUITE_LOOKUPS))
+                    result['lookup_ms'] = timed(lambda: [repository.get(id) for id in ids], 1)[0] * 1000 / len(ids)
+                    result['search_first_ms'] = timed(lambda: suite_search(section, repository), 1)[0] * 1000
+                    result['search_ms'] = timed(lambda: suite_search(section, repository))[0] * 1000
+                    imported = generate_columns(section, min(size, SUITE_IMPORT_LIMIT), seed=1)
+                    pa.write_csv('import.csv', list(imported), zip(*imported.values()))
+                    result['import_ms'], (count, rejected, elapsed) = timed(lambda: pa.import_csv(section, 'import.csv'), 1)
+                    result['import_ms'] *= 1000
+                    result['imported'] = count
+                    result['export_ms'] = timed(lambda: pa.export_section(section, 'export.csv'), 1)[0] * 1000
+                    if section == 'finance':
+                        result['report_ms'] = timed(lambda: suite_report(repository))[0] * 1000
+                finally:
+                    connection = pa.sqlite_connections.pop(os.path.abspath(pa.SQLITE_FILE), None)
+                    if connection != None:
+                        connection.close()
+                    pa.storages.clear()
+                    repository.invalidate()
+                    os.chdir(cwd)
+            results.append(result)
+            print_result(result)
+    return results
+
+#Разбор и проверка csv задач и финансов при импорте (без записи): прежний разбор одним pd.read_csv и разбор частями
+#по IMPORT_CHUNK_BYTES в 1, 2, 4... процессах до числа ядер. Размер - число строк.
+def parse_import(section, filename, workers):
+    workers_before, min_size_before = pa.IMPORT_WORKERS, pa.IMPORT_PARALLEL_MIN_SIZE
+    pa.IMPORT_WORKERS, pa.IMPORT_PARALLEL_MIN_SIZE = workers, 0
+    try:
+        return sum(len(chunk) for chunk, rejected in pa.parse_import_chunks(section, filename, pa.IMPORT_CHUNK_BYTES))
+    finally:
+        pa.IMPORT_WORKERS, pa.IMPORT_PARALLEL_MIN_SIZE = workers_before, min_size_before
+
+def bench_import_parsing(sizes):
+    results = []
+    counts = [1 << i for i in range((os.cpu_count() or 1).bit_length()) if 1 << i < (os.cpu_count() or 1)] + [os.cpu_count() or 1]
+    for size in sizes:
+        for section in ['tasks', 'finance']:
+            with tempfile.TemporaryDirectory() as directory:
+                filename = os.path.join(directory, 'import.csv')
+                columns = generate_columns(section, size)
+                pa.write_csv(filename, list(columns), zip(*columns.values()))
+                del columns
+                result = {'section': section, 'records': size, 'file_mb': os.path.getsize(filename) / 2 ** 20}
+                result['single_ms'] = timed(lambda: pa.validate_import_frame(section, pa.read_import_csv(filename)), 1)[0] * 1000
+                for workers in counts:
+                    result[f'workers_{workers}_ms'] = timed(lambda: parse_import(section, filename, workers), 1)[0] * 1000
+            results.append(result)
+            print_result(result)
+    return results
+
+#Разбор дат ДД-ММ-ГГГГ: прежний построчный strptime против date_ordinal без кэша и с кэшем (даты повторяются - 10 лет дней),
+#проверка столбца импорта: прежний pd.to_datetime против date_column_ordinals. Размер - число дат.
+def strptime_ordinal(date):
+    try:
+        return dt.strptime(date, '%d-%m-%Y').toordinal()
+    except (TypeError, ValueError):
+        return None
+
+def bench_dates(sizes):
+    results = []
+    for size in sizes:
+        dates = generate_columns('finance', size)['date']
+        result = {'rows': size}
+        result['strptime_ms'] = timed(lambda: [strptime_ordinal(date) for date in dates], 1)[0] * 1000
+        parse = pa.date_ordinal.__wrapped__
+        result['parser_ms'] = timed(lambda: [parse(date) for date in dates], 1)[0] * 1000
+        pa.date_ordinal.cache_clear()
+        result['cached_ms'] = timed(lambda: [pa.date_ordinal(date) for date in dates], 1)[0] * 1000
+        column = pa.pd.Series(dates)
+        result['pandas_column_ms'] = timed(lambda: pa.pd.to_datetime(column, format='%d-%m-%Y', errors='coerce').notna(), 1)[0] * 1000
+        result['column_ms'] = timed(lambda: pa.date_column_ordinals(column.to_numpy()) > 0)[0] * 1000
+        results.append(result)
+        print_result(result)
+    return results
+
+def print_result(result):
+    print('; '.join(f'{key}: {value:.2f}' if isinstance(value, float) else f'{key}: {value}' for key, value in result.items()))
+
+BENCHMARKS = {
+    'finance_reports': (bench_finance_reports, [10000, 1000000, 10000000]),
+    'http_api': (bench_http_api, [1, 16, 64]),
+    'concurrent_writers': (bench_concurrent_writers, [2, 4, 8]),
+    'storage_backends': (bench_storage_backends, [10000, 100000, 1000000]),
+    'list_pages': (bench_list_pages, [10000, 100000, 1000000]),
+    'snapshot_load': (bench_snapshot_load, [100000, 1000000, 10000000]),
+    'record_memory': (bench_record_memory, [100000, 1000000]),
+    'exports': (bench_exports, [100000, 1000000]),
+    'calculator': (bench_calculator, [1000, 100000, 1000000]),
+    'sections': (bench_sections, [1000, 100000, 1000000]),
+    'import_parsing': (bench_import_parsing, [100000, 1000000]),
+    'dates': (bench_dates, [10000, 1000000])
+}
+
+#Поля, по которым строки результатов сопоставляются при сравнении; замеры времени - поля с окончанием _ms
+RESULT_KEYS = ['section', 'backend', 'format', 'records', 'rows', 'clients', 'writers']
+#Замер считается регрессией, если стал медленнее в COMPARE_THRESHOLD раз и не меньше чем на COMPARE_MIN_MS (шум коротких замеров)
+COMPARE_THRESHOLD = 1.2
+COMPARE_MIN_MS = 1.0
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def result_key(result):
+    return tuple((key, result[key]) for key in RESULT_KEYS if key in result)
+
+def compare_results(previous, current):
+    before = {result_key(result): result for result in previous['results']}
+    slower = 0
+    for result in current['results']:
+        old = before.get(result_key(result))
+        if old == None:
+            continue
+        for key, value in result.items():
+            if key.endswith('_ms') and old.get(key) and value > old[key] * COMPARE_THRESHOLD and value - old[key] >= COMPARE_MIN_MS:
+                print(f'Медленнее: {dict(result_key(result))} {key}: {old[key]:.2f} -> {value:.2f} ({value / old[key]:.2f}x)')
+                slower += 1
+    print(f'Сравнение с {previous.get("commit")}: замедлилось замеров - {slower}')
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('name', nargs='?', default='sections', choices=list(BENCHMARKS))
+    parser.add_argument('sizes', nargs='*', type=int)
+    parser.add_argument('--backend', choices=list(pa.STORAGE_BACKENDS), default=pa.STORAGE_BACKEND)
+    parser.add_argument('--output')
+    parser.add_argument('--compare')
+    args = parser.parse_args(argv)
+    benchmark, default_sizes = BENCHMARKS[args.name]
+    sizes = args.sizes or default_sizes
+    pa.STORAGE_BACKEND = args.backend
+    report = {'benchmark': args.name, 'sizes': sizes, 'backend': args.backend, 'commit': git_commit(),
+              'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+              'started': dt.now().isoformat(timespec='seconds')}
+    report['results'] = benchmark(sizes)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, ensure_ascii=False, indent=1)
+    if args.compare:
+        with open(args.compare) as file:
+            compare_results(json.load(file), report)
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,59 @@
-import pandas as pd
+import time
+STARTUP_TIME = time.perf_counter()
+import sys
+import io
+import csv
+import gzip
 import json
 import os
+import re
+import gc
+import math
+import mmap
+import heapq
+import atexit
+import importlib
+import importlib.util
+from bisect import bisect_left, bisect_right, insort
+from operator import attrgetter, itemgetter
+from functools import lru_cache, wraps
 from datetime import datetime as dt
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
 
 #Ссылка на GitHub >> https://github.com/ge-kon/personal_assistant
 
+#pandas и numpy загружаются при первом обращении (импорт csv, финансы), а не при запуске
+class LazyModule:
+    def __init__(self, name: str, alias: str):
+        self.name = name
+        self.alias = alias
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.name)
+        #Дальше имя в модуле указывает на саму библиотеку, без обращений к заглушке
+        globals()[self.alias] = module
+        return getattr(module, attr)
+
+pd = LazyModule('pandas', 'pd')
+np = LazyModule('numpy', 'np')
+argparse = LazyModule('argparse', 'argparse')
+asyncio = LazyModule('asyncio', 'asyncio')
+urllib_parse = LazyModule('urllib.parse', 'urllib_parse')
+sqlite3 = LazyModule('sqlite3', 'sqlite3')
+pyarrow = LazyModule('pyarrow', 'pyarrow')
+pyarrow_parquet = LazyModule('pyarrow.parquet', 'pyarrow_parquet')
+concurrent_futures = LazyModule('concurrent.futures', 'concurrent_futures')
+cProfile = LazyModule('cProfile', 'cProfile')
+pstats = LazyModule('pstats', 'pstats')
+tracemalloc = LazyModule('tracemalloc', 'tracemalloc')
+
 NOTES_FILE = 'notes.json'
 NOTES_EXPORT_FILE = 'notes_export.csv'
 TASKS_FILE = 'tasks.json'
@@ -13,13 +62,72 @@ CONTACTS_FILE = 'contacts.json'
 CONTACTS_EXPORT_FILE = 'contacts_export.csv'
 FINANCE_FILE = 'finance.json'
 FINANCE_EXPORT_FILE = 'finance_export.csv'
+STARTUP_PROFILE = '--startup-profile' in sys.argv
+#Инструментирование (включается флагами запуска --stats, --profile <действие>, --trace-memory <действие>):
+#счётчики и время действий меню, чтения/записи хранилищ, импорта и выгрузки сбрасываются в STATS_FILE не чаще раза в STATS_INTERVAL секунд и при выходе
+STATS_FILE = 'stats.json'
+STATS_INTERVAL = 60
+PROFILE_TOP = 20
+SECTION_FILES = {'notes': NOTES_FILE, 'tasks': TASKS_FILE, 'contacts': CONTACTS_FILE, 'finance': FINANCE_FILE}
+#journal - JSON-снимок и журнал операций, json - только JSON-снимок, sqlite - база SQLITE_FILE (перенос данных: migrate --to sqlite),
+#binary - двоичный снимок <файл раздела>.bin, открываемый через mmap, и журнал операций (перенос: migrate --to binary)
+STORAGE_BACKEND = 'journal'
+JOURNAL_SUFFIX = '.log'
+BINARY_SUFFIX = '.bin'
+JOURNAL_COMPACT_MIN_SIZE = 64 * 1024
+LOCK_SUFFIX = '.lock'
+SQLITE_FILE = 'assistant.db'
+#Индексы таблиц SQLite; столбцы *_key вычисляются из полей записи (см. SQLITE_KEY_COLUMNS)
+SQLITE_INDEXES = {
+    'notes': ['timestamp_key'],
+    'tasks': ['due_date_key', 'priority', 'done'],
+    'contacts': ['name_key', 'phone_key', 'phone_suffix_key', 'email_key'],
+    'finance': ['date_key', 'category']
+}
+SEQUENCES_FILE = 'sequences.json'
+IMPORT_STREAM_MIN_SIZE = 64 * 1024 * 1024
+#Импорт csv делится на части по IMPORT_CHUNK_BYTES байт (по границам строк вне кавычек), части разбираются и проверяются
+#в IMPORT_WORKERS процессах (0 - по числу ядер); файлы меньше IMPORT_PARALLEL_MIN_SIZE разбираются в текущем процессе
+IMPORT_CHUNK_BYTES = 16 * 1024 * 1024
+IMPORT_WORKERS = 0
+IMPORT_PARALLEL_MIN_SIZE = 16 * 1024 * 1024
+IMPORT_PROGRESS_SUFFIX = '.import'
+INDEX_SUFFIX = '.idx'
+#Формат выгрузки export: auto - parquet, если установлен pyarrow, иначе csv.gz; также csv, csv.gz, parquet
+EXPORT_FORMAT = 'auto'
+EXPORT_CHUNK_SIZE = 100000
+EXPORT_STATE_SUFFIX = '.export'
+NOTE_TITLE_WEIGHT = 2
+NOTE_SEARCH_LIMIT = 10
+BM25_K1 = 1.5
+BM25_B = 0.75
+BATCH_COMMIT_SIZE = 1000
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+SERVER_FLUSH_INTERVAL = 0
+SERVER_LIST_LIMIT = 100
+PRIORITIES = ['Высокий', 'Средний', 'Низкий']
+#Калькулятор: предельная длина выражения, размер целых чисел в битах (ограничивают и время вычисления) и число скомпилированных выражений в кэше
+CALC_MAX_LENGTH = 1000
+CALC_MAX_INT_BITS = 10000
+CALC_CACHE_SIZE = 1024
+#Число разобранных дат ДД-ММ-ГГГГ в кэше date_ordinal (65536 - около 180 лет разных дней)
+DATE_CACHE_SIZE = 65536
+LIST_PAGE_SIZE = 20
+SECTION_COLUMNS = {
+    'notes': ['id', 'title', 'content', 'timestamp'],
+    'tasks': ['id', 'title', 'description', 'done', 'priority', 'due_date'],
+    'contacts': ['id', 'name', 'phone', 'email'],
+    'finance': ['id', 'amount', 'category', 'description', 'date']
+}
 MENU = {
     'main': ['1. Управление заметками', '2. Управление задачами', '3. Управление контактами', 
              '4. Управление финансовыми записями', '5. Калькулятор', '6. Выход'],
     'notes': ['1. Создание новой заметки', '2. Просмотр списка заметок', '3. Просмотр подробностей заметки', '4. Редактирование заметки', 
-              '5. Удаление заметки', '6. Импорт заметок в формате csv', '7. Экспорт заметок в формате csv', '8. Выход в главное меню'],
+              '5. Удаление заметки', '6. Импорт заметок в формате csv', '7. Экспорт заметок в формате csv', '8. Поиск заметок', '9. Выход в главное меню'],
     'tasks': ['1. Добавление новой задачи', '2. Просмотр списка задач', '3. Отметка задачи как выполненной', '4. Редактирование задачи', 
-              '5. Удаление задачи', '6. Импорт заметок в формате csv', '7. Экспорт заметок в формате csv', '8. Выход в главное меню'],
+              '5. Удаление задачи', '6. Импорт заметок в формате csv', '7. Экспорт заметок в формате csv', '8. Ближайшие задачи',
+              '9. Просроченные задачи', '10. Задачи на ближайшие дни', '11. Выход в главное меню'],
     'contacts': ['1. Добавление нового контакта', '2. Просмотр списка контактов', '3. Поиск контакта (по имени или телефону)', '4. Редактирование контакта', 
                  '5. Удаление контакта', '6. Импорт заметок в формате csv', '7. Экспорт заметок в формате csv', '8. Выход в главное меню'],
     'finance': ['1. Добавление новой финансовой записи (доход или расход)', '2. Просмотр всех записей с возможностью фильтрации по дате или категории', 
@@ -31,6 +139,8 @@ def interaction(sections):
     print('\nВыберите действие:')
     for i in sections:
         print(i)
+    if STARTUP_PROFILE:
+        print_startup_profile()
 
     while True:
         try:
@@ -42,32 +152,1573 @@ def interaction(sections):
         except Exception as e:
             print(f'Ошибка: {e}')
 
+def print_startup_profile():
+    global STARTUP_PROFILE
+    STARTUP_PROFILE = False
+    print(f'[профиль запуска] загрузка модуля: {(MODULE_LOADED_TIME - STARTUP_TIME) * 1000:.1f} мс, '
+          f'первое меню: {(time.perf_counter() - STARTUP_TIME) * 1000:.1f} мс, '
+          f'pandas: {"загружен" if "pandas" in sys.modules else "не загружен"}, numpy: {"загружен" if "numpy" in sys.modules else "не загружен"}')
+
+def write_csv(filename, columns, rows):
+    with open(filename, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(columns)
+        writer.writerows(rows)
+
 def get_free_id(section):
-    ids = []
-    filename = ''
-    if section == 'notes':
-        filename = NOTES_FILE
-    elif section == 'tasks':
-         filename = TASKS_FILE
-    elif section == 'contacts':
-        filename = CONTACTS_FILE
-    elif section == 'finance':
-        filename = FINANCE_FILE
+    return repositories[section].sequence.next()
+
+def read_json(filename, default):
+    if not os.path.exists(filename):
+        return default
+    with open(filename, 'r') as file:
+        return json.load(file)
+
+def write_json(filename, data):
+    write_file_atomic(filename, json.dumps(data))
 
-    if os.path.exists(filename):
-        with open(filename, 'r') as file:
-            ids = [unit['id'] for unit in json.load(file)]
-    return max(ids) + 1 if len(ids) > 0 else 1
+#Запись через временный файл и os.replace: читатели и другие процессы видят либо старый файл, либо новый целиком.
+#data - строка или список байтовых блоков (bytes, массивы NumPy)
+def write_file_atomic(filename, data):
+    temp = f'{filename}.{os.getpid()}.tmp'
+    try:
+        with open(temp, 'w' if isinstance(data, str) else 'wb') as file:
+            if isinstance(data, str):
+                file.write(data)
+            else:
+                file.writelines(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, filename)
+    except Exception:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+#Записи раздела столбцами {поле: список значений}: при сохранении и загрузке не нужен словарь на каждую запись.
+#compact любого хранилища принимает и список записей-словарей, и столбцы. Столбец собирается одним map по всем записям.
+def records_to_columns(records, names):
+    records = list(records)
+    return {name: list(map(itemgetter(name), records)) for name in names}
+
+def objects_to_columns(objs, names):
+    objs = list(objs)
+    return {name: list(map(attrgetter(name), objs)) for name in names}
+
+def columns_to_records(columns):
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+#Импорт csv прежних версий сохранял NaN вместо пустого текста: текстовые поля из файлов приводятся к строке
+def to_text(value):
+    if type(value) == str:
+        return value
+    if value == None or value != value:
+        return ''
+    return str(value)
+
+#Объекты модели прямо из столбцов: __slots__ моделей перечислены в порядке параметров __init__
+def objects_from_columns(model, columns):
+    return list(map(model, *(columns[name] for name in model.__slots__)))
+
+#Массовое создание объектов без циклических ссылок впустую запускает сборщик мусора много раз подряд:
+#на время загрузки раздела он приостанавливается
+class PausedGC:
+    def __enter__(self):
+        self.enabled = gc.isenabled()
+        gc.disable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.enabled:
+            gc.enable()
+
+#Даты ДД-ММ-ГГГГ: на диске остаются строками, в памяти и в сравнениях используется порядковый номер дня (date.toordinal).
+#Допускаются те же строки, что и у strptime('%d-%m-%Y'): день и месяц из одной или двух цифр, день с ведущим пробелом, год из четырёх цифр.
+UNIX_EPOCH_ORDINAL = 719163
+MONTH_DAYS = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
 
 def validate_date(date):
+    return date_ordinal(date) != None
+
+#Порядковый номер дня ДД-ММ-ГГГГ (None для пустой или некорректной даты); повторяющиеся строки берутся из кэша
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def date_ordinal(date):
+    if type(date) != str:
+        return None
+    if len(date) == 10 and date[2] == '-' and date[5] == '-':
+        day, month, year = date[0:2], date[3:5], date[6:10]
+    else:
+        parts = date.split('-')
+        if len(parts) != 3 or not (1 <= len(parts[0]) <= 2 and 1 <= len(parts[1]) <= 2 and len(parts[2]) == 4):
+            return None
+        day, month, year = parts
+    if day[0] == ' ':
+        day = day[1:]
+    if not (day.isascii() and day.isdecimal() and month.isascii() and month.isdecimal() and year.isdecimal()):
+        return None
+    day, month, year = int(day), int(month), int(year)
+    if year < 1 or not 1 <= month <= 12 or day < 1 or day > MONTH_DAYS[month] + (month == 2 and is_leap_year(year)):
+        return None
+    return dt(year, month, day).toordinal()
+
+def is_leap_year(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+#Порядковые номера дней для целого столбца дат (0 для некорректных): строки вида ДД-ММ-ГГГГ разбираются
+#арифметикой над кодами символов, остальные (без ведущих нулей, с пробелом, не-ASCII цифры) - через date_ordinal
+def date_column_ordinals(dates):
+    text = np.asarray(dates, dtype=str)
+    ordinals = np.zeros(len(text), np.int64)
+    if len(text) == 0:
+        return ordinals
+    full = (np.char.str_len(text) == 10).nonzero()[0]
+    chars = text[full].astype('U10').view(np.uint32).reshape(-1, 10).astype(np.int64) - ord('0')
+    digits = chars[:, [0, 1, 3, 4, 6, 7, 8, 9]]
+    simple = (chars[:, 2] == ord('-') - ord('0')) & (chars[:, 5] == ord('-') - ord('0')) & ((digits >= 0) & (digits <= 9)).all(axis=1)
+    day = chars[:, 0] * 10 + chars[:, 1]
+    month = chars[:, 3] * 10 + chars[:, 4]
+    year = chars[:, 6] * 1000 + chars[:, 7] * 100 + chars[:, 8] * 10 + chars[:, 9]
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    valid = simple & (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1)
+    valid &= day <= np.array(MONTH_DAYS)[np.where(valid, month, 0)] + (leap & (month == 2))
+    #Число дней от 1970-01-01 по григорианскому календарю (годы считаются с марта, чтобы февраль был последним месяцем)
+    shifted = year - (month <= 2)
+    era = shifted // 400
+    year_of_era = shifted - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    days = era * 146097 + year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year - 719468
+    ordinals[full[valid]] = days[valid] + UNIX_EPOCH_ORDINAL
+    rest = np.ones(len(text), bool)
+    rest[full[simple]] = False
+    for i in rest.nonzero()[0].tolist():
+        ordinals[i] = date_ordinal(str(text[i])) or 0
+    return ordinals
+
+def ordinals_to_dates(ordinals):
+    return (np.asarray(ordinals, np.int64) - UNIX_EPOCH_ORDINAL).astype('datetime64[D]')
+
+def priority_rank(priority):
+    return PRIORITIES.index(priority) if priority in PRIORITIES else len(PRIORITIES)
+
+
+#Межпроцессная блокировка записи на файле <имя>.lock: fcntl.flock в Unix, msvcrt.locking в Windows, иначе без блокировки.
+#Блокируются только записи, чтение идёт без неё. Повторный захват в том же процессе не блокирует.
+class FileLock:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file = None
+        self.depth = 0
+
+    def __enter__(self):
+        if self.depth == 0:
+            self.file = open(self.filename, 'a+b')
+            try:
+                if fcntl != None:
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+                elif msvcrt != None:
+                    self.file.seek(0)
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+            except Exception:
+                self.file.close()
+                raise
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl != None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt != None:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            self.file.close()
+            self.file = None
+
+#Запись изменилась в другом процессе после того, как её прочитали
+class ConflictError(Exception):
+    pass
+
+
+#Хранилище: снимок (обычный JSON-файл раздела) + журнал операций (по одной JSON-строке на операцию).
+#Все изменения файлов делаются под lock; снимок заменяется атомарно, поэтому чтение блокировки не требует.
+class JsonStorage:
+    #Большую пачку дешевле записать новым снимком, чем операциями (см. Repository.commit)
+    rewrite_large_batches = True
+    #Умеет ли хранилище само отдавать страницы списка и отвечать на запросы по индексам (см. Repository.queries_storage)
+    indexed_queries = False
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.snapshot_file = filename
+        self.lock = FileLock(filename + LOCK_SUFFIX)
+
+    def load(self):
+        return self.load_snapshot()
+
+    def load_snapshot(self):
+        if not os.path.exists(self.snapshot_file):
+            return {}
+        with open(self.snapshot_file, 'r') as file:
+            return {record['id']: record for record in json.load(file)}
+
+    def files(self):
+        return [self.snapshot_file]
+
+    #Отметка состояния хранилища: меняется при любой записи (в том числе из другого процесса)
+    def stamp(self):
+        stamp = []
+        for filename in self.files():
+            try:
+                stat = os.stat(filename)
+                stamp.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    #read возвращает записи и позицию в журнале, до которой они прочитаны; read_tail - операции журнала после позиции
+    #(None, если хранилище дочитывать не умеет). repair и end нужны писателю под блокировкой.
+    def read(self):
+        return self.load(), 0
+
+    #Для полного перечитывания репозиторием: записи снимка, операции журнала после него и позиция в журнале.
+    #Двоичное хранилище отдаёт сам снимок (BinarySnapshot), чтобы объекты создавались только для затронутых записей.
+    def read_snapshot(self):
+        records, position = self.read()
+        return records.values(), [], position
+
+    def read_tail(self, position):
+        return None
+
+    def repair(self):
+        pass
+
+    def end(self):
+        return 0
+
+    #snapshot - необязательная функция, возвращающая все записи после операций (если они уже есть в памяти)
+    def apply(self, ops, snapshot=None, compact=True):
+        if snapshot != None:
+            self.compact(snapshot())
+            return
+        records = self.load()
+        for op in ops:
+            apply_op(records, op)
+        self.compact(records.values())
+
+    def insert(self, record):
+        self.apply([{'op': 'insert', 'data': record}])
+
+    def update(self, record):
+        self.apply([{'op': 'update', 'data': record}])
+
+    def delete(self, id):
+        self.apply([{'op': 'delete', 'id': id}])
+
+    def compact(self, records):
+        if isinstance(records, dict):
+            records = columns_to_records(records)
+        #json.dumps работает через C-кодировщик, json.dump в файл - построчно на чистом Python
+        write_file_atomic(self.snapshot_file, json.dumps(list(records)))
+
+
+class JournalStorage(JsonStorage):
+    def __init__(self, filename: str):
+        super().__init__(filename)
+        self.journal = filename + JOURNAL_SUFFIX
+        #(inode, размер) журнала, до которого он проверен этим процессом
+        self.verified = None
+
+    def files(self):
+        return [self.snapshot_file, self.journal]
+
+    #Операции журнала с позиции start вместе с позицией после каждой из них.
+    #Строка без перевода строки в конце (её ещё дописывают или запись прервал сбой) или с некорректным JSON останавливает чтение.
+    def journal_ops(self, start=0):
+        try:
+            file = open(self.journal, 'rb')
+        except FileNotFoundError:
+            return
+        with file:
+            file.seek(start)
+            offset = start
+            for line in file:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError
+                    op = json.loads(line)
+                except ValueError:
+                    return
+                offset += len(line)
+                yield op, offset
+
+    def read(self):
+        records = self.load_snapshot()
+        position = 0
+        for op, position in self.journal_ops():
+            apply_op(records, op)
+        return records, position
+
+    def load(self):
+        return self.read()[0]
+
+    def read_tail(self, position):
+        ops = []
+        for op, position in self.journal_ops(position):
+            ops.append(op)
+        return ops, position
+
+    #Недописанная строка после сбоя писателя - операция не зафиксирована, обрезаем её перед дозаписью.
+    #Вызывается под блокировкой; уже проверенная часть журнала повторно не читается.
+    def repair(self):
+        try:
+            stat = os.stat(self.journal)
+        except FileNotFoundError:
+            return
+        start = self.verified[1] if self.verified != None and self.verified[0] == stat.st_ino and self.verified[1] <= stat.st_size else 0
+        end = start
+        for op, end in self.journal_ops(start):
+            pass
+        if end < stat.st_size:
+            with open(self.journal, 'r+b') as broken:
+                broken.truncate(end)
+        self.verified = (stat.st_ino, end)
+
+    def end(self):
+        try:
+            stat = os.stat(self.journal)
+        except FileNotFoundError:
+            return 0
+        self.verified = (stat.st_ino, stat.st_size)
+        return stat.st_size
+
+    def apply(self, ops, snapshot=None, compact=True):
+        if len(ops) == 0:
+            return
+        op = ops[0] if len(ops) == 1 else {'op': 'batch', 'ops': ops}
+        line = json.dumps(op) + '\n'
+        if snapshot != None and self.needs_compaction(len(line)):
+            #Записи уже в памяти: сразу пишем новый снимок, не раздувая журнал и не перечитывая его
+            self.compact(snapshot())
+            return
+        self.repair()
+        with open(self.journal, 'a') as file:
+            file.write(line)
+        if compact and self.needs_compaction():
+            self.compact(self.load().values())
+
+    def compact(self, records):
+        super().compact(records)
+        if os.path.exists(self.journal):
+            os.remove(self.journal)
+
+    def needs_compaction(self, extra=0):
+        journal_size = os.path.getsize(self.journal) if os.path.exists(self.journal) else 0
+        snapshot_size = os.path.getsize(self.snapshot_file) if os.path.exists(self.snapshot_file) else 0
+        return journal_size + extra > max(JOURNAL_COMPACT_MIN_SIZE, snapshot_size)
+
+
+def apply_op(records, op):
+    if op['op'] in ('insert', 'update'):
+        records[op['data']['id']] = op['data']
+    elif op['op'] == 'delete':
+        records.pop(op['id'], None)
+    elif op['op'] == 'batch':
+        for sub_op in op['ops']:
+            apply_op(records, sub_op)
+
+
+#Двоичный снимок раздела: заголовок JSON, затем столбцы фиксированной ширины (id, суммы, флаги, даты - днями, категории - кодами)
+#и для текстовых столбцов - смещения и длины в общей куче байтов. Строки упорядочены по id, запись ищется бинарным поиском.
+#Файл отображается в память целиком, но с диска читаются только страницы, к которым обращаются.
+BINARY_MAGIC = b'PASNAP1\n'
+BINARY_COLUMN_TYPES = {'id': 'int64', 'amount': 'float64', 'done': 'bool', 'due_date': 'date', 'date': 'date', 'priority': 'code', 'category': 'code'}
+BINARY_CHUNK_SIZE = 100000
+
+#columns - столбцы раздела (SECTION_COLUMNS): списки значений в формате to_dict или массивы NumPy (даты - datetime64)
+def write_binary_snapshot(filename, section, columns):
+    ids = np.asarray(columns['id'], np.int64)
+    order = None
+    if len(ids) > 1 and not (ids[1:] > ids[:-1]).all():
+        order = np.argsort(ids, kind='stable').tolist()
+    header = {'section': section, 'count': len(ids), 'columns': {}}
+    parts, size = [], 0
+    for column in SECTION_COLUMNS[section]:
+        values = columns[column]
+        if order != None:
+            values = values[order] if isinstance(values, np.ndarray) else [values[i] for i in order]
+        kind = BINARY_COLUMN_TYPES.get(column, 'text')
+        info = {'type': kind}
+        if kind == 'date' and isinstance(values, np.ndarray) and values.dtype.kind == 'M':
+            arrays = {'data': values.astype('datetime64[D]')}
+        elif kind == 'date':
+            arrays = {'data': np.full(len(values), np.datetime64('NaT'), 'datetime64[D]')}
+            values = list(map(to_text, values))
+            filled = [i for i, value in enumerate(values) if value]
+            if len(filled) > 0:
+                arrays['data'][filled] = finance_table_dates([values[i] for i in filled])
+        elif kind == 'code':
+            codes = {}
+            arrays = {'data': np.fromiter((codes.setdefault(to_text(value), len(codes)) for value in values), np.int32, len(values))}
+            info['values'] = list(codes)
+        elif kind == 'text':
+            encoded = [to_text(value).encode('utf-8') for value in values]
+            lengths = np.fromiter(map(len, encoded), np.int32, len(encoded))
+            arrays = {'offsets': np.cumsum(lengths, dtype=np.int64) - lengths, 'lengths': lengths, 'heap': np.frombuffer(b''.join(encoded), np.uint8)}
+        else:
+            arrays = {'data': np.asarray(values, kind)}
+        for part, array in arrays.items():
+            #Каждый массив выровнен по 8 байтам, чтобы его можно было читать из отображения без копирования
+            info[part] = [size, array.dtype.str, len(array)]
+            padding = -array.nbytes % 8
+            parts += [array, bytes(padding)]
+            size += array.nbytes + padding
+        header['columns'][column] = info
+    encoded_header = json.dumps(header).encode('utf-8')
+    prefix = BINARY_MAGIC + len(encoded_header).to_bytes(8, 'little') + encoded_header
+    write_file_atomic(filename, [prefix, bytes(-len(prefix) % 8)] + parts)
+
+#Снимок открывается как словарь id -> запись (в формате to_dict), записи декодируются при обращении.
+#Отображение ACCESS_COPY: массивы столбцов можно менять в памяти (изменения в файл не попадают, копируются только изменённые страницы).
+#Замена файла снимка (os.replace при сжатии журнала) уже открытое отображение не затрагивает.
+class BinarySnapshot:
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        if self.buffer[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+            raise ValueError(f'{filename} не является двоичным снимком')
+        size = int.from_bytes(self.buffer[len(BINARY_MAGIC):len(BINARY_MAGIC) + 8], 'little')
+        start = len(BINARY_MAGIC) + 8
+        self.header = json.loads(self.buffer[start:start + size])
+        self.start = start + size + (-(start + size) % 8)
+        self.columns = self.header['columns']
+        self.count = self.header['count']
+        self.arrays = {}
+        self.ids = self.array('id')
+
+    def array(self, column, part='data'):
+        if (column, part) not in self.arrays:
+            offset, dtype, count = self.columns[column][part]
+            if count == 0:
+                self.arrays[column, part] = np.zeros(0, dtype)
+            else:
+                self.arrays[column, part] = np.frombuffer(self.buffer, dtype, count, self.start + offset)
+        return self.arrays[column, part]
+
+    def __len__(self):
+        return self.count
+
+    def row(self, id):
+        position = int(np.searchsorted(self.ids, id))
+        if position < self.count and self.ids[position] == id:
+            return position
+        return None
+
+    #Значения столбца для массива строк в формате to_dict
+    def values(self, column, rows):
+        info = self.columns[column]
+        if info['type'] == 'text':
+            heap = self.array(column, 'heap')
+            offsets, lengths = self.array(column, 'offsets')[rows].tolist(), self.array(column, 'lengths')[rows].tolist()
+            return [bytes(heap[offset:offset + length]).decode('utf-8') for offset, length in zip(offsets, lengths)]
+        data = self.array(column)[rows]
+        if info['type'] == 'code':
+            return [info['values'][code] for code in data.tolist()]
+        if info['type'] == 'date':
+            text = np.full(len(data), '', 'U10')
+            filled = ~np.isnat(data)
+            text[filled] = format_finance_dates(data[filled])
+            return text.tolist()
+        return data.tolist()
+
+    def column_lists(self, rows):
+        rows = np.asarray(rows, np.int64)
+        return {column: self.values(column, rows) for column in self.columns}
+
+    def records(self, rows):
+        return columns_to_records(self.column_lists(rows))
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        for start in range(0, self.count, BINARY_CHUNK_SIZE):
+            rows = np.arange(start, min(start + BINARY_CHUNK_SIZE, self.count))
+            yield from zip(self.ids[rows].tolist(), self.records(rows))
+
+    def __contains__(self, id):
+        return self.row(id) != None
+
+    def get(self, id, default=None):
+        row = self.row(id)
+        return default if row == None else self.records([row])[0]
+
+    def __getitem__(self, id):
+        row = self.row(id)
+        if row == None:
+            raise KeyError(id)
+        return self.records([row])[0]
+
+
+#Хранилище binary: журнал операций как у journal, снимок - двоичный файл <файл раздела>.bin (см. BinarySnapshot).
+#Открытие раздела не читает записи: объекты создаются при обращении, финансовая таблица работает прямо на столбцах файла.
+#В Windows файл, открытый через mmap, заменить нельзя, поэтому сжатие журнала там не сработает - binary рассчитан на Unix.
+class BinaryStorage(JournalStorage):
+    def __init__(self, filename: str):
+        super().__init__(filename)
+        self.snapshot_file = filename + BINARY_SUFFIX
+        self.section = os.path.splitext(os.path.basename(filename))[0]
+
+    def open_snapshot(self):
+        try:
+            return BinarySnapshot(self.snapshot_file)
+        except FileNotFoundError:
+            return None
+
+    def load_snapshot(self):
+        snapshot = self.open_snapshot()
+        return {} if snapshot == None else dict(snapshot.items())
+
+    def read_snapshot(self):
+        snapshot = self.open_snapshot()
+        ops, position = self.read_tail(0)
+        return [] if snapshot == None else snapshot, ops, position
+
+    def compact(self, records):
+        columns = records if isinstance(records, dict) else records_to_columns(records, SECTION_COLUMNS[self.section])
+        write_binary_snapshot(self.snapshot_file, self.section, columns)
+        if os.path.exists(self.journal):
+            os.remove(self.journal)
+
+
+#Хранилище в SQLite (режим WAL): таблица на раздел со столбцами ключей из SQLITE_KEY_COLUMNS и индексами из SQLITE_INDEXES,
+#версия раздела в таблице versions.
+#Версия увеличивается в той же транзакции, что и изменения, и вместе с inode файла базы служит отметкой для кэша репозитория.
+#filename - файл раздела из SECTION_FILES: по нему называются таблица, файл блокировки и файлы .idx/.import.
+sqlite_connections = {}
+SQLITE_COLUMN_TYPES = {'id': 'INTEGER PRIMARY KEY', 'amount': 'REAL', 'done': 'INTEGER'}
+#Сколько id передаётся в одном запросе id IN (...)
+SQLITE_QUERY_IDS = 500
+
+def sqlite_connection():
+    filename = os.path.abspath(SQLITE_FILE)
+    if filename not in sqlite_connections:
+        connection = sqlite3.connect(filename, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS versions (section TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+        sqlite_connections[filename] = connection
+    return sqlite_connections[filename]
+
+def ordinal_to_key(ordinal):
+    return dt.fromordinal(ordinal).isoformat()[:10]
+
+#Ключ ГГГГ-ММ-ДД из разобранной даты (None для пустой или некорректной): даты без ведущих нулей (5-3-2021) дают тот же ключ
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def to_date_key(date):
+    ordinal = date_ordinal(date)
+    return ordinal_to_key(ordinal) if ordinal != None else None
+
+#Пустая строка вместо None: пары (ключ, id) сравниваются и для записей без даты
+def sortable_date(date):
+    return to_date_key(date) or ''
+
+#Ключ времени заметки ДД-ММ-ГГГГ ЧЧ:ММ:СС: ГГГГ-ММ-ДД ЧЧ:ММ:СС с датой из разобранной даты ('' для пустой или некорректной)
+def sortable_timestamp(timestamp):
+    date, sep, time = to_text(timestamp).strip().partition(' ')
+    key = to_date_key(date)
+    return key + sep + time if key != None else ''
+
+class SqliteStorage:
+    rewrite_large_batches = False
+    indexed_queries = True
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.lock = FileLock(filename + LOCK_SUFFIX)
+        self.table = os.path.splitext(os.path.basename(filename))[0]
+        self.columns = SECTION_COLUMNS[self.table]
+        self.keys = SQLITE_KEY_COLUMNS.get(self.table, {})
+        self.text_columns = {column for column in self.columns if column not in SQLITE_COLUMN_TYPES}
+        self.connection = None
+
+    def db(self):
+        if self.connection == None:
+            connection = sqlite_connection()
+            columns = [f'{column} {SQLITE_COLUMN_TYPES.get(column, "TEXT")}' for column in self.columns + list(self.keys)]
+            connection.execute(f'CREATE TABLE IF NOT EXISTS {self.table} ({", ".join(columns)})')
+            self.connection = connection
+            self.add_key_columns()
+            self.create_indexes()
+            for key in self.keys:
+                self.repair_keys(key)
+        return self.connection
+
+    #В базах прежних версий части столбцов ключей нет: они добавляются пустыми (NULL) и заполняются в repair_keys
+    def add_key_columns(self):
+        existing = lambda: {row[1] for row in self.connection.execute(f'PRAGMA table_info({self.table})')}
+        if existing().issuperset(self.keys):
+            return
+        with self.lock:
+            for key in set(self.keys) - existing():
+                self.connection.execute(f'ALTER TABLE {self.table} ADD COLUMN {key} TEXT')
+
+    #Незаполненные ключи пересчитываются при открытии базы. Прежние версии строили ключ даты из позиций символов,
+    #и даты без ведущих нулей получали ключи вроде "21--2-5-": такие ключи (не по шаблону GLOB) тоже пересчитываются
+    def repair_keys(self, key):
+        source, function, pattern = self.keys[key]
+        where = f'{key} IS NULL' + (f" OR ({key} != '' AND {key} NOT GLOB '{pattern}')" if pattern != None else '')
+        rows = self.connection.execute(f'SELECT id, {source} FROM {self.table} WHERE {where}').fetchall()
+        if len(rows) == 0:
+            return
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                self.connection.executemany(f'UPDATE {self.table} SET {key} = ? WHERE id = ?', [(function(to_text(value)), id) for id, value in rows])
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+
+    def create_indexes(self):
+        for column in SQLITE_INDEXES[self.table]:
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_{column} ON {self.table} ({column})')
+
+    def files(self):
+        return [SQLITE_FILE]
+
+    def stamp(self):
+        row = self.db().execute('SELECT version FROM versions WHERE section = ?', (self.table,)).fetchone()
+        return ((row[0] if row != None else 0, os.stat(SQLITE_FILE).st_ino),)
+
+    def to_row(self, record):
+        row = [to_text(record[column]) if column in self.text_columns else record[column] for column in self.columns]
+        values = dict(zip(self.columns, row))
+        return row + [function(values[source]) for source, function, pattern in self.keys.values()]
+
+    def to_record(self, row):
+        record = dict(zip(self.columns, row))
+        if 'done' in record:
+            record['done'] = bool(record['done'])
+        return record
+
+    def query(self, where='', params=(), order='id', limit=None, offset=0):
+        sql = f'SELECT {", ".join(self.columns)} FROM {self.table}'
+        if where != '':
+            sql += f' WHERE {where}'
+        sql += f' ORDER BY {order}'
+        if limit != None:
+            sql += f' LIMIT {int(limit)} OFFSET {int(offset)}'
+        return [self.to_record(row) for row in self.db().execute(sql, params)]
+
+    def ids(self, where='', params=(), order='id', limit=None):
+        sql = f'SELECT id FROM {self.table}'
+        if where != '':
+            sql += f' WHERE {where}'
+        sql += f' ORDER BY {order}'
+        if limit != None:
+            sql += f' LIMIT {int(limit)}'
+        return [row[0] for row in self.db().execute(sql, params)]
+
+    def get(self, id):
+        records = self.query('id = ?', (id,))
+        return records[0] if len(records) > 0 else None
+
+    def count(self, where='', params=()):
+        return self.db().execute(f'SELECT COUNT(*) FROM {self.table}' + (f' WHERE {where}' if where != '' else ''), params).fetchone()[0]
+
+    def max_id(self):
+        return self.db().execute(f'SELECT COALESCE(MAX(id), 0) FROM {self.table}').fetchone()[0]
+
+    #Суммы доходов и расходов (расходы - отрицательные суммы) по условию, по группам значений выражения group
+    #(без group - одна строка с общими суммами, даже если записей нет)
+    def totals(self, where, params=(), group=None):
+        sql = (f'SELECT {group or "NULL"}, COALESCE(SUM(CASE WHEN amount > 0 THEN amount END), 0), COALESCE(SUM(CASE WHEN amount < 0 THEN amount END), 0) '
+               f'FROM {self.table} WHERE {where}' + (f' GROUP BY {group}' if group != None else ''))
+        return self.db().execute(sql, params).fetchall()
+
+    def load(self):
+        return {record['id']: record for record in self.query()}
+
+    #Страница по курсору [значение выражения, id]: сравнение пар и порядок по (выражение, id) используют индексы столбцов.
+    #where - необязательное условие отбора записей (фильтр списка)
+    def page(self, expression, reverse, after, limit, offset, where='', params=()):
+        sql = f'SELECT {", ".join(self.columns)}, {expression} FROM {self.table}'
+        conditions, params = [where] if where != '' else [], list(params)
+        if after != None:
+            conditions.append(f'({expression}, id) {"<" if reverse else ">"} (?, ?)')
+            params += list(after)
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(f'({condition})' for condition in conditions)
+        order = 'DESC' if reverse else 'ASC'
+        sql += f' ORDER BY {expression} {order}, id {order} LIMIT ? OFFSET ?'
+        rows = self.db().execute(sql, params + [limit + 1, offset]).fetchall()
+        cursor = [rows[limit - 1][-1], rows[limit - 1][0]] if len(rows) > limit and limit > 0 else None
+        return [self.to_record(row[:-1]) for row in rows[:limit]], cursor
+
+    def read(self):
+        return self.load(), 0
+
+    def read_snapshot(self):
+        return self.load().values(), [], 0
+
+    def read_tail(self, position):
+        return None
+
+    def repair(self):
+        pass
+
+    def end(self):
+        return 0
+
+    #Все операции пачки - одна транзакция; подряд идущие записи вставляются одним executemany
+    def write(self, ops, clear=False):
+        db = self.db()
+        placeholders = ', '.join('?' * (len(self.columns) + len(self.keys)))
+        names = ', '.join(self.columns + list(self.keys))
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if clear:
+                #При полной перезаписи индексы дешевле построить заново после вставки, чем обновлять на каждой строке
+                db.execute(f'DELETE FROM {self.table}')
+                for column in SQLITE_INDEXES[self.table]:
+                    db.execute(f'DROP INDEX IF EXISTS {self.table}_{column}')
+            rows = []
+            for op in flatten_ops(ops):
+                if op['op'] == 'delete':
+                    db.executemany(f'INSERT OR REPLACE INTO {self.table} ({names}) VALUES ({placeholders})', rows)
+                    rows = []
+                    db.execute(f'DELETE FROM {self.table} WHERE id = ?', (op['id'],))
+                else:
+                    rows.append(self.to_row(op['data']))
+            db.executemany(f'INSERT OR REPLACE INTO {self.table} ({names}) VALUES ({placeholders})', rows)
+            if clear:
+                self.create_indexes()
+            db.execute('INSERT INTO versions (section, version) VALUES (?, 1) ON CONFLICT (section) DO UPDATE SET version = version + 1', (self.table,))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+    def apply(self, ops, snapshot=None, compact=True):
+        if len(ops) > 0:
+            self.write(ops)
+
+    def insert(self, record):
+        self.apply([{'op': 'insert', 'data': record}])
+
+    def update(self, record):
+        self.apply([{'op': 'update', 'data': record}])
+
+    def delete(self, id):
+        self.apply([{'op': 'delete', 'id': id}])
+
+    def compact(self, records):
+        if isinstance(records, dict):
+            records = columns_to_records(records)
+        self.write([{'op': 'insert', 'data': record} for record in records], clear=True)
+
+
+def flatten_ops(ops):
+    for op in ops:
+        if op['op'] == 'batch':
+            yield from flatten_ops(op['ops'])
+        else:
+            yield op
+
+STORAGE_BACKENDS = {'json': JsonStorage, 'journal': JournalStorage, 'sqlite': SqliteStorage, 'binary': BinaryStorage}
+storages = {}
+
+def get_storage(section):
+    if section not in storages:
+        storages[section] = STORAGE_BACKENDS[STORAGE_BACKEND](SECTION_FILES[section])
+    return storages[section]
+
+#Перенос всех разделов между хранилищами (например, из JSON-файлов в SQLite). Исходные файлы не удаляются.
+def migrate_storage(source, target):
+    counts = {}
+    for section, filename in SECTION_FILES.items():
+        source_storage, target_storage = STORAGE_BACKENDS[source](filename), STORAGE_BACKENDS[target](filename)
+        with source_storage.lock:
+            records = source_storage.load()
+            target_storage.compact(records.values())
+        counts[section] = len(records)
+    return counts
+
+
+#Поля сортировки списков: ключ для объекта в памяти и то же значение в виде выражения SQL.
+#Значения должны совпадать, потому что курсор страницы (ключ и id последней записи) может прийти из любого из двух путей.
+#Даты сортируются по ключу ГГГГ-ММ-ДД из разобранной даты (порядок совпадает с порядком дней и с ключами *_key в SQLite),
+#пустые и некорректные даты - пустой строкой в начале. Текст не строкой (NaN из старых файлов) сортируется как пустая строка.
+SORT_FIELDS = {
+    'notes': {
+        'id': (lambda note: note.id, 'id'),
+        'title': (lambda note: to_text(note.title), 'title'),
+        'timestamp': (lambda note: sortable_timestamp(note.timestamp), 'timestamp_key')
+    },
+    'tasks': {
+        'id': (lambda task: task.id, 'id'),
+        'title': (lambda task: to_text(task.title), 'title'),
+        'priority': (lambda task: priority_rank(task.priority),
+                     'CASE priority ' + ' '.join(f"WHEN '{priority}' THEN {rank}" for rank, priority in enumerate(PRIORITIES)) + f' ELSE {len(PRIORITIES)} END'),
+        'due_date': (lambda task: sortable_date(task.due_date), 'due_date_key'),
+        'done': (lambda task: int(task.done), 'done')
+    },
+    'contacts': {
+        'id': (lambda contact: contact.id, 'id'),
+        'name': (lambda contact: to_text(contact.name), 'name'),
+        'phone': (lambda contact: to_text(contact.phone), 'phone'),
+        'email': (lambda contact: to_text(contact.email), 'email')
+    },
+    'finance': {
+        'id': (lambda record: record.id, 'id'),
+        'date': (lambda record: sortable_date(record.date), 'date_key'),
+        'amount': (lambda record: record.amount, 'amount'),
+        'category': (lambda record: to_text(record.category), 'category')
+    }
+}
+
+
+#Словарь id -> объект поверх двоичного снимка: объект модели создаётся из столбцов снимка при первом обращении к записи.
+#Созданные, изменённые и новые объекты лежат в objects, удалённые из снимка id - в deleted.
+class LazyRecords:
+    def __init__(self, snapshot, model):
+        self.snapshot = snapshot
+        self.model = model
+        self.objects = {}
+        self.deleted = set()
+        self.size = len(snapshot)
+
+    def __len__(self):
+        return self.size
+
+    def get(self, id, default=None):
+        obj = self.objects.get(id)
+        if obj == None and id not in self.deleted:
+            row = self.snapshot.row(id)
+            if row != None:
+                obj = self.objects[id] = objects_from_columns(self.model, self.snapshot.column_lists([row]))[0]
+        return default if obj == None else obj
+
+    def __getitem__(self, id):
+        obj = self.get(id)
+        if obj == None:
+            raise KeyError(id)
+        return obj
+
+    def __contains__(self, id):
+        return self.get(id) != None
+
+    def __setitem__(self, id, obj):
+        if id not in self.objects and (id in self.deleted or self.snapshot.row(id) == None):
+            self.size += 1
+        self.objects[id] = obj
+        self.deleted.discard(id)
+
+    def pop(self, id, default=None):
+        obj = self.get(id)
+        if obj == None:
+            return default
+        del self.objects[id]
+        if self.snapshot.row(id) != None:
+            self.deleted.add(id)
+        self.size -= 1
+        return obj
+
+    def __iter__(self):
+        for id in self.snapshot.ids.tolist():
+            if id not in self.deleted:
+                yield id
+        for id in list(self.objects):
+            if self.snapshot.row(id) == None:
+                yield id
+
+    def keys(self):
+        return iter(self)
+
+    #Все объекты сразу: недостающие создаются из столбцов снимка пачками
+    def values(self):
+        for start in range(0, len(self.snapshot), BINARY_CHUNK_SIZE):
+            rows = range(start, min(start + BINARY_CHUNK_SIZE, len(self.snapshot)))
+            missing = [row for row, id in zip(rows, self.snapshot.ids[start:rows.stop].tolist()) if id not in self.objects and id not in self.deleted]
+            if len(missing) > 0:
+                objs = objects_from_columns(self.model, self.snapshot.column_lists(missing))
+                self.objects.update((obj.id, obj) for obj in objs)
+        return [self.objects[id] for id in self]
+
+    def items(self):
+        return list(zip(self, self.values()))
+
+    #Столбцы всех записей частями: строки, к которым не обращались, берутся из снимка без создания объектов
+    def column_chunks(self, size=BINARY_CHUNK_SIZE):
+        names = list(self.snapshot.columns)
+        touched = np.array(list(self.objects) + list(self.deleted), np.int64)
+        for start in range(0, len(self.snapshot), size):
+            rows = np.arange(start, min(start + size, len(self.snapshot)))
+            chunk = self.snapshot.column_lists(rows)
+            for position in reversed(np.flatnonzero(np.isin(self.snapshot.ids[rows], touched)).tolist()):
+                obj = self.objects.get(chunk['id'][position])
+                for name in names:
+                    if obj == None:
+                        del chunk[name][position]
+                    else:
+                        chunk[name][position] = getattr(obj, name)
+            yield chunk
+        added = [obj for id, obj in self.objects.items() if self.snapshot.row(id) == None]
+        if len(added) > 0:
+            yield objects_to_columns(added, names)
+
+    def to_columns(self):
+        columns = {name: [] for name in self.snapshot.columns}
+        for chunk in self.column_chunks():
+            for name, values in chunk.items():
+                columns[name] += values
+        return columns
+
+
+#Кэш объектов раздела в памяти (id -> объект), перечитывается только при изменении файлов хранилища
+class Repository:
+    def __init__(self, section: str, factory):
+        self.section = section
+        self.factory = factory
+        self.stamp = None
+        self.records = None
+        self.position = 0
+        self.sort_cache = {}
+        self.sort_stamp = None
+        self.sequence = IdSequence(section)
+        repositories[section] = self
+
+    def storage(self):
+        return get_storage(self.section)
+
+    def file_stamp(self):
+        return self.storage().stamp()
+
+    def refresh(self):
+        stamp = self.file_stamp()
+        if stamp != self.stamp:
+            self.catch_up(stamp)
+        return self.records
+
+    #Если снимок тот же, а журнал дописан, применяются только новые строки журнала, иначе раздел перечитывается.
+    #Чтение без блокировки: если за время чтения снимок заменили (сжатие журнала), чтение повторяется.
+    def catch_up(self, stamp):
+        storage = self.storage()
+        tail = None
+        if self.stamp != None and self.records != None and stamp[0] == self.stamp[0]:
+            tail = storage.read_tail(self.position)
+        while True:
+            if tail != None:
+                ops, position = tail
+                self.apply_ops(ops)
+            else:
+                with PausedGC():
+                    snapshot, ops, position = storage.read_snapshot()
+                    self.load(snapshot)
+                    self.apply_ops(ops)
+            after = self.file_stamp()
+            if after[0] == stamp[0]:
+                break
+            tail, stamp = None, after
+        self.stamp, self.position = stamp, position
+
+    def apply_ops(self, ops):
+        objs = []
+        for op in ops:
+            if op['op'] == 'batch':
+                self.put_many(objs)
+                objs = []
+                self.apply_ops(op['ops'])
+            elif op['op'] == 'delete':
+                self.put_many(objs)
+                objs = []
+                self.remove(op['id'])
+            else:
+                objs.append(self.factory(op['data']))
+        self.put_many(objs)
+
+    #Методы load/put_many/remove/snapshot и чтения ниже переопределяются, если записи раздела хранятся не в словаре
+    def load(self, records):
+        if isinstance(records, BinarySnapshot):
+            self.records = LazyRecords(records, SECTION_MODELS[self.section])
+        else:
+            self.records = {record['id']: self.factory(record) for record in records}
+
+    def put_many(self, objs):
+        for obj in objs:
+            self.records[obj.id] = obj
+
+    def remove(self, id):
+        self.records.pop(id, None)
+
+    #Все записи для нового снимка - столбцами, без словаря на каждую запись
+    def snapshot(self):
+        if isinstance(self.records, LazyRecords):
+            return self.records.to_columns()
+        return objects_to_columns(self.records.values(), SECTION_COLUMNS[self.section])
+
+    #Столбцы всех записей частями по size строк (для выгрузки без списка всех записей в памяти)
+    def column_chunks(self, size=EXPORT_CHUNK_SIZE):
+        records = self.refresh()
+        if isinstance(records, LazyRecords):
+            yield from records.column_chunks(size)
+            return
+        objs = list(records.values())
+        for start in range(0, len(objs), size):
+            yield objects_to_columns(objs[start:start + size], SECTION_COLUMNS[self.section])
+
+    def all(self):
+        return list(self.refresh().values())
+
+    #Кэш не загружен, а хранилище само отвечает на запросы по индексам (SQLite): чтения и записи идут в хранилище,
+    #раздел целиком не читается
+    def queries_storage(self):
+        return self.records is None and self.storage().indexed_queries
+
+    def get(self, id):
+        if self.queries_storage():
+            record = self.storage().get(id)
+            return None if record == None else self.factory(record)
+        return self.refresh().get(id)
+
+    def ids(self):
+        return list(self.refresh())
+
+    def __len__(self):
+        if self.queries_storage():
+            return self.storage().count()
+        return len(self.refresh())
+
+    def max_id(self):
+        if self.queries_storage():
+            return self.storage().max_id()
+        return max(self.refresh(), default=0)
+
+    def find(self, ids):
+        if self.queries_storage():
+            found = {}
+            for start in range(0, len(ids), SQLITE_QUERY_IDS):
+                chunk = list(ids[start:start + SQLITE_QUERY_IDS])
+                for record in self.storage().query(f'id IN ({", ".join("?" * len(chunk))})', chunk):
+                    found[record['id']] = self.factory(record)
+            return [found[id] for id in ids]
+        records = self.refresh()
+        return [records[id] for id in ids]
+
+    #Отсортированные пары (ключ, id) для постраничного просмотра: строятся при первом запросе страницы
+    #и перестраиваются только после изменения данных (отметка хранилища меняется при любой записи)
+    def sorted_keys(self, sort):
+        self.refresh()
+        if self.sort_stamp != self.stamp:
+            self.sort_cache, self.sort_stamp = {}, self.stamp
+        if sort not in self.sort_cache:
+            key = SORT_FIELDS[self.section][sort][0]
+            self.sort_cache[sort] = sorted((key(obj), obj.id) for obj in self.records.values())
+        return self.sort_cache[sort]
+
+    #Страница списка после курсора after = [ключ, id] последней показанной записи (None - с начала, offset - пропуск записей).
+    #Возвращает объекты страницы и курсор следующей страницы (None, если записей больше нет).
+    def page(self, sort='id', reverse=False, after=None, limit=LIST_PAGE_SIZE, offset=0):
+        storage = self.storage()
+        if self.queries_storage():
+            #Кэш ещё не загружен, а хранилище отдаёт страницы по индексу - раздел целиком не читается
+            records, cursor = storage.page(SORT_FIELDS[self.section][sort][1], reverse, after, limit, offset)
+            return [self.factory(record) for record in records], cursor
+        keys = self.sorted_keys(sort)
+        if not reverse:
+            start = (0 if after == None else bisect_right(keys, tuple(after))) + offset
+            chunk = keys[start:start + limit]
+            more = start + limit < len(keys)
+        else:
+            end = (len(keys) if after == None else bisect_left(keys, tuple(after))) - offset
+            chunk = keys[max(end - limit, 0):max(end, 0)][::-1]
+            more = end - limit > 0
+        cursor = list(chunk[-1]) if more and len(chunk) > 0 else None
+        return self.find([id for key, id in chunk]), cursor
+
+    #Пустой ли раздел: если кэш не загружен, а хранилище отдаёт страницы само, читается одна запись, а не весь раздел
+    def is_empty(self):
+        if self.queries_storage():
+            return len(self.storage().ids(limit=1)) == 0
+        return len(self) == 0
+
+    #Кэш сбрасывается в состояние "не загружен": следующая страница списка снова может прийти из хранилища по индексу
+    def invalidate(self):
+        self.records = None
+        self.stamp = None
+
+    #changes - список пар (операция, объект), для удаления вместо объекта передаётся id.
+    #expected - необязательный словарь id -> запись (словарь или None) в том виде, в каком её прочитали до изменения;
+    #если под блокировкой запись оказалась другой, изменения не применяются и выбрасывается ConflictError.
+    def commit(self, changes, expected=None):
+        storage = self.storage()
+        if self.queries_storage():
+            self.commit_to_storage(changes, expected)
+            return
+        with storage.lock:
+            #Дочитываем изменения других процессов до своей записи
+            self.refresh()
+            for id, before in (expected or {}).items():
+                current = self.get(id)
+                if (current.to_dict() if current != None else None) != before:
+                    raise ConflictError(f'запись {id} изменена другим процессом')
+            #Пачка сопоставима со всеми данными: дешевле сразу записать новый снимок, чем журнал
+            rewrite = storage.rewrite_large_batches and len(changes) > len(self) // 2
+            ops, objs = [], []
+            for op, value in changes:
+                if op == 'delete':
+                    self.put_many(objs)
+                    objs = []
+                    self.remove(value)
+                    ops.append({'op': 'delete', 'id': value})
+                else:
+                    objs.append(value)
+                    if not rewrite:
+                        ops.append({'op': op, 'data': value.to_dict()})
+            self.put_many(objs)
+            try:
+                if rewrite:
+                    storage.compact(self.snapshot())
+                else:
+                    storage.apply(ops, self.snapshot)
+            except Exception:
+                #Кэш уже изменён, а хранилище нет - при следующем обращении данные перечитаются
+                self.stamp = None
+                raise
+            self.stamp = self.file_stamp()
+            self.position = storage.end()
+
+    #То же без кэша: записи для проверки expected читаются из хранилища по id, изменения пишутся одной транзакцией
+    def commit_to_storage(self, changes, expected=None):
+        storage = self.storage()
+        with storage.lock:
+            for id, before in (expected or {}).items():
+                current = storage.get(id)
+                if (self.factory(current).to_dict() if current != None else None) != before:
+                    raise ConflictError(f'запись {id} изменена другим процессом')
+            storage.apply([{'op': 'delete', 'id': value} if op == 'delete' else {'op': op, 'data': value.to_dict()} for op, value in changes])
+
+    def add_many(self, objs):
+        self.commit([('insert', obj) for obj in objs])
+        if len(objs) > 0:
+            self.sequence.observe(max(obj.id for obj in objs))
+
+    def add(self, obj):
+        self.add_many([obj])
+
+    def update(self, obj):
+        self.commit([('update', obj)])
+
+    def delete(self, id):
+        self.commit([('delete', id)])
+
+    #Объекты кладутся в кэш как есть, без повторного создания из записанных данных
+    def replace(self, objs):
+        objs = list(objs)
+        storage = self.storage()
+        with storage.lock:
+            storage.compact(objects_to_columns(objs, SECTION_COLUMNS[self.section]))
+            self.load([])
+            self.put_many(objs)
+            self.stamp = self.file_stamp()
+            self.position = storage.end()
+        if len(objs) > 0:
+            self.sequence.observe(max(obj.id for obj in objs))
+
+repositories = {}
+
+#Отметка файлов хранилища в виде, который сохраняется в JSON без изменений (для сравнения с сохранённой)
+def stamp_to_json(stamp):
+    return [list(part) if part != None else None for part in stamp]
+
+
+#Индекс строится лениво при первом поиске и поддерживается при изменениях.
+#При выходе он сохраняется в <файл раздела>.idx вместе с отметкой файлов хранилища и при совпадении отметки не перестраивается.
+#index_class должен уметь add(объект), remove(id), to_dict() и from_dict(данные).
+class IndexedRepository(Repository):
+    def __init__(self, section: str, factory, index_class):
+        self.index_class = index_class
+        self.search_index = None
+        self.index_dirty = False
+        super().__init__(section, factory)
+        atexit.register(self.save_index)
+
+    def index_file(self):
+        return self.storage().filename + INDEX_SUFFIX
+
+    def load(self, records):
+        super().load(records)
+        self.search_index = None
+
+    def put_many(self, objs):
+        super().put_many(objs)
+        if self.search_index != None:
+            for obj in objs:
+                self.search_index.add(obj)
+            self.index_dirty = True
+
+    def remove(self, id):
+        super().remove(id)
+        if self.search_index != None:
+            self.search_index.remove(id)
+            self.index_dirty = True
+
+    def index(self):
+        self.refresh()
+        if self.search_index == None:
+            saved = read_json(self.index_file(), {})
+            if saved.get('stamp') == stamp_to_json(self.stamp):
+                self.search_index = self.index_class.from_dict(saved['index'])
+            else:
+                self.search_index = self.index_class.build(self.records.values())
+                self.index_dirty = True
+        return self.search_index
+
+    def save_index(self):
+        if self.search_index != None and self.index_dirty and self.stamp != None:
+            write_json(self.index_file(), {'stamp': stamp_to_json(self.stamp), 'index': self.search_index.to_dict()})
+            self.index_dirty = False
+
+
+#Последний выданный id каждого раздела хранится в SEQUENCES_FILE, чтобы не искать максимум по всему файлу.
+#Чтение и запись счётчика идут под общей блокировкой, поэтому два процесса не получат один id.
+sequences_lock = FileLock(SEQUENCES_FILE + LOCK_SUFFIX)
+
+class IdSequence:
+    def __init__(self, section: str):
+        self.section = section
+
+    def load(self):
+        return read_json(SEQUENCES_FILE, {})
+
+    def save(self, sequences):
+        write_json(SEQUENCES_FILE, sequences)
+
+    def last(self, sequences):
+        if self.section in sequences:
+            return sequences[self.section]
+        #Первый запуск на старых данных: счётчик инициализируется максимальным id из хранилища
+        return repositories[self.section].max_id()
+
+    def reserve(self, count=1):
+        with sequences_lock:
+            sequences = self.load()
+            last = self.last(sequences)
+            sequences[self.section] = last + count
+            self.save(sequences)
+        return range(last + 1, last + count + 1)
+
+    def next(self):
+        return self.reserve(1)[0]
+
+    def observe(self, id):
+        with sequences_lock:
+            sequences = self.load()
+            last = self.last(sequences)
+            if self.section not in sequences or id > last:
+                sequences[self.section] = max(last, id)
+                self.save(sequences)
+
+
+#Импорт csv: проверка и перенумерация всей таблицы сразу, запись одной пачкой в конце
+def validate_import_frame(section, df):
+    columns = SECTION_COLUMNS[section]
+    missing = [column for column in columns if column not in df.columns]
+    if len(missing) > 0:
+        raise ValueError(f'В файле нет столбцов: {", ".join(missing)}')
+    df = df[columns].copy()
+    ids = pd.to_numeric(df['id'], errors='coerce')
+    valid = ids.notna() & (ids == ids.round())
+    df['id'] = ids.fillna(0).astype('int64')
+    if section == 'tasks':
+        done = df['done'].str.strip().str.lower()
+        valid &= done.isin(['true', 'false', '1', '0'])
+        df['done'] = done.isin(['true', '1'])
+        valid &= df['priority'].isin(PRIORITIES)
+        valid &= date_column_ordinals(df['due_date'].to_numpy()) > 0
+    elif section == 'finance':
+        amounts = pd.to_numeric(df['amount'], errors='coerce')
+        valid &= amounts.notna()
+        df['amount'] = amounts.astype('float64')
+        valid &= date_column_ordinals(df['date'].to_numpy()) > 0
+    return df[valid], int((~valid).sum())
+
+#known_ids - список отсортированных массивов уже занятых id (хранилище и зафиксированные части импорта)
+def is_known_id(known_ids, ids):
+    found = np.zeros(len(ids), bool)
+    for sorted_ids in known_ids:
+        if len(sorted_ids) > 0:
+            positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+            found |= sorted_ids[positions] == ids
+    return found
+
+#Коллизии ищутся по known_ids и внутри самой таблицы; возвращаются позиции перенумерованных строк и первый новый id
+def plan_import_ids(repository, df, known_ids):
+    ids = df['id']
+    colliding = ids.duplicated().to_numpy() | is_known_id(known_ids, ids.to_numpy())
+    #Новые id выдаются после максимального id из файла, чтобы не совпасть с ещё не добавленными строками
+    if len(ids) > 0:
+        repository.sequence.observe(int(ids.max()))
+    positions = colliding.nonzero()[0].tolist()
+    return positions, repository.sequence.reserve(len(positions)).start
+
+def apply_import_ids(df, positions, first_id):
+    df.iloc[positions, df.columns.get_loc('id')] = range(first_id, first_id + len(positions))
+
+def frame_records(df):
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in zip(*(df[column].tolist() for column in columns))]
+
+def bulk_import(section, df):
+    start = time.perf_counter()
+    df, rejected = validate_import_frame(section, df)
+    return commit_import(section, df, rejected, start)
+
+#Файл среднего размера разбирается по частям параллельно, но фиксируется одной пачкой, как bulk_import
+def parallel_import(section, filename):
+    start = time.perf_counter()
+    parts = list(parse_import_chunks(section, filename, IMPORT_CHUNK_BYTES))
+    df = pd.concat([part for part, rejected in parts], ignore_index=True)
+    return commit_import(section, df, sum(rejected for part, rejected in parts), start)
+
+def commit_import(section, df, rejected, start):
+    repository = repositories[section]
+    positions, first_id = plan_import_ids(repository, df, [np.sort(np.asarray(repository.ids(), np.int64))])
+    apply_import_ids(df, positions, first_id)
+    repository.add_many([repository.factory(record) for record in frame_records(df)])
+    elapsed = time.perf_counter() - start
+    return len(df), rejected, elapsed
+
+#Границы частей файла: заголовок и диапазоны байт [start, end), каждый заканчивается концом строки.
+#Перевод строки внутри поля в кавычках границей не считается: до границы должно быть чётное число кавычек
+#(экранированная кавычка "" не меняет чётность). Границы зависят только от файла и chunk_bytes.
+def import_ranges(filename, chunk_bytes):
+    size = os.path.getsize(filename)
+    if size == 0:
+        return b'', [(0, 0)]
+    with open(filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        def line_end(position, quotes):
+            while True:
+                end = data.find(b'\n', position)
+                if end == -1:
+                    return size
+                quotes += data[position:end + 1].count(b'"')
+                position = end + 1
+                if quotes % 2 == 0:
+                    return position
+
+        header_end = line_end(0, 0)
+        header, ranges, start = data[:header_end], [], header_end
+        while start < size:
+            target = min(start + chunk_bytes, size)
+            end = line_end(target, data[start:target].count(b'"')) if target < size else size
+            ranges.append((start, end))
+            start = end
+    return header, ranges or [(size, size)]
+
+#Разбор и проверка одной части в процессе пула: к части добавляется заголовок файла
+def parse_import_range(section, filename, header, start, end):
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    return validate_import_frame(section, pd.read_csv(io.BytesIO(header + data), dtype=str, keep_default_na=False))
+
+#Проверенные части по порядку, начиная с части skip. Впереди разбирается не больше двух частей на процесс,
+#поэтому в памяти ограниченное число частей, а порядок (и с ним выдача id) не зависит от скорости процессов.
+def parse_import_chunks(section, filename, chunk_bytes, skip=0):
+    header, ranges = import_ranges(filename, chunk_bytes)
+    ranges = ranges[skip:]
+    workers = min(IMPORT_WORKERS or os.cpu_count() or 1, len(ranges))
+    if workers <= 1 or os.path.getsize(filename) < IMPORT_PARALLEL_MIN_SIZE:
+        for start, end in ranges:
+            yield parse_import_range(section, filename, header, start, end)
+        return
+    with concurrent_futures.ProcessPoolExecutor(workers) as pool:
+        pending = []
+        for start, end in ranges:
+            pending.append(pool.submit(parse_import_range, section, filename, header, start, end))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        while len(pending) > 0:
+            yield pending.pop(0).result()
+
+#Потоковый импорт по частям: в памяти только разбираемые части (parse_import_chunks) и массивы занятых id.
+#После каждой части прогресс сохраняется в <файл раздела>.import, прерванный импорт того же файла продолжается.
+#Перенумерация части записывается в прогресс до её фиксации, поэтому повторная запись части после сбоя идемпотентна.
+def stream_import(section, filename):
+    start = time.perf_counter()
+    repository = repositories[section]
+    storage = repository.storage()
+    progress_file = storage.filename + IMPORT_PROGRESS_SUFFIX
+    stat = os.stat(filename)
+    source = {'file': os.path.abspath(filename), 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'chunk_bytes': IMPORT_CHUNK_BYTES}
+    progress = read_json(progress_file, {})
+    if progress.get('source') != source:
+        progress = {'source': source, 'chunks': 0, 'pending': None}
+    elif progress['chunks'] > 0 or progress['pending'] != None:
+        print(f'Продолжение прерванного импорта с части {progress["chunks"] + 1}')
+    known_ids = [np.sort(np.asarray(repository.ids(), np.int64))]
+    repository.invalidate()
+    count, rejected = 0, 0
+    chunks = parse_import_chunks(section, filename, source['chunk_bytes'], progress['chunks'])
+    for index, (chunk, chunk_rejected) in enumerate(chunks, progress['chunks']):
+        pending = progress['pending']
+        if pending != None and pending['chunk'] == index:
+            positions, first_id = pending['positions'], pending['first_id']
+        else:
+            positions, first_id = plan_import_ids(repository, chunk, known_ids)
+            progress['pending'] = {'chunk': index, 'positions': positions, 'first_id': first_id}
+            write_json(progress_file, progress)
+        apply_import_ids(chunk, positions, first_id)
+        with storage.lock:
+            storage.apply([{'op': 'insert', 'data': record} for record in frame_records(chunk)], compact=False)
+        known_ids.append(np.sort(chunk['id'].to_numpy()))
+        progress['chunks'], progress['pending'] = index + 1, None
+        write_json(progress_file, progress)
+        count += len(chunk)
+        rejected += chunk_rejected
+    os.remove(progress_file)
+    elapsed = time.perf_counter() - start
+    return count, rejected, elapsed
+
+def import_csv(section, filename):
+    size = os.path.getsize(filename)
+    if size >= IMPORT_STREAM_MIN_SIZE:
+        return stream_import(section, filename)
+    if size >= IMPORT_PARALLEL_MIN_SIZE:
+        return parallel_import(section, filename)
+    return bulk_import(section, read_import_csv(filename))
+
+def read_import_csv(filename):
+    return pd.read_csv(filename, dtype=str, keep_default_na=False)
+
+def print_import_stats(count, rejected, elapsed):
+    print(f'Импортировано записей: {count} ({count / max(elapsed, 1e-9):.0f} строк/с)')
+    if rejected > 0:
+        print(f'Пропущено некорректных строк: {rejected}')
+
+
+#Выгрузка разделов: части столбцов репозитория (column_chunks) пишутся в файл по мере получения, без списка записей в памяти.
+#Файл пишется во временный и заменяет прежний только целиком.
+EXPORT_EXTENSIONS = {'csv': '.csv', 'csv.gz': '.csv.gz', 'parquet': '.parquet'}
+
+def export_format(format=EXPORT_FORMAT):
+    if format == 'auto':
+        return 'parquet' if importlib.util.find_spec('pyarrow') != None else 'csv.gz'
+    if format == 'parquet' and importlib.util.find_spec('pyarrow') == None:
+        raise ValueError('для выгрузки в parquet нужен pyarrow (pip install pyarrow)')
+    return format
+
+class CsvExportWriter:
+    def __init__(self, filename: str, columns: list, compressed: bool = False):
+        if compressed:
+            #Уровень 6: почти тот же размер, что у максимального 9, при заметно более быстром сжатии
+            self.file = gzip.open(filename, 'wt', compresslevel=6, newline='', encoding='utf-8')
+        else:
+            self.file = open(filename, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file, lineterminator='\n')
+        self.writer.writerow(columns)
+
+    def write(self, columns):
+        self.writer.writerows(zip(*columns.values()))
+
+    def close(self):
+        self.file.close()
+
+#Каждая часть - отдельная группа строк parquet. Типы столбцов - как в двоичном снимке, даты остаются строками ДД-ММ-ГГГГ.
+class ParquetExportWriter:
+    def __init__(self, filename: str, columns: list):
+        types = {'int64': pyarrow.int64(), 'float64': pyarrow.float64(), 'bool': pyarrow.bool_()}
+        self.schema = pyarrow.schema([(column, types.get(BINARY_COLUMN_TYPES.get(column, 'bool' if column == 'deleted' else None), pyarrow.string()))
+                                      for column in columns])
+        self.writer = pyarrow_parquet.ParquetWriter(filename, self.schema)
+
+    def write(self, columns):
+        self.writer.write_table(pyarrow.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+#64-битный хэш каждой строки, одинаковый между запусками (у встроенного hash строк он свой в каждом процессе).
+#Типы столбцов заданы явно, чтобы хэш записи не зависел от соседних строк части (например, целые суммы среди дробных).
+#Другая версия pandas может считать хэши иначе - тогда очередная дельта выгрузит все записи заново, но ничего не потеряет.
+def row_hashes(columns):
+    types = {'int64': 'int64', 'float64': 'float64', 'bool': 'bool'}
+    frame = pd.DataFrame(columns).astype({column: types.get(BINARY_COLUMN_TYPES.get(column), 'str') for column in columns})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+#delta=True - только записи, новые или изменённые со времени прошлой выгрузки с тем же файлом состояния, и строки удалённых
+#записей (столбец deleted, остальные поля пустые). Состояние - отсортированные id и хэши строк в state_file
+#(по умолчанию <файл раздела>.export). Оно сохраняется после того, как файл выгрузки записан целиком:
+#после сбоя следующая выгрузка повторит изменения, а не потеряет их.
+def export_section(section, filename, format='csv', delta=False, state_file=None):
+    start = time.perf_counter()
+    repository = repositories[section]
+    columns = SECTION_COLUMNS[section] + (['deleted'] if delta else [])
+    if delta:
+        state_file = state_file or repository.storage().filename + EXPORT_STATE_SUFFIX
+        old_ids, old_hashes = np.zeros(0, np.int64), np.zeros(0, np.uint64)
+        if os.path.exists(state_file):
+            with np.load(state_file) as state:
+                old_ids, old_hashes = state['ids'], state['hashes']
+        new_ids, new_hashes = [], []
+    temp = f'{filename}.{os.getpid()}.tmp'
+    count, deleted = 0, 0
+    try:
+        writer = ParquetExportWriter(temp, columns) if format == 'parquet' else CsvExportWriter(temp, columns, format == 'csv.gz')
+        try:
+            for chunk in repository.column_chunks():
+                if delta:
+                    ids, hashes = np.asarray(chunk['id'], np.int64), row_hashes(chunk)
+                    new_ids.append(ids)
+                    new_hashes.append(hashes)
+                    changed = np.ones(len(ids), bool)
+                    if len(old_ids) > 0:
+                        positions = np.minimum(np.searchsorted(old_ids, ids), len(old_ids) - 1)
+                        changed = (old_ids[positions] != ids) | (old_hashes[positions] != hashes)
+                    if not changed.all():
+                        positions = np.flatnonzero(changed).tolist()
+                        chunk = {name: [values[i] for i in positions] for name, values in chunk.items()}
+                    chunk['deleted'] = [False] * len(chunk['id'])
+                writer.write(chunk)
+                count += len(chunk['id'])
+            if delta:
+                ids, hashes = np.concatenate([np.zeros(0, np.int64)] + new_ids), np.concatenate([np.zeros(0, np.uint64)] + new_hashes)
+                order = np.argsort(ids, kind='stable')
+                ids, hashes = ids[order], hashes[order]
+                removed = old_ids[~np.isin(old_ids, ids)].tolist()
+                if len(removed) > 0:
+                    writer.write({column: removed if column == 'id' else [True if column == 'deleted' else None] * len(removed) for column in columns})
+                deleted = len(removed)
+        finally:
+            writer.close()
+        os.replace(temp, filename)
+    except Exception:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    if delta:
+        buffer = io.BytesIO()
+        np.savez(buffer, ids=ids, hashes=hashes)
+        write_file_atomic(state_file, [buffer.getvalue()])
+    return count, deleted, time.perf_counter() - start
+
+def export_to_csv(section, filename, message):
     try:
-        dt.strptime(date, '%d-%m-%Y')
-        return True 
-    except:
-        return False  
+        export_section(section, filename)
+        print(message)
+    except Exception as e:
+        print(f'Ошибка: {e}')
+
 
 
 class Note:
+    __slots__ = ('id', 'title', 'content', 'timestamp')
+
     def __init__(self, id: int, title: str, content: str, timestamp: str = None):
         self.id = id
         self.title = title
@@ -83,108 +1734,232 @@ class Note:
         }
 
 def dict_to_note(data):
-    return Note(id=data['id'], title=data['title'], content=data['content'], timestamp=data['timestamp'])
+    #Без времени (None) заметка получает текущее время, NaN из старых файлов - пустое
+    timestamp = data['timestamp']
+    return Note(data['id'], to_text(data['title']), to_text(data['content']), to_text(timestamp) if timestamp != None else None)
+
+#Постраничный вывод списков: каждая страница запрашивается у репозитория от курсора предыдущей,
+#поэтому для вывода первой страницы остальные записи не создаются и не печатаются
+def ask_list_options(section):
+    fields = SORT_FIELDS[section]
+    while True:
+        text = input(f'Параметры списка: sort=<{"/".join(fields)}> desc limit=<число> offset=<число> (Enter - по умолчанию) >> ')
+        options = {'sort': 'id', 'reverse': False, 'limit': None, 'offset': 0}
+        try:
+            for token in text.split():
+                key, sep, value = token.partition('=')
+                if key == 'desc' and sep == '':
+                    options['reverse'] = True
+                elif key == 'sort' and value in fields:
+                    options['sort'] = value
+                elif key in ('limit', 'offset') and value.isdigit():
+                    options[key] = int(value)
+                else:
+                    raise ValueError(f'неизвестный параметр {token}')
+            return options
+        except Exception as e:
+            print(f'Ошибка: {e}')
+
+#Генератор страниц: (объекты страницы, есть ли записи дальше)
+def iter_pages(repository, options, **filters):
+    cursor, offset, left = None, options['offset'], options['limit']
+    while left == None or left > 0:
+        size = LIST_PAGE_SIZE if left == None else min(LIST_PAGE_SIZE, left)
+        objs, cursor = repository.page(options['sort'], options['reverse'], cursor, size, offset, **filters)
+        offset = 0
+        if left != None:
+            left -= len(objs)
+        more = cursor != None and (left == None or left > 0)
+        yield objs, more
+        if not more:
+            break
+
+def print_pages(pages, format_row):
+    shown = 0
+    for objs, more in pages:
+        for obj in objs:
+            print(format_row(obj))
+        shown += len(objs)
+        if more and input('Enter - следующая страница, q - закончить >> ').strip().lower() == 'q':
+            break
+    return shown
+
+#Окончания русских слов, отбрасываемые при поиске (упрощённый стемминг: 'заметками' и 'заметка' дают одну основу)
+RUSSIAN_ENDINGS = sorted(['иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией', 'ий', 'ый', 'ой', 'ей', 'ая', 'яя',
+                          'ое', 'ее', 'ые', 'ие', 'ов', 'ев', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ую', 'юю', 'ть', 'а', 'я', 'о',
+                          'е', 'ы', 'и', 'у', 'ю', 'ь'], key=len, reverse=True)
+TOKEN_PATTERN = re.compile(r'[0-9a-zа-я]+')
+
+def stem(word):
+    if len(word) > 3 and 'а' <= word[-1] <= 'я':
+        for ending in RUSSIAN_ENDINGS:
+            if word.endswith(ending) and len(word) - len(ending) >= 3:
+                return word[:-len(ending)]
+    return word
+
+def tokenize(text):
+    return [stem(word) for word in TOKEN_PATTERN.findall(str(text).casefold().replace('ё', 'е'))]
+
+#Инвертированный индекс заметок: терм -> {id: частота}; слова заголовка весят NOTE_TITLE_WEIGHT. Ранжирование BM25.
+class NoteIndex:
+    def __init__(self):
+        self.docs = {}
+        self.lengths = {}
+        self.postings = {}
+        self.total_length = 0
+
+    def add(self, note):
+        terms = {}
+        for term in tokenize(note.title):
+            terms[term] = terms.get(term, 0) + NOTE_TITLE_WEIGHT
+        for term in tokenize(note.content):
+            terms[term] = terms.get(term, 0) + 1
+        self.insert(note.id, terms)
+
+    def insert(self, id, terms):
+        self.remove(id)
+        self.docs[id] = terms
+        self.lengths[id] = sum(terms.values())
+        self.total_length += self.lengths[id]
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[id] = count
+
+    def remove(self, id):
+        terms = self.docs.pop(id, None)
+        if terms == None:
+            return
+        self.total_length -= self.lengths.pop(id)
+        for term in terms:
+            postings = self.postings[term]
+            del postings[id]
+            if len(postings) == 0:
+                del self.postings[term]
+
+    @staticmethod
+    def build(notes):
+        index = NoteIndex()
+        for note in notes:
+            index.add(note)
+        return index
+
+    def search(self, query, limit=NOTE_SEARCH_LIMIT):
+        if len(self.docs) == 0:
+            return []
+        average_length = max(self.total_length / len(self.docs), 1)
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term, {})
+            idf = math.log(1 + (len(self.docs) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for id, count in postings.items():
+                length_norm = 1 - BM25_B + BM25_B * self.lengths[id] / average_length
+                scores[id] = scores.get(id, 0) + idf * count * (BM25_K1 + 1) / (count + BM25_K1 * length_norm)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    def to_dict(self):
+        return {'docs': [[id, terms] for id, terms in self.docs.items()]}
+
+    @staticmethod
+    def from_dict(data):
+        index = NoteIndex()
+        for id, terms in data['docs']:
+            index.insert(id, terms)
+        return index
+
+notes_repository = IndexedRepository('notes', dict_to_note, NoteIndex)
 
 def get_notes():
-    if not os.path.exists(NOTES_FILE):
-        return []
-    with open(NOTES_FILE, 'r') as file:
-        return [dict_to_note(note) for note in json.load(file)]
+    return notes_repository.all()
 
 def save_notes(notes):
-    with open(NOTES_FILE, 'w') as file:
-        json.dump([note.to_dict() for note in notes], file)
+    notes_repository.replace(notes)
 
 def view_notes():
-    notes = get_notes()
-    if len(notes) == 0:
+    if notes_repository.is_empty():
         print('Заметки отсутствуют')
     else:
+        options = ask_list_options('notes')
         print('Список всех заметок:')
-        for note in notes:
-            print(f'Заголовок: {note.title} (id: {note.id}, дата: {note.timestamp})')
+        if print_pages(iter_pages(notes_repository, options), lambda note: f'Заголовок: {note.title} (id: {note.id}, дата: {note.timestamp})') == 0:
+            print('Заметки не найдены')
 
 def view_note():
-    notes = get_notes()
-    if len(notes) == 0:
+    if len(notes_repository) == 0:
         print('Заметки отсутствуют')
     else:
         try:
             id = int(input('Введите id заметки >> '))
-            if id not in [note.id for note in notes]:
+            note = notes_repository.get(id)
+            if note == None:
                 print('Заметка не найдена')
             else:
-                for note in notes:
-                    if note.id == id:
-                        print(f'Заголовок: {note.title}\nСодержание: {note.content}\nДата: {note.timestamp}')
-                        break
+                print(f'Заголовок: {note.title}\nСодержание: {note.content}\nДата: {note.timestamp}')
         except Exception as e:
             print(f'Ошибка: {e}')
 
 def update_note():
-    notes = get_notes()
-    if len(notes) == 0:
+    if len(notes_repository) == 0:
         print('Заметки отсутствуют')
     else:
         try:
             id = int(input('Введите id заметки >> '))
-            note = next(filter(lambda x: x.id == id, notes), None)
+            note = notes_repository.get(id)
             if note == None:
                 print('Заметка не найдена')
             else:
+                #Правится копия: прерванный ввод не оставляет в кэше наполовину изменённую запись
+                note = notes_repository.factory(note.to_dict())
                 tmp_title = input('Введи новый заголовок >> ')
                 tmp_content = input('Введи новое содержание >> ')
                 note.title = tmp_title
                 note.content = tmp_content
                 note.timestamp = dt.now().strftime('%d-%m-%Y %H:%M:%S')
-                save_notes(notes)
+                notes_repository.update(note)
         except Exception as e:
             print(f'Ошибка: {e}')
 
 def add_note():
-    notes = get_notes()
     id = get_free_id('notes')
     title = input('Введи заголовок: ')
     content = input('Введи содержание: ')
     new_note = Note(id = id, title=title, content=content)
-    notes.append(new_note)
-    save_notes(notes)
+    notes_repository.add(new_note)
     print(f'Заметка "{title}" добавлена.')
 
 def delete_note():
-    notes = get_notes()
     try:
         id = int(input('Введите id заметки >> '))
-        notes = [note for note in notes if note.id != id]
-        save_notes(notes)
+        notes_repository.delete(id)
         print('Заметка удалена')
     except Exception as e:
         print(f'Ошибка: {e}')
 
+def search_notes():
+    query = input('Введите слова для поиска >> ')
+    found = notes_repository.index().search(query)
+    if len(found) == 0:
+        print('Заметки не найдены')
+    else:
+        print('Найденные заметки:')
+        for id, score in found:
+            note = notes_repository.get(id)
+            print(f'Заголовок: {note.title} (id: {note.id}, дата: {note.timestamp}, релевантность: {score:.2f})')
+
 def export_notes_to_csv():
-    try:
-        pd.DataFrame([note.to_dict() for note in get_notes()]).to_csv(NOTES_EXPORT_FILE, index=False)
-        print(f'Заметки экспортированы в {NOTES_EXPORT_FILE}')
-    except Exception as e:
-        print(f'Ошибка: {e}')
+    export_to_csv('notes', NOTES_EXPORT_FILE, f'Заметки экспортированы в {NOTES_EXPORT_FILE}')
 
 def import_notes_from_csv():
     filename = input('Введите название файла (с расширением) для импорта заметок >> ')
     try:
-        df = pd.read_csv(filename)
-        notes = get_notes()
-        for index, row in df.iterrows():
-            note = Note(id=int(row['id']), title=row['title'], content=row['content'], timestamp=row['timestamp'])
-            if note.id in [n.id for n in notes]:
-                note.id = get_free_id('notes')
-            notes.append(note)
-            save_notes(notes)
+        count, rejected, elapsed = import_csv('notes', filename)
         print(f'Заметки импортированы из {filename}')
+        print_import_stats(count, rejected, elapsed)
     except Exception as e:
         print(f'Ошибка: {e}')
 
 
 class Task:
+    __slots__ = ('id', 'title', 'priority', 'due_date', 'description', 'done')
+
     def __init__(self, id: int, title: str, priority: str = 'Средний', due_date: str = None, description: str = '', done: bool = False):
         self.id = id
         self.title = title
@@ -204,36 +1979,167 @@ class Task:
         }
 
 def dict_to_task(data):
-    return Task(id=data['id'], title=data['title'], description=data['description'], done=data['done'], priority=data['priority'], due_date=data['due_date'])
+    return Task(data['id'], to_text(data['title']), to_text(data['priority']), to_text(data['due_date']), to_text(data['description']), data['done'])
+
+#Очередь открытых задач со сроком: куча ключей (день срока, ранг приоритета, id) с ленивым удалением.
+#entries хранит актуальный ключ каждой задачи; ключи в куче, не совпадающие с ним, устарели и отбрасываются при извлечении.
+#Запросы извлекают нужные ключи с вершины и возвращают их обратно: O(k log N) для k найденных задач.
+class TaskQueue:
+    def __init__(self):
+        self.heap = []
+        self.entries = {}
+
+    #Построение сразу по всем задачам: ключи без повторных проверок, куча собирается одним heapify
+    @staticmethod
+    def build(tasks):
+        queue = TaskQueue()
+        for task in tasks:
+            due = date_ordinal(task.due_date) if not task.done else None
+            if due != None:
+                queue.entries[task.id] = (due, priority_rank(task.priority), task.id)
+        queue.heap = list(queue.entries.values())
+        heapq.heapify(queue.heap)
+        return queue
+
+    def add(self, task):
+        due = date_ordinal(task.due_date) if not task.done else None
+        if due == None:
+            self.remove(task.id)
+            return
+        key = (due, priority_rank(task.priority), task.id)
+        if self.entries.get(task.id) != key:
+            self.entries[task.id] = key
+            heapq.heappush(self.heap, key)
+            self.compact()
+
+    def remove(self, id):
+        if self.entries.pop(id, None) != None:
+            self.compact()
+
+    #Устаревших ключей стало больше, чем актуальных - куча пересобирается из entries
+    def compact(self):
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = list(self.entries.values())
+            heapq.heapify(self.heap)
+
+    def take(self, count=None, until=None):
+        taken = []
+        while len(self.heap) > 0 and (count == None or len(taken) < count):
+            key = self.heap[0]
+            if self.entries.get(key[2]) != key:
+                heapq.heappop(self.heap)
+                continue
+            if until != None and key[0] > until:
+                break
+            taken.append(heapq.heappop(self.heap))
+        for key in taken:
+            heapq.heappush(self.heap, key)
+        return taken
+
+    def next(self, count):
+        return [key[2] for key in self.take(count=count)]
+
+    def overdue(self, today):
+        return [key[2] for key in self.take(until=today - 1)]
+
+    #Просроченные задачи лежат в вершине кучи раньше искомых, поэтому тоже извлекаются, но в ответ не попадают
+    def due_within(self, days, today):
+        return [key[2] for key in self.take(until=today + days) if key[0] >= today]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def to_dict(self):
+        return {'entries': list(self.entries.values())}
+
+    @staticmethod
+    def from_dict(data):
+        queue = TaskQueue()
+        queue.entries = {key[2]: tuple(key) for key in data['entries']}
+        queue.heap = list(queue.entries.values())
+        heapq.heapify(queue.heap)
+        return queue
+
+#Очередь открытых задач: в SQLite без загруженного кэша - запросы по индексу due_date_key в том же порядке, что у TaskQueue
+#(срок, ранг приоритета, id), иначе - из TaskQueue. Методы возвращают id задач.
+class TaskRepository(IndexedRepository):
+    def queue_ids(self, where='', params=(), limit=None):
+        order = f'due_date_key, {SORT_FIELDS["tasks"]["priority"][1]}, id'
+        return self.storage().ids(f"done = 0 AND due_date_key != ''" + (f' AND {where}' if where != '' else ''), params, order, limit)
+
+    #Задачи с отметкой done в порядке id: общее число и словари задач с offset по offset + limit
+    def filter_done(self, done, offset, limit):
+        if self.queries_storage():
+            storage = self.storage()
+            return storage.count('done = ?', (int(done),)), storage.query('done = ?', (int(done),), limit=limit, offset=offset)
+        tasks = [task for task in self.all() if task.done == done]
+        return len(tasks), [task.to_dict() for task in tasks[offset:offset + limit]]
+
+    def next(self, count):
+        if self.queries_storage():
+            return self.queue_ids(limit=count)
+        return self.index().next(count)
+
+    def overdue(self, today):
+        if self.queries_storage():
+            return self.queue_ids('due_date_key < ?', (ordinal_to_key(today),))
+        return self.index().overdue(today)
+
+    def due_within(self, days, today):
+        if self.queries_storage():
+            return self.queue_ids('due_date_key BETWEEN ? AND ?', (ordinal_to_key(today), ordinal_to_key(today + days)))
+        return self.index().due_within(days, today)
+
+tasks_repository = TaskRepository('tasks', dict_to_task, TaskQueue)
 
 def get_tasks():
-    if not os.path.exists(TASKS_FILE):
-        return []
-    with open(TASKS_FILE, 'r') as file:
-        return [dict_to_task(task) for task in json.load(file)]
+    return tasks_repository.all()
 
 def save_tasks(tasks):
-    with open(TASKS_FILE, 'w') as file:
-        json.dump([task.to_dict() for task in tasks], file)
+    tasks_repository.replace(tasks)
+
+def format_task(task):
+    return f'Краткое описание: {task.title}; приоритет: {task.priority}; дедлайн: {task.due_date}; подробное описание: {task.description}; выполнено: {task.done}; id: {task.id}'
 
 def view_tasks():
-    tasks = get_tasks()
-    if len(tasks) == 0:
+    if tasks_repository.is_empty():
         print('Задачи отсутствуют')
     else:
+        options = ask_list_options('tasks')
         print('Список всех задач:')
-        for task in tasks:
-            print(f'Краткое описание: {task.title}; приоритет: {task.priority}; дедлайн: {task.due_date}; подробное описание: {task.description}; выполнено: {task.done}; id: {task.id}')
+        if print_pages(iter_pages(tasks_repository, options), format_task) == 0:
+            print('Задачи не найдены')
+
+def print_tasks(ids, empty):
+    pages = ((tasks_repository.find(ids[start:start + LIST_PAGE_SIZE]), start + LIST_PAGE_SIZE < len(ids)) for start in range(0, len(ids), LIST_PAGE_SIZE))
+    if print_pages(pages, format_task) == 0:
+        print(empty)
+
+def view_next_tasks():
+    try:
+        count = int(input('Сколько задач показать >> '))
+        print_tasks(tasks_repository.next(count), 'Открытых задач со сроком нет')
+    except Exception as e:
+        print(f'Ошибка: {e}')
+
+def view_overdue_tasks():
+    print_tasks(tasks_repository.overdue(dt.now().toordinal()), 'Просроченных задач нет')
+
+def view_due_soon_tasks():
+    try:
+        days = int(input('На сколько дней вперёд (0 - только сегодня) >> '))
+        print_tasks(tasks_repository.due_within(days, dt.now().toordinal()), 'Задач с таким сроком нет')
+    except Exception as e:
+        print(f'Ошибка: {e}')
 
 def add_task():
-    tasks = get_tasks()
     id = get_free_id('tasks')
     title = input('Введите название задачи >> ')
     description = input('Введите описание задачи >> ')
     priority = ''
     while True:
         priority = input('Введите новый приоритет задачи (Высокий/Средний/Низкий) >> ')
-        if priority in ['Высокий', 'Средний', 'Низкий']:
+        if priority in PRIORITIES:
             break
         else:
              print('Приоритет некорректен. Выберите из набора (Высокий/Средний/Низкий)')
@@ -245,44 +2151,44 @@ def add_task():
         else:
             print('Дата некорректна. Введите в формате ДД-ММ-ГГГГ')
     new_task = Task(id = id, title = title, description = description, priority = priority, due_date = due_date)
-    tasks.append(new_task)
-    save_tasks(tasks)
+    tasks_repository.add(new_task)
     print(f'Задача "{title}" добавлена.')
 
 def do_task():
-    tasks = get_tasks()
-    if len(tasks) == 0:
+    if len(tasks_repository) == 0:
         print('Задачи отсутствуют')
     else:
         try:
             id = int(input('Введите id задачи >> '))
-            task = next(filter(lambda x: x.id == id, tasks), None)
+            task = tasks_repository.get(id)
             if task == None:
                 print('Задача не найдена')
             else:
+                task = tasks_repository.factory(task.to_dict())
                 task.done = True
                 print(f'Задача "{task.title}" отмечена выполненной')
-                save_tasks(tasks)
+                tasks_repository.update(task)
         except Exception as e:
             print(f'Ошибка: {e}')
 
 def update_task():
-    tasks = get_tasks()
-    if len(tasks) == 0:
+    if len(tasks_repository) == 0:
         print('Задачи отсутствуют')
     else:
         try:
             id = int(input('Введите id задачи >> '))
-            task = next(filter(lambda x: x.id == id, tasks), None)
+            task = tasks_repository.get(id)
             if task == None:
                 print('Задача не найдена')
             else:
+                #Правится копия: прерванный ввод не оставляет в кэше наполовину изменённую запись
+                task = tasks_repository.factory(task.to_dict())
                 task.title = input('Введите новое название задачи >> ')
                 task.description = input('Введите новое описание задачи >> ')
                 priority = ''
                 while True:
                     priority = input('Введите новый приоритет задачи (Высокий/Средний/Низкий) >> ')
-                    if priority in ['Высокий', 'Средний', 'Низкий']:
+                    if priority in PRIORITIES:
                         break
                     else:
                         print('Приоритет некорректен. Выберите из набора (Высокий/Средний/Низкий)')
@@ -296,44 +2202,34 @@ def update_task():
                         print('Дата некорректна. Введите в формате ДД-ММ-ГГГГ')
                 task.due_date = due_date
                 print(f'Задача "{task.title}" изменена')
-                save_tasks(tasks)
+                tasks_repository.update(task)
         except Exception as e:
             print(f'Ошибка: {e}')
 
 def delete_task():
-    tasks = get_tasks()
     try:
         id = int(input('Введите id задачи >> '))
-        tasks = [task for task in tasks if task.id != id]
-        save_tasks(tasks)
+        tasks_repository.delete(id)
         print('Задача удалена')
     except Exception as e:
         print(f'Ошибка: {e}')
 
 def export_tasks_to_csv():
-    try:
-        pd.DataFrame([task.to_dict() for task in get_tasks()]).to_csv(TASKS_EXPORT_FILE, index=False)
-        print(f'Задачи экспортированы в {TASKS_EXPORT_FILE}')
-    except Exception as e:
-        print(f'Ошибка: {e}')
+    export_to_csv('tasks', TASKS_EXPORT_FILE, f'Задачи экспортированы в {TASKS_EXPORT_FILE}')
 
 def import_tasks_from_csv():
     filename = input('Введите название файла (с расширением) для импорта задач >> ')
     try:
-        df = pd.read_csv(filename)
-        tasks = get_tasks()
-        for index, row in df.iterrows():
-            task = Task(id=int(row['id']), title=row['title'], description=row['description'], done=row['done'], priority=row['priority'], due_date=row['due_date'])
-            if task.id in [t.id for t in tasks]:
-                task.id = get_free_id('tasks')
-            tasks.append(task)
-            save_tasks(tasks)
+        count, rejected, elapsed = import_csv('tasks', filename)
         print(f'Задачи импортированы из {filename}')
+        print_import_stats(count, rejected, elapsed)
     except Exception as e:
         print(f'Ошибка: {e}')
 
 
 class Contact:
+    __slots__ = ('id', 'name', 'phone', 'email')
+
     def __init__(self, id: int, name: str, phone: str, email: str):
         self.id = id
         self.name = name
@@ -349,52 +2245,190 @@ class Contact:
         }
 
 def dict_to_contact(data):
-    return Contact(id=data['id'], name=data['name'], phone=data['phone'], email=data['email'])
+    return Contact(data['id'], to_text(data['name']), to_text(data['phone']), to_text(data['email']))
+
+def normalize_name(name):
+    return ' '.join(str(name).split()).casefold().replace('ё', 'е')
+
+def normalize_phone(phone):
+    digits = ''.join(c for c in str(phone) if c.isdigit())
+    #Российские номера: 8XXXXXXXXXX и +7XXXXXXXXXX - один и тот же номер
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    return digits
+
+def normalize_email(email):
+    return str(email).strip().lower()
+
+#Вторичные индексы контактов: точный поиск по имени, телефону и email (словари ключ -> множество id)
+#и отсортированные списки (ключ, id) для поиска по началу имени и по последним цифрам номера
+class ContactIndex:
+    def __init__(self):
+        self.keys = {}
+        self.by_name = {}
+        self.by_phone = {}
+        self.by_email = {}
+        self.names = []
+        self.phone_suffixes = []
+
+    def add(self, contact):
+        self.remove(contact.id)
+        name, phone, email = normalize_name(contact.name), normalize_phone(contact.phone), normalize_email(contact.email)
+        self.keys[contact.id] = (name, phone, email)
+        self.by_name.setdefault(name, set()).add(contact.id)
+        self.by_phone.setdefault(phone, set()).add(contact.id)
+        self.by_email.setdefault(email, set()).add(contact.id)
+        insort(self.names, (name, contact.id))
+        insort(self.phone_suffixes, (phone[::-1], contact.id))
+
+    #Старые ключи берутся из self.keys: объект контакта к этому моменту может быть уже изменён
+    def remove(self, id):
+        if id not in self.keys:
+            return
+        name, phone, email = self.keys.pop(id)
+        for index, key in ((self.by_name, name), (self.by_phone, phone), (self.by_email, email)):
+            index[key].discard(id)
+            if len(index[key]) == 0:
+                del index[key]
+        for entries, key in ((self.names, name), (self.phone_suffixes, phone[::-1])):
+            position = bisect_left(entries, (key, id))
+            if position < len(entries) and entries[position] == (key, id):
+                del entries[position]
+
+    def find_name(self, name):
+        return sorted(self.by_name.get(normalize_name(name), ()))
+
+    def find_phone(self, phone):
+        return sorted(self.by_phone.get(normalize_phone(phone), ()))
+
+    def find_email(self, email):
+        return sorted(self.by_email.get(normalize_email(email), ()))
+
+    def find_prefix(self, entries, prefix, limit=None):
+        found = []
+        position = bisect_left(entries, (prefix,))
+        while position < len(entries) and entries[position][0].startswith(prefix) and (limit == None or len(found) < limit):
+            found.append(entries[position][1])
+            position += 1
+        return found
+
+    def find_name_prefix(self, prefix, limit=None):
+        return self.find_prefix(self.names, normalize_name(prefix), limit)
+
+    def find_phone_suffix(self, suffix, limit=None):
+        digits = ''.join(c for c in str(suffix) if c.isdigit())
+        if len(digits) == 0:
+            return []
+        return self.find_prefix(self.phone_suffixes, digits[::-1], limit)
+
+    def to_dict(self):
+        return {'keys': [[id, *keys] for id, keys in self.keys.items()]}
+
+    #Построение по всем контактам: ключи нормализуются и раскладываются как в from_dict, списки сортируются один раз
+    #(add по одному контакту вставляет в середину списков - O(N^2) на весь раздел)
+    @staticmethod
+    def build(contacts):
+        return ContactIndex.from_dict({'keys': [[contact.id, normalize_name(contact.name), normalize_phone(contact.phone), normalize_email(contact.email)]
+                                                for contact in contacts]})
+
+    #Сохранённые ключи уже нормализованы: остаётся разложить их по словарям и спискам
+    @staticmethod
+    def from_dict(data):
+        index = ContactIndex()
+        for id, name, phone, email in data['keys']:
+            index.keys[id] = (name, phone, email)
+            index.by_name.setdefault(name, set()).add(id)
+            index.by_phone.setdefault(phone, set()).add(id)
+            index.by_email.setdefault(email, set()).add(id)
+        index.names = sorted((keys[0], id) for id, keys in index.keys.items())
+        index.phone_suffixes = sorted((keys[1][::-1], id) for id, keys in index.keys.items())
+        return index
+
+
+#Поиск контактов: в SQLite без загруженного кэша - по индексам нормализованных ключей (см. SQLITE_KEY_COLUMNS),
+#иначе - по ContactIndex. Методы возвращают id в том же порядке, что и ContactIndex.
+class ContactRepository(IndexedRepository):
+    def key_ids(self, key, value):
+        return self.storage().ids(f'{key} = ?', (value,))
+
+    #Ключи, начинающиеся с prefix, - диапазон [prefix, prefix + максимальный символ), он идёт по индексу
+    def prefix_ids(self, key, prefix, limit):
+        return self.storage().ids(f'{key} >= ? AND {key} < ?', (prefix, prefix + chr(sys.maxunicode)), f'{key}, id', limit)
+
+    def find_name(self, name):
+        if self.queries_storage():
+            return self.key_ids('name_key', normalize_name(name))
+        return self.index().find_name(name)
+
+    def find_phone(self, phone):
+        if self.queries_storage():
+            return self.key_ids('phone_key', normalize_phone(phone))
+        return self.index().find_phone(phone)
+
+    def find_email(self, email):
+        if self.queries_storage():
+            return self.key_ids('email_key', normalize_email(email))
+        return self.index().find_email(email)
+
+    def find_name_prefix(self, prefix, limit=None):
+        if self.queries_storage():
+            return self.prefix_ids('name_key', normalize_name(prefix), limit)
+        return self.index().find_name_prefix(prefix, limit)
+
+    def find_phone_suffix(self, suffix, limit=None):
+        if self.queries_storage():
+            digits = ''.join(c for c in str(suffix) if c.isdigit())
+            return self.prefix_ids('phone_suffix_key', digits[::-1], limit) if len(digits) > 0 else []
+        return self.index().find_phone_suffix(suffix, limit)
+
+contacts_repository = ContactRepository('contacts', dict_to_contact, ContactIndex)
 
 def get_contacts():
-    if not os.path.exists(CONTACTS_FILE):
-        return []
-    with open(CONTACTS_FILE, 'r') as file:
-        return [dict_to_contact(contact) for contact in json.load(file)]
+    return contacts_repository.all()
 
 def save_contacts(contacts):
-    with open(CONTACTS_FILE, 'w') as file:
-        json.dump([contact.to_dict() for contact in contacts], file)
+    contacts_repository.replace(contacts)
 
 def add_contact():
-    contacts = get_contacts()
     id = get_free_id('contacts')
     name = input('Введите имя контакта >> ')
     phone = input('Введите номер телефона контакта >> ')
     email = input('Введите email контакта >> ')
     new_contact = Contact(id = id, name = name, phone = phone, email = email)
-    contacts.append(new_contact)
-    save_contacts(contacts)
+    contacts_repository.add(new_contact)
     print(f'Контакт "{name}" добавлен.')
 
 def view_contacts():
-    contacts = get_contacts()
-    if len(contacts) == 0:
+    if contacts_repository.is_empty():
         print('Контакты отсутствуют')
     else:
+        options = ask_list_options('contacts')
         print('Список всех контактов:')
-        for contact in contacts:
-            print(f'id: {contact.id}, имя: {contact.name}, номер: {contact.phone}, email: {contact.email}')
+        if print_pages(iter_pages(contacts_repository, options), lambda contact: f'id: {contact.id}, имя: {contact.name}, номер: {contact.phone}, email: {contact.email}') == 0:
+            print('Контакты не найдены')
 
 def view_contact():
-    contacts = get_contacts()
-    if len(contacts) == 0:
+    if contacts_repository.is_empty():
         print('Контакты отсутствуют')
     else:
-        com = input('Искать контакт по имени или по номеру (имя/номер) >> ')
+        com = input('Искать контакт по имени, номеру, email, началу имени или концу номера (имя/номер/email/начало имени/конец номера) >> ')
         while True:
             try:
                 if com == 'имя':
                     name = input('Введите имя контакта >> ')
-                    contacts = [contact for contact in contacts if contact.name == name]
+                    contacts = contacts_repository.find(contacts_repository.find_name(name))
                 elif com == 'номер':
                     phone = input('Введите номер контакта >> ')
-                    contacts = [contact for contact in contacts if contact.phone == phone]          
+                    contacts = contacts_repository.find(contacts_repository.find_phone(phone))
+                elif com == 'email':
+                    email = input('Введите email контакта >> ')
+                    contacts = contacts_repository.find(contacts_repository.find_email(email))
+                elif com == 'начало имени':
+                    prefix = input('Введите начало имени >> ')
+                    contacts = contacts_repository.find(contacts_repository.find_name_prefix(prefix))
+                elif com == 'конец номера':
+                    suffix = input('Введите последние цифры номера >> ')
+                    contacts = contacts_repository.find(contacts_repository.find_phone_suffix(suffix))
                 else:
                     raise ValueError  
                 
@@ -411,60 +2445,51 @@ def view_contact():
                 return
 
 def update_contact():
-    contacts = get_contacts()
-    if len(contacts) == 0:
+    if len(contacts_repository) == 0:
         print('Контакты отсутствуют')
     else:
         try:
             id = int(input('Введите id контакта >> '))
-            contact = next(filter(lambda x: x.id == id, contacts), None)
+            contact = contacts_repository.get(id)
             if contact == None:
                 print('Контакт не найден')
             else:
+                #Правится копия: прерванный ввод не оставляет в кэше наполовину изменённую запись
+                contact = contacts_repository.factory(contact.to_dict())
                 tmp_name = input('Введи новое имя >> ')
                 tmp_phone = input('Введи новый номер >> ')
                 tmp_email = input('Введи новый email >> ')
                 contact.name = tmp_name
                 contact.phone = tmp_phone
                 contact.email = tmp_email
-                save_contacts(contacts)
+                contacts_repository.update(contact)
         except Exception as e:
             print(f'Ошибка: {e}')
 
 def delete_contact():
-    contacts = get_contacts()
     try:
         id = int(input('Введите id контакта >> '))
-        contacts = [contact for contact in contacts if contact.id != id]
-        save_tasks(contacts)
+        contacts_repository.delete(id)
         print('Контакт удален')
     except Exception as e:
         print(f'Ошибка: {e}')
 
 def export_contacts_to_csv():
-    try:
-        pd.DataFrame([contact.to_dict() for contact in get_contacts()]).to_csv(CONTACTS_EXPORT_FILE, index=False)
-        print(f'Контакты экспортированы в {CONTACTS_EXPORT_FILE}')
-    except Exception as e:
-        print(f'Ошибка: {e}')
+    export_to_csv('contacts', CONTACTS_EXPORT_FILE, f'Контакты экспортированы в {CONTACTS_EXPORT_FILE}')
 
 def import_contacts_from_csv():
     filename = input('Введите название файла (с расширением) для импорта контактов >> ')
     try:
-        df = pd.read_csv(filename)
-        contacts = get_contacts()
-        for index, row in df.iterrows():
-            contact = Contact(id=int(row['id']), name=row['name'], phone=row['phone'], email=row['email'])
-            if contact.id in [t.id for t in contact]:
-                contact.id = get_free_id('contacts')
-            contacts.append(contact)
-            save_contacts(contacts)
+        count, rejected, elapsed = import_csv('contacts', filename)
         print(f'Контакты импортированы из {filename}')
+        print_import_stats(count, rejected, elapsed)
     except Exception as e:
         print(f'Ошибка: {e}')
 
 
 class FinanceRecord:
+    __slots__ = ('id', 'amount', 'category', 'description', 'date')
+
     def __init__(self, id: int, amount: float, category: str, description: str, date: str = None):
         self.id = id
         self.amount = amount
@@ -482,20 +2507,529 @@ class FinanceRecord:
         }
 
 def dict_to_finance_record(data):
-    return FinanceRecord(id=data['id'], amount=data['amount'], description=data['description'], category=data['category'], date=data['date'])
+    return FinanceRecord(data['id'], data['amount'], data['category'], data['description'], data['date'])
+
+SECTION_MODELS = {'notes': Note, 'tasks': Task, 'contacts': Contact, 'finance': FinanceRecord}
+
+#Вычисляемые столбцы SQLite: столбец -> (поле записи, функция ключа, шаблон GLOB правильного ключа или None).
+#Даты - ключи ГГГГ-ММ-ДД для диапазонов и сортировки, контакты - нормализованные ключи поиска, как в ContactIndex
+#(для поиска по концу номера - цифры номера в обратном порядке)
+DATE_KEY_GLOB = '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+SQLITE_KEY_COLUMNS = {
+    'notes': {'timestamp_key': ('timestamp', sortable_timestamp, DATE_KEY_GLOB)},
+    'tasks': {'due_date_key': ('due_date', sortable_date, DATE_KEY_GLOB)},
+    'contacts': {'name_key': ('name', normalize_name, None), 'phone_key': ('phone', normalize_phone, None),
+                 'phone_suffix_key': ('phone', lambda phone: normalize_phone(phone)[::-1], None), 'email_key': ('email', normalize_email, None)},
+    'finance': {'date_key': ('date', sortable_date, DATE_KEY_GLOB)}
+}
+
+
+#Перестановка символов из формата ГГГГ-ММ-ДД (datetime64) в ДД-ММ-ГГГГ
+RU_DATE_ORDER = [8, 9, 4, 5, 6, 7, 0, 1, 2, 3]
+
+def reorder_dates(text, order):
+    chars = text.view('U1').reshape(-1, 10)[:, order]
+    return np.ascontiguousarray(chars).view('U10').ravel()
+
+def parse_finance_dates(dates):
+    ordinals = date_column_ordinals(dates)
+    invalid = (ordinals == 0).nonzero()[0]
+    if len(invalid) > 0:
+        raise ValueError(f'Некорректная дата: {list(dates)[invalid[0]]}')
+    return ordinals_to_dates(ordinals)
+
+def format_finance_dates(dates):
+    text = reorder_dates(np.datetime_as_string(dates, unit='D').astype('U10'), RU_DATE_ORDER)
+    text[np.isnat(dates)] = ''
+    return text
+
+#Файлы прежних версий могли сохранить некорректную дату (импорт csv её не проверял):
+#такие даты становятся NaT (пустая дата), а не ошибкой загрузки всей таблицы
+def finance_table_dates(dates):
+    ordinals = date_column_ordinals(dates)
+    result = ordinals_to_dates(ordinals)
+    invalid = (ordinals == 0).nonzero()[0]
+    if len(invalid) > 0:
+        result[invalid] = np.datetime64('NaT')
+        print(f'Предупреждение: некорректных дат в записях - {len(invalid)} (например, {list(dates)[invalid[0]]!r}), '
+              f'даты оставлены пустыми', file=sys.stderr)
+    return result
+
+#Суммы доходов и расходов по дням, месяцам и категориям, обновляемые при каждом изменении таблицы.
+#Для произвольного периода используются префиксные суммы по дням (пересчитываются лениво, дней немного).
+class FinanceRollup:
+    def __init__(self):
+        self.days = {}
+        self.months = {}
+        self.categories = {}
+        self.prefix = None
+
+    #sign = -1 вычитает записи (удаление или старая версия изменённой записи)
+    def add(self, dates, category_codes, amounts, sign=1):
+        if len(amounts) == 0:
+            return
+        income = np.where(amounts > 0, amounts, 0) * sign
+        expense = np.where(amounts < 0, amounts, 0) * sign
+        days = dates.astype(np.int64)
+        months = dates.astype('datetime64[M]').astype(np.int64)
+        for totals, keys in ((self.days, days), (self.months, months), (self.categories, category_codes)):
+            unique, inverse = np.unique(keys, return_inverse=True)
+            incomes = np.bincount(inverse, income, len(unique))
+            expenses = np.bincount(inverse, expense, len(unique))
+            for key, key_income, key_expense in zip(unique.tolist(), incomes.tolist(), expenses.tolist()):
+                total = totals.setdefault(key, [0.0, 0.0])
+                total[0] += key_income
+                total[1] += key_expense
+        self.prefix = None
+
+    def period(self, start, end):
+        if self.prefix == None:
+            days = np.array(sorted(self.days), np.int64)
+            sums = np.zeros((len(days) + 1, 2))
+            if len(days) > 0:
+                sums[1:] = np.cumsum([self.days[day] for day in days.tolist()], axis=0)
+            self.prefix = (days, sums)
+        days, sums = self.prefix
+        left = np.searchsorted(days, start.astype(np.int64), 'left')
+        right = np.searchsorted(days, end.astype(np.int64), 'right')
+        income, expense = sums[right] - sums[left]
+        #Округление убирает накопленную погрешность от прибавлений и вычитаний
+        return round(float(income), 2), round(float(expense), 2)
+
+    #Разбивка периода по месяцам: полностью попавшие месяцы берутся из месячных сумм, крайние - из префиксных
+    def months_in_period(self, start, end):
+        result = []
+        for month in np.arange(start.astype('datetime64[M]'), end.astype('datetime64[M]') + 1):
+            first, last = month.astype('datetime64[D]'), (month + 1).astype('datetime64[D]') - 1
+            if first >= start and last <= end:
+                income, expense = [round(total, 2) for total in self.months.get(int(month.astype(np.int64)), [0.0, 0.0])]
+            else:
+                income, expense = self.period(max(first, start), min(last, end))
+            result.append((month, income, expense))
+        return result
+
+FINANCE_TABLE_COLUMNS = ['ids', 'amounts', 'dates', 'category_codes', 'description_offsets', 'description_lengths', 'alive']
+FINANCE_TABLE_INDEX_LAG = 1024
+
+#Колоночное хранение финансовых записей: по массиву NumPy на поле, категории - кодами, описания - в общем буфере байтов.
+#Удалённые строки помечаются в alive и вычищаются, когда их становится больше половины.
+class FinanceTable:
+    def __init__(self, capacity: int = 16):
+        self.size = 0
+        self.deleted = 0
+        self.ids = np.zeros(capacity, np.int64)
+        self.amounts = np.zeros(capacity, np.float64)
+        self.dates = np.zeros(capacity, 'datetime64[D]')
+        self.category_codes = np.zeros(capacity, np.int32)
+        self.description_offsets = np.zeros(capacity, np.int64)
+        self.description_lengths = np.zeros(capacity, np.int32)
+        self.alive = np.zeros(capacity, bool)
+        #Описания из двоичного снимка (массив байтов в отображении файла); смещения новых описаний идут после него
+        self.description_base = b''
+        self.description_data = bytearray()
+        self.categories = []
+        self.category_index = {}
+        #Отсортированные id -> строки; строки, добавленные после построения, лежат в recent_rows
+        self.id_index = None
+        self.recent_rows = {}
+        #Строки, отсортированные по дате; новые и изменённые после построения строки лежат в date_pending
+        self.date_index = None
+        self.date_pending = []
+        #None - суммы ещё не считались (таблица из двоичного снимка), см. totals
+        self.rollup = FinanceRollup()
+
+    #Таблица прямо на столбцах двоичного снимка, без чтения записей: изменённые в памяти страницы копируются (ACCESS_COPY),
+    #новые строки - в выросших массивах (reserve). Индекс id готов сразу (строки снимка упорядочены по id),
+    #суммы для отчётов считаются при первом обращении.
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        table = cls(0)
+        count = len(snapshot)
+        table.size = count
+        table.ids = snapshot.array('id')
+        table.amounts = snapshot.array('amount')
+        table.dates = snapshot.array('date')
+        table.category_codes = snapshot.array('category')
+        table.categories = list(snapshot.columns['category']['values'])
+        table.category_index = {category: code for code, category in enumerate(table.categories)}
+        table.description_offsets = snapshot.array('description', 'offsets')
+        table.description_lengths = snapshot.array('description', 'lengths')
+        table.description_base = snapshot.array('description', 'heap')
+        table.alive = np.ones(count, bool)
+        table.id_index = (table.ids, np.arange(count))
+        table.rollup = None
+        return table
+
+    def totals(self):
+        if self.rollup == None:
+            self.rollup = FinanceRollup()
+            rows = self.live_rows()
+            self.rollup.add(self.dates[rows], self.category_codes[rows], self.amounts[rows])
+        return self.rollup
+
+    def add_totals(self, rows, sign=1):
+        if self.rollup != None:
+            self.rollup.add(self.dates[rows], self.category_codes[rows], self.amounts[rows], sign)
+
+    def __len__(self):
+        return self.size - self.deleted
+
+    def reserve(self, count):
+        needed = self.size + count
+        if needed <= len(self.ids):
+            return
+        capacity = max(needed, 2 * len(self.ids))
+        for name in FINANCE_TABLE_COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(capacity, column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def category_code(self, category):
+        code = self.category_index.get(category)
+        if code == None:
+            code = len(self.categories)
+            self.categories.append(category)
+            self.category_index[category] = code
+        return code
+
+    def live_rows(self):
+        return np.flatnonzero(self.alive[:self.size])
+
+    def live_ids(self):
+        return self.ids[self.live_rows()]
+
+    def build_id_index(self):
+        if self.id_index == None:
+            rows = self.live_rows()
+            order = np.argsort(self.ids[rows], kind='stable')
+            self.id_index = (self.ids[rows][order], rows[order])
+            self.recent_rows = {}
+        return self.id_index
+
+    def row(self, id):
+        row = self.recent_rows.get(id)
+        if row == None:
+            ids, rows = self.build_id_index()
+            position = np.searchsorted(ids, id)
+            if position < len(ids) and ids[position] == id:
+                row = int(rows[position])
+        if row != None and self.alive[row]:
+            return row
+        return None
+
+    def append(self, records):
+        count = len(records)
+        self.reserve(count)
+        rows = slice(self.size, self.size + count)
+        self.ids[rows] = np.fromiter((record['id'] for record in records), np.int64, count)
+        self.amounts[rows] = np.fromiter((record['amount'] for record in records), np.float64, count)
+        self.dates[rows] = finance_table_dates([record['date'] for record in records])
+        self.category_codes[rows] = np.fromiter((self.category_code(to_text(record['category'])) for record in records), np.int32, count)
+        encoded = [to_text(record['description']).encode('utf-8') for record in records]
+        lengths = np.fromiter(map(len, encoded), np.int32, count)
+        self.description_lengths[rows] = lengths
+        self.description_offsets[rows] = len(self.description_base) + len(self.description_data) + np.cumsum(lengths) - lengths
+        self.description_data += b''.join(encoded)
+        self.alive[rows] = True
+        self.add_totals(rows)
+        lag = max(FINANCE_TABLE_INDEX_LAG, len(self) // 100)
+        if len(self.recent_rows) + count > lag:
+            self.id_index = None
+            self.recent_rows = {}
+        else:
+            self.recent_rows.update(zip(self.ids[rows].tolist(), range(self.size, self.size + count)))
+        if len(self.date_pending) + count > lag:
+            self.date_index = None
+            self.date_pending = []
+        else:
+            self.date_pending.extend(range(self.size, self.size + count))
+        self.size += count
+
+    #Строки для массива id (-1, если записи нет): сначала среди добавленных после построения индекса (recent_rows),
+    #остальные одним поиском по отсортированному индексу. Индекс пересобирается только в append при превышении отставания.
+    def rows_for(self, ids):
+        found = np.full(len(ids), -1, np.int64)
+        if len(self) == 0:
+            return found
+        ids = np.asarray(ids, np.int64)
+        rest = np.arange(len(ids))
+        if len(self.recent_rows) > 0:
+            recent = np.fromiter((self.recent_rows.get(id, -1) for id in ids.tolist()), np.int64, len(ids))
+            found[recent >= 0] = recent[recent >= 0]
+            rest = (recent < 0).nonzero()[0]
+        sorted_ids, rows = self.build_id_index()
+        if len(sorted_ids) > 0 and len(rest) > 0:
+            positions = np.minimum(np.searchsorted(sorted_ids, ids[rest]), len(sorted_ids) - 1)
+            matched = sorted_ids[positions] == ids[rest]
+            found[rest[matched]] = rows[positions[matched]]
+        hit = (found >= 0).nonzero()[0]
+        found[hit[~self.alive[found[hit]]]] = -1
+        return found
+
+    def put_many(self, records):
+        rows = self.rows_for(np.fromiter((record['id'] for record in records), np.int64, len(records)))
+        for position in np.flatnonzero(rows >= 0).tolist():
+            self.set(int(rows[position]), records[position])
+        if (rows < 0).any():
+            self.append([records[position] for position in np.flatnonzero(rows < 0).tolist()])
+
+    def set(self, row, record):
+        self.add_totals(slice(row, row + 1), -1)
+        self.amounts[row] = record['amount']
+        self.dates[row] = finance_table_dates([record['date']])[0]
+        self.date_pending.append(row)
+        self.category_codes[row] = self.category_code(to_text(record['category']))
+        encoded = to_text(record['description']).encode('utf-8')
+        self.description_offsets[row] = len(self.description_base) + len(self.description_data)
+        self.description_lengths[row] = len(encoded)
+        self.description_data += encoded
+        self.add_totals(slice(row, row + 1))
+
+    def remove(self, id):
+        row = self.row(id)
+        if row == None:
+            return
+        self.alive[row] = False
+        self.deleted += 1
+        self.add_totals(slice(row, row + 1), -1)
+        if self.deleted > max(FINANCE_TABLE_INDEX_LAG, self.size // 2):
+            self.pack()
+
+    def build_date_index(self):
+        if self.date_index == None:
+            rows = self.live_rows()
+            order = np.argsort(self.dates[rows], kind='stable')
+            self.date_index = (self.dates[rows][order], rows[order])
+            self.date_pending = []
+        return self.date_index
+
+    #Живые строки с датой в [start, end] в порядке добавления: бинарный поиск по индексу + проверка отложенных строк
+    def date_range_rows(self, start, end):
+        dates, rows = self.build_date_index()
+        left, right = np.searchsorted(dates, start, 'left'), np.searchsorted(dates, end, 'right')
+        found = rows[left:right]
+        found = found[self.alive[found] & (self.dates[found] == dates[left:right])]
+        if len(self.date_pending) > 0:
+            if len(self.date_pending) > max(FINANCE_TABLE_INDEX_LAG, len(self) // 100):
+                self.date_index = None
+                return self.date_range_rows(start, end)
+            pending = np.unique(np.array(self.date_pending, np.int64))
+            found = found[~np.isin(found, pending)]
+            pending = pending[self.alive[pending] & (self.dates[pending] >= start) & (self.dates[pending] <= end)]
+            found = np.concatenate([found, pending])
+        return np.sort(found)
+
+    #Пересборка только из живых строк: освобождает место удалённых записей и старых версий описаний
+    def pack(self):
+        packed = FinanceTable()
+        packed.append(self.to_dicts())
+        self.__dict__.update(packed.__dict__)
+
+    def description(self, row):
+        start, length, base = int(self.description_offsets[row]), int(self.description_lengths[row]), len(self.description_base)
+        if start < base:
+            return bytes(self.description_base[start:start + length]).decode('utf-8')
+        return self.description_data[start - base:start - base + length].decode('utf-8')
+
+    def record(self, row):
+        return FinanceRecord(id=int(self.ids[row]), amount=float(self.amounts[row]), category=self.categories[self.category_codes[row]],
+                             description=self.description(row), date=str(format_finance_dates(self.dates[row:row + 1])[0]))
+
+    def records(self, rows=None):
+        return [self.record(row) for row in (self.live_rows() if rows is None else rows)]
+
+    #Столбцы в формате to_dict: для DataFrame и снимка без создания объектов FinanceRecord
+    def columns(self, rows=None):
+        if rows is None:
+            rows = self.live_rows()
+        offsets = self.description_offsets[rows].tolist()
+        lengths = self.description_lengths[rows].tolist()
+        data = bytes(self.description_base) + bytes(self.description_data)
+        return {
+            'id': self.ids[rows].tolist(),
+            'amount': self.amounts[rows].tolist(),
+            'category': [self.categories[code] for code in self.category_codes[rows].tolist()],
+            'description': [data[offset:offset + length].decode('utf-8') for offset, length in zip(offsets, lengths)],
+            'date': format_finance_dates(self.dates[rows]).tolist()
+        }
+
+    def to_dicts(self, rows=None):
+        return columns_to_records(self.columns(rows))
+
+
+class FinanceRepository(Repository):
+    def load(self, records):
+        if isinstance(records, BinarySnapshot):
+            self.records = FinanceTable.from_snapshot(records)
+        else:
+            self.records = FinanceTable()
+            self.records.append(list(records))
+
+    def put_many(self, objs):
+        self.records.put_many([obj.to_dict() for obj in objs])
+
+    def remove(self, id):
+        self.records.remove(id)
+
+    def snapshot(self):
+        return self.records.columns()
+
+    def column_chunks(self, size=EXPORT_CHUNK_SIZE):
+        table = self.refresh()
+        rows = table.live_rows()
+        for start in range(0, len(rows), size):
+            yield table.columns(rows[start:start + size])
+
+    def all(self):
+        return self.refresh().records()
+
+    def get(self, id):
+        if self.queries_storage():
+            return super().get(id)
+        table = self.refresh()
+        row = table.row(id)
+        return None if row == None else table.record(row)
+
+    def ids(self):
+        return self.refresh().live_ids()
+
+    def __len__(self):
+        if self.queries_storage():
+            return super().__len__()
+        return len(self.refresh())
+
+    def max_id(self):
+        if self.queries_storage():
+            return super().max_id()
+        ids = self.ids()
+        return int(ids.max()) if len(ids) > 0 else 0
+
+    def find(self, ids):
+        if self.queries_storage():
+            return super().find(ids)
+        table = self.refresh()
+        return table.records(table.rows_for(np.asarray(ids, np.int64)))
+
+    #Строки таблицы, упорядоченные по (значение, id): массивы строк, значений и id. С фильтрами упорядочиваются
+    #только отобранные строки (для периода - k строк из индекса дат, без прохода по всей таблице)
+    def sorted_rows(self, sort, start=None, end=None, category=None):
+        table = self.refresh()
+        if self.sort_stamp != self.stamp:
+            self.sort_cache, self.sort_stamp = {}, self.stamp
+        key = (sort, start, end, category)
+        if key not in self.sort_cache:
+            rows = self.filter_rows(start, end, category) if start is not None or category != None else table.live_rows()
+            if sort == 'category':
+                values = np.array(table.categories + [''])[table.category_codes[rows]]
+            elif sort == 'date':
+                #Даты - номерами дней: пустая дата (NaT - наименьшее int64) идёт первой, как пустой date_key в SQLite
+                values = table.dates[rows].view(np.int64)
+            else:
+                values = {'id': table.ids, 'amount': table.amounts}[sort][rows]
+            order = np.lexsort((table.ids[rows], values))
+            self.sort_cache[key] = (rows[order], values[order], table.ids[rows][order])
+        return self.sort_cache[key]
+
+    #Фильтры списка: период start..end (datetime64, задаются вместе) и категория. В SQLite без загруженного кэша -
+    #условие запроса по индексам date_key и category, иначе - строки таблицы из индекса дат
+    def filter_sql(self, start=None, end=None, category=None):
+        conditions, params = [], []
+        if start is not None:
+            conditions.append('date_key BETWEEN ? AND ?')
+            params += [str(start), str(end)]
+        if category != None:
+            conditions.append('category = ?')
+            params.append(category)
+        return ' AND '.join(conditions), params
+
+    def filter_rows(self, start=None, end=None, category=None):
+        table = self.refresh()
+        rows = table.date_range_rows(start, end) if start is not None else table.live_rows()
+        if category != None:
+            rows = rows[table.category_codes[rows] == table.category_index.get(category, -1)]
+        return rows
+
+    #Записи по фильтрам в порядке id: общее число и словари записей с offset по offset + limit
+    def filter_records(self, start=None, end=None, category=None, offset=0, limit=None):
+        if self.queries_storage():
+            where, params = self.filter_sql(start, end, category)
+            storage = self.storage()
+            records = storage.query(where, params, limit=-1 if limit == None else limit, offset=offset)
+            return storage.count(where, params), records
+        rows = np.sort(self.filter_rows(start, end, category))
+        return len(rows), self.refresh().to_dicts(rows[offset:None if limit == None else offset + limit])
+
+    #Доходы и расходы за период, по месяцам периода и по категории: в SQLite без кэша - суммами в запросе
+    def period_totals(self, start, end):
+        if self.queries_storage():
+            income, expense = self.storage().totals('date_key BETWEEN ? AND ?', (str(start), str(end)))[0][1:]
+            return round(income, 2), round(expense, 2)
+        return self.refresh().totals().period(start, end)
+
+    def month_totals(self, start, end):
+        if self.queries_storage():
+            totals = {month: (income, expense) for month, income, expense in
+                      self.storage().totals('date_key BETWEEN ? AND ?', (str(start), str(end)), 'substr(date_key, 1, 7)')}
+            return [(month, *[round(total, 2) for total in totals.get(str(month), (0.0, 0.0))])
+                    for month in np.arange(start.astype('datetime64[M]'), end.astype('datetime64[M]') + 1)]
+        return self.refresh().totals().months_in_period(start, end)
+
+    def category_totals(self, category):
+        if self.queries_storage():
+            income, expense = self.storage().totals('category = ?', (category,))[0][1:]
+        else:
+            table = self.refresh()
+            income, expense = table.totals().categories.get(table.category_index.get(category, -1), [0.0, 0.0])
+        return round(income, 2), round(expense, 2)
+
+    #То же, что Repository.page, но на столбцах таблицы; start, end и category - необязательные фильтры (см. filter_sql)
+    def page(self, sort='id', reverse=False, after=None, limit=LIST_PAGE_SIZE, offset=0, start=None, end=None, category=None):
+        if self.queries_storage():
+            where, params = self.filter_sql(start, end, category)
+            records, cursor = self.storage().page(SORT_FIELDS[self.section][sort][1], reverse, after, limit, offset, where, params)
+            return [self.factory(record) for record in records], cursor
+        table = self.refresh()
+        rows, values, ids = self.sorted_rows(sort, start, end, category)
+        position = None
+        if after != None:
+            value = date_cursor_day(after[0]) if sort == 'date' else after[0]
+            left, right = np.searchsorted(values, value, 'left'), np.searchsorted(values, value, 'right')
+            position = int(left + np.searchsorted(ids[left:right], after[1], 'left' if reverse else 'right'))
+        if not reverse:
+            start = (0 if position == None else position) + offset
+            chunk = rows[start:start + limit]
+            last = start + len(chunk) - 1
+            more = start + limit < len(rows)
+        else:
+            end = (len(rows) if position == None else position) - offset
+            chunk = rows[max(end - limit, 0):max(end, 0)][::-1]
+            last = max(end - limit, 0)
+            more = end - limit > 0
+        cursor = None
+        if more and len(chunk) > 0:
+            cursor = [day_cursor_date(values[last]) if sort == 'date' else values[last].item(), int(ids[last])]
+        return table.records(chunk), cursor
+
+#Значение курсора для сортировки по дате - ключ ГГГГ-ММ-ДД, как date_key в SQLite ('' для пустой даты),
+#поэтому курсор одного пути подходит другому
+NAT_DAY = np.datetime64('NaT', 'D').view(np.int64)
+
+def day_cursor_date(day):
+    return '' if day == NAT_DAY else str(np.int64(day).view('datetime64[D]'))
+
+def date_cursor_day(date):
+    return NAT_DAY if date == '' else np.datetime64(date, 'D').view(np.int64)
+
+finance_records_repository = FinanceRepository('finance', dict_to_finance_record)
 
 def get_finance_records():
-    if not os.path.exists(FINANCE_FILE):
-        return []
-    with open(FINANCE_FILE, 'r') as file:
-        return [dict_to_finance_record(finance_record) for finance_record in json.load(file)]
+    return finance_records_repository.all()
 
 def save_finance_records(finance_records):
-    with open(FINANCE_FILE, 'w') as file:
-        json.dump([finance_record.to_dict() for finance_record in finance_records], file)
+    finance_records_repository.replace(finance_records)
 
 def add_finance_record():
-    finance_records = get_finance_records()
     id = get_free_id('finance')
     neg = False
 
@@ -526,13 +3060,11 @@ def add_finance_record():
         else:
             print('Дата некорректна. Введите в формате ДД-ММ-ГГГГ')
     new_record = FinanceRecord(id = id, amount = amount, description = description, category = category, date = date)
-    finance_records.append(new_record)
-    save_finance_records(finance_records)
+    finance_records_repository.add(new_record)
     print(f'Операция добавлена.')
 
 def view_finance_records():
-    finance_records = get_finance_records()
-    if len(finance_records) == 0:
+    if finance_records_repository.is_empty():
         print('Записи отсутствуют')
     else:
         while True:
@@ -546,21 +3078,27 @@ def view_finance_records():
                             break
                         else:
                             print('Дата некорректна. Введите в формате ДД-ММ-ГГГГ')
-                    finance_records = [finance_record for finance_record in finance_records if finance_record.date == inp]
+                    date = ordinals_to_dates([date_ordinal(inp)])[0]
+                    filters = {'start': date, 'end': date}
                     break
                 elif com == 'категория':
                     inp = input('Введите категорию >> ')
-                    finance_records = [finance_record for finance_record in finance_records if finance_record.category == inp]
+                    filters = {'category': inp}
+                    income, expense = finance_records_repository.category_totals(inp)
+                    print(f'Итого по категории: доход {income}, расход {expense}')
                     break  
                 elif com == 'ничего':
+                    filters = {}
                     break      
                 else:
                     raise ValueError                
             except Exception as e:
                 print(f'Ошибка: {e}')
+        options = ask_list_options('finance')
         print('Список записей:')
-        for finance_record in finance_records:
-            print(f'id: {finance_record.id}; размер: {finance_record.amount}; дата: {finance_record.date}; категория: {finance_record.category}; описание: {finance_record.description}')
+        if print_pages(iter_pages(finance_records_repository, options, **filters), lambda finance_record: f'id: {finance_record.id}; размер: {finance_record.amount}; '
+                       f'дата: {finance_record.date}; категория: {finance_record.category}; описание: {finance_record.description}') == 0:
+            print('Записи не найдены')
 
 def get_finance_analysis():
     l, r = '', ''
@@ -576,73 +3114,824 @@ def get_finance_analysis():
             break
         else:
             print('Дата некорректна. Введите в формате ДД-ММ-ГГГГ')
-    finance_records = get_finance_records()
-    if len(finance_records) == 0:
+    if finance_records_repository.is_empty():
         print('Записи отсутствуют')
     else:
         print(f'Финансовый отчёт за период с {l} по {r}:')
-        date1 = dt.strptime(l, "%d-%m-%Y")
-        date2 = dt.strptime(r, "%d-%m-%Y")
-        finance_records = [finance_record for finance_record in finance_records if date1 <= dt.strptime(finance_record.date, "%d-%m-%Y") <= date2]
-        income = sum([finance_record.amount for finance_record in finance_records if finance_record.amount > 0])
-        outcome = sum([finance_record.amount for finance_record in finance_records if finance_record.amount < 0])
+        date1, date2 = ordinals_to_dates([date_ordinal(l), date_ordinal(r)])
+        income, outcome = finance_records_repository.period_totals(date1, date2)
         print(f"Доход: {income}")
         print(f"Расход: {outcome}")
         print(f"Остаток: {income-outcome}")
+        months = finance_records_repository.month_totals(date1, date2)
+        if len(months) > 1:
+            print('По месяцам:')
+            for month, month_income, month_outcome in months:
+                print(f'{str(month)[5:]}-{str(month)[:4]}: доход {month_income}, расход {month_outcome}')
+        count, records = finance_records_repository.filter_records(date1, date2)
         try:
-            pd.DataFrame([finance_record.to_dict() for finance_record in finance_records]).to_csv(f'finance_report_{l}_{r}.csv', index=False)
+            write_csv(f'finance_report_{l}_{r}.csv', SECTION_COLUMNS['finance'], ([record[column] for column in SECTION_COLUMNS['finance']] for record in records))
             print(f'Подробная информация сохранена в файле finance_report_{l}_{r}.csv')
         except Exception as e:
             print(f'Ошибка при экспорте: {e}')    
 
 def delete_finance_record():
-    finance_records = get_finance_records()
     try:
         id = int(input('Введите id записи >> '))
-        finance_records = [finance_record for finance_record in finance_records if finance_record.id != id]
-        save_finance_records(finance_records)
+        finance_records_repository.delete(id)
         print('Запись удалена')
     except Exception as e:
         print(f'Ошибка: {e}')
 
 def export_finance_records_to_csv():
-    try:
-        pd.DataFrame([finance_record.to_dict() for finance_record in get_finance_records()]).to_csv(FINANCE_EXPORT_FILE, index=False)
-        print(f'Финансовые записи экспортированы в {FINANCE_EXPORT_FILE}')
-    except Exception as e:
-        print(f'Ошибка: {e}')
+    export_to_csv('finance', FINANCE_EXPORT_FILE, f'Финансовые записи экспортированы в {FINANCE_EXPORT_FILE}')
 
 def import_finance_records_from_csv():
     filename = input('Введите название файла (с расширением) для импорта финансовых записей >> ')
     try:
-        df = pd.read_csv(filename)
-        finance_records = get_finance_records()
-        for index, row in df.iterrows():
-            finance_record = FinanceRecord(id = int(row['id']), amount = row['amount'], description = row['description'], category = row['category'], date = row['date'])
-            if finance_record.id in [r.id for r in finance_records]:
-                finance_record.id = get_free_id('finance')
-            finance_records.append(finance_record)
-            save_finance_records(finance_records)
+        count, rejected, elapsed = import_csv('finance', filename)
         print(f'Финансовые записи импортированы из {filename}')
+        print_import_stats(count, rejected, elapsed)
     except Exception as e:
         print(f'Ошибка: {e}')
 
 
+#Калькулятор: выражение разбирается алгоритмом сортировочной станции в программу для стекового вычислителя (обратная польская запись)
+#и компилируется один раз - скомпилированные выражения хранятся в LRU-кэше. eval не используется: допустимы только числа,
+#переменные, скобки и операции + - * / // ** (в том числе унарные + и -). Части выражения без переменных вычисляются при компиляции,
+#поэтому выражение без переменных после первого раза берётся из кэша готовым. Переменные - числа или столбцы NumPy
+#(списки приводятся к массивам), со столбцами выражение вычисляется сразу для всех строк.
+class CalcError(Exception):
+    pass
+
+CALC_TOKEN_PATTERN = re.compile(r'(\d+\.?\d*|\.\d+)|([^\W\d]\w*)|(\*\*|//|[-+*/()])|(\S)')
+#Приоритет и правая ассоциативность операций; унарные минус и плюс слабее степени: -2**2 = -4, 2**-1 = 0.5
+CALC_OPERATORS = {'+': (1, False), '-': (1, False), '*': (2, False), '/': (2, False), '//': (2, False),
+                  'neg': (3, True), 'pos': (3, True), '**': (4, True)}
+
+def calc_multiply(a, b):
+    if type(a) == int and type(b) == int and a.bit_length() + b.bit_length() > CALC_MAX_INT_BITS:
+        raise CalcError(f'Результат больше {CALC_MAX_INT_BITS} бит')
+    return a * b
+
+def calc_power(a, b):
+    if type(a) == int and type(b) == int and b > 0 and abs(a) > 1 and (abs(a).bit_length() - 1) * b > CALC_MAX_INT_BITS:
+        raise CalcError(f'Результат больше {CALC_MAX_INT_BITS} бит')
+    return a ** b
+
+CALC_FUNCTIONS = {'+': lambda a, b: a + b, '-': lambda a, b: a - b, '*': calc_multiply, '/': lambda a, b: a / b,
+                  '//': lambda a, b: a // b, '**': calc_power, 'neg': lambda a: -a, 'pos': lambda a: +a}
+
+def tokenize_expression(source):
+    tokens = []
+    for number, name, operator, invalid in CALC_TOKEN_PATTERN.findall(source):
+        if invalid:
+            raise CalcError(f'Недопустимый символ: {invalid!r}')
+        if number:
+            tokens.append(('number', float(number) if '.' in number else int(number)))
+        elif name:
+            tokens.append(('name', name))
+        else:
+            tokens.append(('operator', operator))
+    return tokens
+
+#Сортировочная станция: токены в обратную польскую запись (числа, имена и операции)
+def parse_expression(source):
+    output, stack, expect_operand = [], [], True
+    for kind, value in tokenize_expression(source):
+        if kind != 'operator':
+            if not expect_operand:
+                raise CalcError('Пропущена операция между числами')
+            output.append((kind, value))
+            expect_operand = False
+        elif value == '(':
+            if not expect_operand:
+                raise CalcError('Пропущена операция перед скобкой')
+            stack.append(value)
+        elif value == ')':
+            if expect_operand:
+                raise CalcError('Пустые скобки или пропущено число')
+            while len(stack) > 0 and stack[-1] != '(':
+                output.append(('operator', stack.pop()))
+            if len(stack) == 0:
+                raise CalcError('Лишняя закрывающая скобка')
+            stack.pop()
+        elif expect_operand:
+            if value not in ('+', '-'):
+                raise CalcError(f'Пропущено число перед {value}')
+            stack.append('neg' if value == '-' else 'pos')
+        else:
+            precedence, right = CALC_OPERATORS[value]
+            while len(stack) > 0 and stack[-1] != '(' and (CALC_OPERATORS[stack[-1]][0] > precedence or
+                                                           (CALC_OPERATORS[stack[-1]][0] == precedence and not right)):
+                output.append(('operator', stack.pop()))
+            stack.append(value)
+            expect_operand = True
+    if expect_operand:
+        raise CalcError('Выражение не закончено')
+    while len(stack) > 0:
+        if stack[-1] == '(':
+            raise CalcError('Не закрыта скобка')
+        output.append(('operator', stack.pop()))
+    return output
+
+def calc_apply(function, args):
+    try:
+        return function(*args)
+    except ZeroDivisionError:
+        raise CalcError('Деление на ноль')
+    except OverflowError:
+        raise CalcError('Слишком большое число')
+    except (ValueError, TypeError) as e:
+        raise CalcError(str(e))
+
+class Expression:
+    def __init__(self, source: str, program: list):
+        self.source = source
+        #Шаги программы: ('value', число), ('name', имя), ('apply', функция, число аргументов)
+        self.program = program
+        self.variables = sorted({step[1] for step in program if step[0] == 'name'})
+
+    def evaluate(self, variables=None):
+        variables = variables or {}
+        stack = []
+        for step in self.program:
+            if step[0] == 'value':
+                stack.append(step[1])
+            elif step[0] == 'name':
+                if step[1] not in variables:
+                    raise CalcError(f'Неизвестная переменная: {step[1]}')
+                value = variables[step[1]]
+                stack.append(np.asarray(value) if isinstance(value, (list, tuple)) else value)
+            else:
+                args = stack[-step[2]:]
+                del stack[-step[2]:]
+                stack.append(calc_apply(step[1], args))
+        return stack[0]
+
+@lru_cache(maxsize=CALC_CACHE_SIZE)
+def compile_expression(source):
+    if len(source) > CALC_MAX_LENGTH:
+        raise CalcError(f'Выражение длиннее {CALC_MAX_LENGTH} символов')
+    program = []
+    for kind, value in parse_expression(source):
+        if kind == 'number':
+            program.append(('value', value))
+        elif kind == 'name':
+            program.append(('name', value))
+        else:
+            count = 1 if value in ('neg', 'pos') else 2
+            if all(step[0] == 'value' for step in program[len(program) - count:]):
+                #Свёртка констант: операция над числами выполняется сразу
+                result = calc_apply(CALC_FUNCTIONS[value], [step[1] for step in program[len(program) - count:]])
+                del program[len(program) - count:]
+                program.append(('value', result))
+            else:
+                program.append(('apply', CALC_FUNCTIONS[value], count))
+    return Expression(source, program)
+
+#Пакетное вычисление выражений с общими переменными (числа или столбцы одинаковой длины)
+def evaluate_expressions(sources, variables=None):
+    return [compile_expression(source).evaluate(variables) for source in sources]
+
+#Переменные калькулятора в меню (x = выражение), живут до выхода из программы
+calc_variables = {}
+CALC_ASSIGNMENT_PATTERN = re.compile(r'^\s*([^\W\d]\w*)\s*=(?!=)(.*)$')
+
 def calculate():
     while True:
-        s = input('Введите выражение (дробные числа через вводите точку) >> ')
+        s = input('Введите выражение или присваивание "имя = выражение" (дробные числа вводите через точку) >> ')
         try:
-            check = lambda x: True if x in '0123456789+-/*(). ' else False
-            if all([check(c) for c in s]):
-                res = eval(s)
-                print(f'Результат: {res}')
-                break
+            assignment = CALC_ASSIGNMENT_PATTERN.match(s)
+            if assignment != None:
+                name, s = assignment.groups()
+            res = compile_expression(s.strip()).evaluate(calc_variables)
+            if assignment != None:
+                calc_variables[name] = res
+                print(f'{name} = {res}')
             else:
-                raise SyntaxError('Введены неверные символы. Разрешены символы из данного набора: 0123456789+-/*().')
+                print(f'Результат: {res}')
+            break
         except Exception as e:
             print(f'Ошибка: {e}. Пожалуйста, введите корректный пример')
     
 
+#Пакетный режим: команды из аргументов или поток JSON-строк, например
+#{"section": "tasks", "op": "add", "data": {"title": "Отчёт", "due_date": "01-02-2024"}}
+#{"section": "tasks", "op": "done", "id": 5}
+#Данные загружаются один раз, изменения записываются пачками по BATCH_COMMIT_SIZE операций на раздел
+BATCH_DEFAULTS = {
+    'notes': {'title': '', 'content': '', 'timestamp': None},
+    'tasks': {'description': '', 'done': False, 'priority': 'Средний'},
+    'contacts': {'phone': '', 'email': ''},
+    'finance': {'category': '', 'description': ''}
+}
+
+def make_record(section, data):
+    unknown = [key for key in data if key not in SECTION_COLUMNS[section]]
+    if len(unknown) > 0:
+        raise ValueError(f'неизвестные поля: {", ".join(unknown)}')
+    record = dict(BATCH_DEFAULTS[section], **data)
+    missing = [column for column in SECTION_COLUMNS[section] if column not in record]
+    if len(missing) > 0:
+        raise ValueError(f'не заданы поля: {", ".join(missing)}')
+    record['id'] = int(record['id'])
+    if section == 'tasks':
+        if record['priority'] not in PRIORITIES:
+            raise ValueError(f'приоритет некорректен: {record["priority"]}')
+        if not validate_date(record['due_date']):
+            raise ValueError(f'дата некорректна: {record["due_date"]}')
+        if isinstance(record['done'], str):
+            record['done'] = record['done'].lower() in ('true', '1', 'да')
+        record['done'] = bool(record['done'])
+    elif section == 'finance':
+        record['amount'] = float(record['amount'])
+        if not validate_date(record['date']):
+            raise ValueError(f'дата некорректна: {record["date"]}')
+    return record
+
+class BatchExecutor:
+    def __init__(self, commit_size: int = BATCH_COMMIT_SIZE):
+        self.commit_size = commit_size
+        #Раздел -> список пар [команда, изменение] ещё не записанной пачки
+        self.pending = {}
+        #Последняя версия записей, изменённых в ещё не записанной пачке (None - удалена)
+        self.latest = {}
+        #Записи в том виде, в каком пачка их прочитала: при записи проверяется, что другой процесс их не менял
+        self.bases = {}
+        #Выделенные, но ещё не выданные id: раздел -> [следующий, граница, размер блока]
+        self.id_pools = {}
+        self.counts = {}
+        #Команды, которые не удалось применить заново после конфликта с другим процессом или записать: пары (команда, ошибка)
+        self.failed = []
+        self.errors = 0
+
+    def current(self, section, id):
+        latest = self.latest.get(section, {})
+        if id in latest:
+            return latest[id]
+        obj = repositories[section].get(id)
+        self.bases.setdefault(section, {})[id] = obj.to_dict() if obj != None else None
+        return obj
+
+    #id выдаются сразу, чтобы следующие команды потока могли ссылаться на новую запись. Счётчик резервируется блоками,
+    #блок растёт вдвое до размера пачки: одиночная команда не тратит лишних id, поток не обращается к счётчику на каждую запись
+    def allocate_id(self, section):
+        pool = self.id_pools.get(section)
+        if pool == None or pool[0] == pool[1]:
+            size = min(2 * pool[2] if pool != None else 1, self.commit_size, BATCH_COMMIT_SIZE)
+            ids = repositories[section].sequence.reserve(size)
+            pool = self.id_pools[section] = [ids.start, ids.stop, size]
+        pool[0] += 1
+        return pool[0] - 1
+
+    def change(self, section, command):
+        repository = repositories[section]
+        op = command['op']
+        if op == 'add':
+            obj = repository.factory(make_record(section, dict(command.get('data', {}), id=0)))
+            obj.id = self.allocate_id(section)
+            self.latest.setdefault(section, {})[obj.id] = obj
+            return ('insert', obj)
+        elif op in ('update', 'done'):
+            if op == 'done' and section != 'tasks':
+                raise ValueError('отметка о выполнении есть только у задач')
+            id = int(command['id'])
+            current = self.current(section, id)
+            if current == None:
+                raise LookupError(f'запись {id} не найдена')
+            data = {'done': True} if op == 'done' else command.get('data', {})
+            obj = repository.factory(make_record(section, dict(current.to_dict(), **data, id=id)))
+            self.latest.setdefault(section, {})[id] = obj
+            return ('update', obj)
+        elif op == 'delete':
+            id = int(command['id'])
+            if self.current(section, id) == None:
+                raise LookupError(f'запись {id} не найдена')
+            self.latest.setdefault(section, {})[id] = None
+            return ('delete', id)
+        raise ValueError(f'неизвестная операция: {op}')
+
+    def execute(self, command):
+        section, op = command['section'], command['op']
+        if section not in SECTION_FILES:
+            raise ValueError(f'неизвестный раздел: {section}')
+        change = self.change(section, command)
+        self.pending.setdefault(section, []).append([command, change])
+        self.counts[op] = self.counts.get(op, 0) + 1
+        if len(self.pending[section]) >= self.commit_size:
+            self.flush(section)
+        return change[1].id if op != 'delete' else change[1]
+
+    #Каждый раздел записывается отдельно: ошибка записи одного раздела не мешает записать остальные. Команды раздела,
+    #который не удалось записать, снимаются с очереди и попадают в failed со своей ошибкой - повторять их вслепую нельзя,
+    #так как прочитанные ими версии записей уже могли устареть
+    def flush(self, section=None):
+        for section in [section] if section != None else list(self.pending):
+            entries = self.pending.pop(section, [])
+            bases = self.bases.pop(section, {})
+            self.latest.pop(section, None)
+            if len(entries) == 0:
+                continue
+            repository = repositories[section]
+            try:
+                with repository.storage().lock:
+                    try:
+                        repository.commit([change for command, change in entries], bases)
+                    except ConflictError:
+                        #Записи пачки изменил другой процесс: под той же блокировкой команды применяются заново к свежим данным
+                        changes = self.replay(section, entries)
+                        self.latest.pop(section, None)
+                        self.bases.pop(section, None)
+                        repository.commit(changes)
+            except Exception as e:
+                self.latest.pop(section, None)
+                self.bases.pop(section, None)
+                replayed = {id(command) for command, error in self.failed}
+                for command, change in entries:
+                    if id(command) not in replayed:
+                        self.failed.append((command, e))
+                        self.counts[command['op']] -= 1
+                        self.errors += 1
+
+    def replay(self, section, entries):
+        changes = []
+        for command, change in entries:
+            try:
+                if change[0] == 'insert':
+                    #Новая запись от чужих изменений не зависит и сохраняет уже выданный id
+                    self.latest.setdefault(section, {})[change[1].id] = change[1]
+                else:
+                    change = self.change(section, command)
+                changes.append(change)
+            except Exception as e:
+                self.failed.append((command, e))
+                self.counts[command['op']] -= 1
+                self.errors += 1
+        return changes
+
+    def report_failures(self):
+        for command, error in self.failed:
+            print(f'Команда не записана {json.dumps(command, ensure_ascii=False)}: {error}', file=sys.stderr)
+        self.failed = []
+
+    def run(self, commands):
+        start = time.perf_counter()
+        for number, command in commands:
+            try:
+                self.execute(json.loads(command) if isinstance(command, str) else command)
+            except Exception as e:
+                self.errors += 1
+                print(f'Ошибка в команде {number}: {e}', file=sys.stderr)
+            if len(self.failed) > 0:
+                self.report_failures()
+        self.flush()
+        self.report_failures()
+        return time.perf_counter() - start
+
+#Строки разбираются в BatchExecutor.run, чтобы ошибка в одной строке не останавливала остальные
+def read_batch_commands(file):
+    for number, line in enumerate(file, 1):
+        if line.strip() != '':
+            yield number, line
+
+def print_batch_stats(executor, elapsed):
+    total = sum(executor.counts.values())
+    counts = ', '.join(f'{op}: {count}' for op, count in executor.counts.items())
+    print(f'Выполнено операций: {total} ({counts if counts else "нет"}), ошибок: {executor.errors}, '
+          f'время: {elapsed:.2f} с, {total / elapsed if elapsed > 0 else 0:.0f} оп/с')
+
+def parse_fields(fields):
+    data = {}
+    for field in fields:
+        key, sep, value = field.partition('=')
+        if sep == '':
+            raise ValueError(f'ожидается поле=значение: {field}')
+        data[key] = value
+    return data
+
+def run_cli(args):
+    parser = argparse.ArgumentParser(prog='personal_assistant.py', description='Пакетный режим персонального помощника')
+    commands = parser.add_subparsers(dest='command', required=True)
+    batch = commands.add_parser('batch', help='выполнить команды в формате JSON Lines')
+    batch.add_argument('file', nargs='?', help='файл с командами (по умолчанию stdin)')
+    batch.add_argument('--commit-size', type=int, default=BATCH_COMMIT_SIZE, help='операций в одной записи на диск')
+    migrate = commands.add_parser('migrate', help='перенести данные в другое хранилище')
+    migrate.add_argument('--from', dest='source', choices=list(STORAGE_BACKENDS), default='journal')
+    migrate.add_argument('--to', dest='target', choices=list(STORAGE_BACKENDS), default='sqlite')
+    export = commands.add_parser('export', help='выгрузить раздел в csv, csv.gz или parquet')
+    export.add_argument('section', choices=list(SECTION_FILES))
+    export.add_argument('--format', choices=['auto'] + list(EXPORT_EXTENSIONS), default=EXPORT_FORMAT)
+    export.add_argument('--output', help='файл выгрузки (по умолчанию <раздел>_export или <раздел>_delta_<время> с расширением формата)')
+    export.add_argument('--delta', action='store_true', help='только записи, изменённые с прошлой выгрузки с --delta, и удалённые')
+    export.add_argument('--state', help=f'файл состояния для --delta (по умолчанию <файл раздела>{EXPORT_STATE_SUFFIX})')
+    server = commands.add_parser('serve', help='запустить HTTP API')
+    server.add_argument('--host', default=SERVER_HOST)
+    server.add_argument('--port', type=int, default=SERVER_PORT)
+    for op in ('add', 'update', 'delete', 'done'):
+        command = commands.add_parser(op)
+        command.add_argument('section', choices=['tasks'] if op == 'done' else list(SECTION_FILES))
+        if op != 'add':
+            command.add_argument('id', type=int)
+        if op in ('add', 'update'):
+            command.add_argument('fields', nargs='*', help='поле=значение')
+    args = parser.parse_args(args)
+
+    if args.command == 'batch':
+        executor = BatchExecutor(args.commit_size)
+        if args.file != None:
+            with open(args.file, 'r', encoding='utf-8') as file:
+                elapsed = executor.run(read_batch_commands(file))
+        else:
+            elapsed = executor.run(read_batch_commands(sys.stdin))
+        print_batch_stats(executor, elapsed)
+        return 1 if executor.errors > 0 else 0
+    elif args.command == 'serve':
+        serve(args.host, args.port)
+    elif args.command == 'export':
+        try:
+            format = export_format(args.format)
+            filename = args.output or (f'{args.section}_delta_{dt.now().strftime("%Y%m%d-%H%M%S")}' if args.delta else f'{args.section}_export') + EXPORT_EXTENSIONS[format]
+            count, deleted, elapsed = export_section(args.section, filename, format, args.delta, args.state)
+        except Exception as e:
+            print(f'Ошибка: {e}', file=sys.stderr)
+            return 1
+        print(f'Выгружено записей: {count}' + (f', удалённых: {deleted}' if args.delta else '') + f'; файл: {filename}; время: {elapsed:.2f} с')
+    elif args.command == 'migrate':
+        start = time.perf_counter()
+        counts = migrate_storage(args.source, args.target)
+        print(f'Перенесено записей: {", ".join(f"{section}: {count}" for section, count in counts.items())}; '
+              f'время: {time.perf_counter() - start:.2f} с')
+        if args.target != STORAGE_BACKEND:
+            print(f'Чтобы работать с новым хранилищем, укажите STORAGE_BACKEND = {args.target!r}')
+    else:
+        executor = BatchExecutor()
+        try:
+            id = executor.execute({'section': args.section, 'op': args.command, 'id': getattr(args, 'id', None),
+                                   'data': parse_fields(getattr(args, 'fields', []))})
+            executor.flush()
+            if len(executor.failed) > 0:
+                raise executor.failed[0][1]
+        except Exception as e:
+            print(f'Ошибка: {e}', file=sys.stderr)
+            return 1
+        if args.command == 'add':
+            print(id)
+    return 0
+
+
+#HTTP API поверх тех же репозиториев: python personal_assistant.py serve [--host ...] [--port ...]
+#  GET    /<раздел>?offset=&limit=&<фильтры>   список записей
+#  GET    /<раздел>?sort=&desc=&after=&limit=  страница по курсору (без фильтров); after - курсор next из предыдущего ответа (JSON)
+#  GET    /<раздел>/<id>                       одна запись
+#  POST   /<раздел>                            новая запись (тело - JSON с полями)
+#  PUT    /<раздел>/<id>                       изменение полей
+#  DELETE /<раздел>/<id>                       удаление
+#  POST   /tasks/<id>/done                     отметка о выполнении
+#  GET    /finance/report?start=&end=          отчёт за период
+#  GET    /tasks/next?limit=, /tasks/overdue, /tasks/due?days=   очередь открытых задач по сроку и приоритету
+#Фильтры: notes - q (поиск); tasks - done; contacts - name, phone, email, name_prefix, phone_suffix; finance - start, end, category.
+#Чтения идут из общих кэшей репозиториев. Записи копятся в BatchExecutor и пишутся одной пачкой через SERVER_FLUSH_INTERVAL секунд
+#после первой записи пачки (0 - на следующем шаге цикла событий, в пачку попадают все запросы, пришедшие за время предыдущей записи).
+#Ответ на запись отправляется после того, как её пачка записана на диск.
+HTTP_REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def query_date(query, key):
+    ordinal = date_ordinal(query[key])
+    if ordinal == None:
+        raise ValueError(f'дата некорректна: {query[key]}')
+    return ordinals_to_dates([ordinal])[0]
+
+SECTION_FILTERS = {'notes': ['q'], 'tasks': ['done'], 'contacts': ['name', 'phone', 'email', 'name_prefix', 'phone_suffix'],
+                   'finance': ['start', 'end', 'category']}
+
+def page_section(section, query, offset, limit):
+    sort = query.get('sort', 'id')
+    if sort not in SORT_FIELDS[section]:
+        raise ValueError(f'неизвестное поле сортировки: {sort}')
+    after = json.loads(query['after']) if 'after' in query else None
+    repository = repositories[section]
+    objs, cursor = repository.page(sort, query.get('desc', '').lower() in ('true', '1', 'да'), after, limit, offset)
+    return {'total': len(repository), 'items': [obj.to_dict() for obj in objs], 'next': cursor}
+
+def query_section(section, query, offset, limit):
+    repository = repositories[section]
+    if section == 'finance':
+        start, end = None, None
+        if 'start' in query or 'end' in query:
+            start = query_date(query, 'start') if 'start' in query else np.datetime64('0001-01-01')
+            end = query_date(query, 'end') if 'end' in query else np.datetime64('9999-12-31')
+        return repository.filter_records(start, end, query.get('category'), offset, limit)
+    if section == 'notes' and 'q' in query:
+        found = repository.index().search(query['q'], offset + limit)
+        notes = [dict(repository.get(id).to_dict(), score=score) for id, score in found]
+        return len(notes), notes[offset:]
+    if section == 'contacts':
+        finders = {'name': repository.find_name, 'phone': repository.find_phone, 'email': repository.find_email,
+                   'name_prefix': repository.find_name_prefix, 'phone_suffix': repository.find_phone_suffix}
+        keys = [key for key in finders if key in query]
+        if len(keys) > 0:
+            objs = repository.find(finders[keys[0]](query[keys[0]]))
+            return len(objs), [obj.to_dict() for obj in objs[offset:offset + limit]]
+    if section == 'tasks' and 'done' in query:
+        return repository.filter_done(query['done'].lower() in ('true', '1', 'да'), offset, limit)
+    objs = repository.all()
+    return len(objs), [obj.to_dict() for obj in objs[offset:offset + limit]]
+
+def finance_report(query):
+    start, end = query_date(query, 'start'), query_date(query, 'end')
+    income, outcome = finance_records_repository.period_totals(start, end)
+    months = [{'month': f'{str(month)[5:]}-{str(month)[:4]}', 'income': month_income, 'outcome': month_outcome}
+              for month, month_income, month_outcome in finance_records_repository.month_totals(start, end)]
+    return {'income': income, 'outcome': outcome, 'balance': income - outcome, 'months': months}
+
+class ApiServer:
+    def __init__(self):
+        #Пачки пишутся только по таймеру, чтобы все ответы пачки получили результат одной записи
+        self.executor = BatchExecutor(math.inf)
+        self.waiters = []
+        self.flush_handle = None
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                method, target, version = lines[0].split(' ', 2)
+                headers = {}
+                for line in lines[1:]:
+                    key, sep, value = line.partition(':')
+                    if sep != '':
+                        headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, result = await self.respond(method, target, body)
+                data = json.dumps(result, ensure_ascii=False).encode('utf-8')
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                head = f'HTTP/1.1 {status} {HTTP_REASONS[status]}\r\nContent-Type: application/json; charset=utf-8\r\nContent-Length: {len(data)}\r\n'
+                if not keep_alive:
+                    head += 'Connection: close\r\n'
+                writer.write(head.encode('latin-1') + b'\r\n' + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except Exception as e:
+            print(f'Ошибка: {e}', file=sys.stderr)
+        finally:
+            writer.close()
+
+    async def respond(self, method, target, body):
+        try:
+            url = urllib_parse.urlsplit(target)
+            query = {key: values[-1] for key, values in urllib_parse.parse_qs(url.query).items()}
+            parts = [urllib_parse.unquote(part) for part in url.path.split('/') if part != '']
+            if len(parts) == 0 or parts[0] not in SECTION_FILES:
+                raise HttpError(404, 'раздел не найден')
+            if method == 'GET':
+                return 200, self.read(parts[0], parts[1:], query)
+            return await self.write(method, parts[0], parts[1:], json.loads(body) if len(body) > 0 else {})
+        except HttpError as e:
+            return e.status, {'error': str(e)}
+        except KeyError as e:
+            return 400, {'error': f'не задано поле {e}'}
+        except LookupError as e:
+            return 404, {'error': str(e)}
+        except (ValueError, TypeError) as e:
+            return 400, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': str(e)}
+
+    def read(self, section, parts, query):
+        if section == 'finance' and parts == ['report']:
+            return finance_report(query)
+        if section == 'tasks' and len(parts) == 1 and parts[0] in ('next', 'overdue', 'due'):
+            today = dt.now().toordinal()
+            if parts[0] == 'next':
+                ids = tasks_repository.next(int(query.get('limit', SERVER_LIST_LIMIT)))
+            elif parts[0] == 'overdue':
+                ids = tasks_repository.overdue(today)
+            else:
+                ids = tasks_repository.due_within(int(query.get('days', 0)), today)
+            return {'total': len(ids), 'items': [task.to_dict() for task in tasks_repository.find(ids)]}
+        if len(parts) == 1:
+            obj = repositories[section].get(int(parts[0]))
+            if obj == None:
+                raise HttpError(404, f'запись {parts[0]} не найдена')
+            return obj.to_dict()
+        if len(parts) > 1:
+            raise HttpError(404, 'путь не найден')
+        offset, limit = int(query.get('offset', 0)), int(query.get('limit', SERVER_LIST_LIMIT))
+        if offset < 0 or limit < 0:
+            raise ValueError('offset и limit не могут быть отрицательными')
+        if not any(key in query for key in SECTION_FILTERS[section]):
+            return page_section(section, query, offset, limit)
+        total, items = query_section(section, query, offset, limit)
+        return {'total': total, 'items': items}
+
+    async def write(self, method, section, parts, data):
+        if method == 'POST' and len(parts) == 0:
+            command, status = {'section': section, 'op': 'add', 'data': data}, 201
+        elif method in ('PUT', 'PATCH') and len(parts) == 1:
+            command, status = {'section': section, 'op': 'update', 'id': parts[0], 'data': data}, 200
+        elif method == 'DELETE' and len(parts) == 1:
+            command, status = {'section': section, 'op': 'delete', 'id': parts[0]}, 200
+        elif method == 'POST' and len(parts) == 2 and parts[1] == 'done':
+            command, status = {'section': section, 'op': 'done', 'id': parts[0]}, 200
+        else:
+            raise HttpError(405, 'метод не поддерживается')
+        if not isinstance(data, dict):
+            raise ValueError('тело запроса должно быть JSON-объектом')
+        id = self.executor.execute(command)
+        await self.committed(command)
+        return status, {'id': id}
+
+    def committed(self, command):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.waiters.append((command, future))
+        if self.flush_handle == None:
+            self.flush_handle = loop.call_later(SERVER_FLUSH_INTERVAL, self.flush)
+        return future
+
+    #Ошибку получают только запросы, чьи команды не записаны (раздел с ошибкой записи или конфликт), остальные - успех
+    def flush(self):
+        self.flush_handle = None
+        waiters, self.waiters = self.waiters, []
+        self.executor.flush()
+        failed = {id(command): error for command, error in self.executor.failed}
+        self.executor.failed = []
+        for command, future in waiters:
+            if not future.done():
+                if id(command) in failed:
+                    future.set_exception(failed[id(command)])
+                else:
+                    future.set_result(None)
+
+def serve(host, port):
+    server = ApiServer()
+    #Все разделы загружаются до приёма запросов, чтобы первые запросы не ждали чтения файлов.
+    #SQLite отвечает на запросы по индексам, разделы в память не загружаются
+    for repository in repositories.values():
+        if not repository.storage().indexed_queries:
+            repository.refresh()
+
+    async def main():
+        listener = await asyncio.start_server(server.handle_connection, host, port)
+        print(f'Сервер запущен: http://{host}:{listener.sockets[0].getsockname()[1]}', flush=True)
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.executor.flush()
+        server.executor.report_failures()
+
+#Инструментирование: при включении функции и методы из INSTRUMENTED_* подменяются обёртками, которые считают вызовы,
+#ошибки и время (включая вложенные вызовы). Без флагов ничего не подменяется и накладных расходов нет.
+#Действие для --profile и --trace-memory - имя из статистики (например, get_finance_analysis или JournalStorage.read);
+#профилируется первый вызов, профиль cProfile сохраняется в profile_<действие>.prof.
+INSTRUMENTED_MENU_ACTIONS = ['add_note', 'view_notes', 'view_note', 'update_note', 'delete_note', 'search_notes', 'import_notes_from_csv',
+                            'export_notes_to_csv', 'add_task', 'view_tasks', 'do_task', 'update_task', 'delete_task', 'import_tasks_from_csv',
+                            'export_tasks_to_csv', 'view_next_tasks', 'view_overdue_tasks', 'view_due_soon_tasks', 'add_contact',
+                            'view_contacts', 'view_contact', 'update_contact', 'delete_contact', 'import_contacts_from_csv',
+                            'export_contacts_to_csv', 'add_finance_record', 'view_finance_records', 'get_finance_analysis',
+                            'delete_finance_record', 'import_finance_records_from_csv', 'export_finance_records_to_csv', 'calculate']
+INSTRUMENTED_FUNCTIONS = ['import_csv', 'bulk_import', 'parallel_import', 'stream_import', 'read_import_csv', 'export_section', 'write_csv',
+                          'get_notes', 'save_notes', 'get_tasks', 'save_tasks', 'get_contacts', 'save_contacts',
+                          'get_finance_records', 'save_finance_records', 'get_free_id']
+INSTRUMENTED_METHODS = ['read', 'read_snapshot', 'read_tail', 'load_snapshot', 'apply', 'compact', 'catch_up', 'load']
+
+class Instrumentation:
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}
+        self.started = time.time()
+        self.dumped = time.perf_counter()
+        self.captures = {}
+
+    def enable(self, profile=None, trace_memory=None):
+        if self.enabled:
+            return
+        self.enabled = True
+        if profile != None:
+            self.captures[profile] = 'profile'
+        if trace_memory != None:
+            self.captures[trace_memory] = 'memory'
+        module = globals()
+        for name in INSTRUMENTED_MENU_ACTIONS + INSTRUMENTED_FUNCTIONS:
+            module[name] = self.wrap(name, module[name])
+        #Методы подменяются в каждом классе, где они определены, чтобы переопределения в наследниках тоже учитывались
+        for cls in list(STORAGE_BACKENDS.values()) + [Repository, IndexedRepository, FinanceRepository]:
+            for name in INSTRUMENTED_METHODS:
+                if name in cls.__dict__:
+                    setattr(cls, name, self.wrap(f'{cls.__name__}.{name}', cls.__dict__[name]))
+        atexit.register(self.dump, True)
+
+    def wrap(self, name, function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if name in self.captures:
+                return self.capture(name, function, args, kwargs)
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                self.record(name, time.perf_counter() - start, failed)
+        return wrapper
+
+    def record(self, name, elapsed, failed):
+        stat = self.stats.get(name)
+        if stat == None:
+            stat = self.stats[name] = [0, 0, 0.0, 0.0]
+        stat[0] += 1
+        stat[1] += failed
+        stat[2] += elapsed
+        stat[3] = max(stat[3], elapsed)
+        if time.perf_counter() - self.dumped >= STATS_INTERVAL:
+            self.dump()
+
+    def capture(self, name, function, args, kwargs):
+        kind = self.captures.pop(name)
+        start = time.perf_counter()
+        failed = True
+        try:
+            if kind == 'profile':
+                profiler = cProfile.Profile()
+                result = profiler.runcall(function, *args, **kwargs)
+            else:
+                tracemalloc.start()
+                try:
+                    result = function(*args, **kwargs)
+                    snapshot, peak = tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+            failed = False
+            return result
+        finally:
+            self.record(name, time.perf_counter() - start, failed)
+            if not failed and kind == 'profile':
+                profiler.dump_stats(f'profile_{name}.prof')
+                print(f'[профиль] {name}: сохранён в profile_{name}.prof', file=sys.stderr)
+                pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            elif not failed:
+                print(f'[память] {name}: пик {peak / 2 ** 20:.1f} МБ, крупнейшие выделения:', file=sys.stderr)
+                for stat in snapshot.statistics('lineno')[:PROFILE_TOP]:
+                    print(f'  {stat}', file=sys.stderr)
+
+    def snapshot(self):
+        actions = {name: {'calls': calls, 'errors': errors, 'total_ms': round(total * 1000, 3),
+                          'mean_ms': round(total * 1000 / calls, 3), 'max_ms': round(longest * 1000, 3)}
+                   for name, (calls, errors, total, longest) in sorted(self.stats.items(), key=lambda item: -item[1][2])}
+        return {'updated': dt.now().isoformat(timespec='seconds'), 'uptime_s': round(time.time() - self.started, 1), 'actions': actions}
+
+    def dump(self, final=False):
+        self.dumped = time.perf_counter()
+        try:
+            write_file_atomic(STATS_FILE, json.dumps(self.snapshot(), ensure_ascii=False, indent=1))
+        except Exception as e:
+            print(f'Ошибка при сохранении статистики: {e}', file=sys.stderr)
+        if final and len(self.stats) > 0:
+            print(f'[статистика] сохранена в {STATS_FILE}; дольше всего:', file=sys.stderr)
+            for name, stat in list(self.snapshot()['actions'].items())[:10]:
+                print(f'  {name}: {stat["calls"]} вызовов, всего {stat["total_ms"]:.1f} мс, макс. {stat["max_ms"]:.1f} мс', file=sys.stderr)
+
+instrumentation = Instrumentation()
+
+#Флаги инструментирования убираются из аргументов до разбора команд пакетного режима
+def configure_instrumentation(argv):
+    argv, options = list(argv), {}
+    for flag in ('--profile', '--trace-memory'):
+        if flag in argv:
+            position = argv.index(flag)
+            options[flag] = argv[position + 1] if position + 1 < len(argv) else None
+            del argv[position:position + 2]
+    stats = '--stats' in argv
+    argv = [arg for arg in argv if arg != '--stats']
+    if stats or len(options) > 0:
+        instrumentation.enable(options.get('--profile'), options.get('--trace-memory'))
+    return argv
+
+MODULE_LOADED_TIME = time.perf_counter()
+
+if __name__ == '__main__':
+    sys.argv = configure_instrumentation(sys.argv)
+
+if __name__ == '__main__' and len(sys.argv) > 1 and sys.argv[1] in ('batch', 'serve', 'migrate', 'export', 'add', 'update', 'delete', 'done'):
+    sys.exit(run_cli(sys.argv[1:]))
+
 if __name__ == '__main__':
     print('Добро пожаловать в Персональный помощник!')
 
@@ -669,6 +3958,8 @@ if __name__ == '__main__':
                 elif com == 7:
                     export_notes_to_csv()
                 elif com == 8:
+                    search_notes()
+                elif com == 9:
                     break
 
         #Задачи
@@ -691,6 +3982,12 @@ if __name__ == '__main__':
                 elif com == 7:
                     export_tasks_to_csv()
                 elif com == 8:
+                    view_next_tasks()
+                elif com == 9:
+                    view_overdue_tasks()
+                elif com == 10:
+                    view_due_soon_tasks()
+                elif com == 11:
                     break
 
         #Контакты
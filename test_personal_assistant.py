@@ -0,0 +1,401 @@
+import json
+
+import pytest
+
+import personal_assistant as pa
+
+#Каждый тест работает в своём каталоге с пустыми файлами данных и сброшенными кэшами репозиториев
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pa.storages.clear()
+    for repository in pa.repositories.values():
+        repository.invalidate()
+    yield tmp_path
+    for connection in pa.sqlite_connections.values():
+        connection.close()
+    pa.sqlite_connections.clear()
+    pa.storages.clear()
+    for repository in pa.repositories.values():
+        repository.invalidate()
+
+def write_records(filename, records):
+    with open(filename, 'w') as file:
+        json.dump(records, file)
+
+#finance.json прежней версии: импорт csv сохранял NaN для пустого описания и не проверял даты
+def test_finance_loads_nan_text_from_old_files():
+    write_records(pa.FINANCE_FILE, [{'id': 1, 'amount': 10.0, 'category': float('nan'), 'description': float('nan'), 'date': '01-02-2020'},
+                                    {'id': 2, 'amount': -5.0, 'category': 'Еда', 'description': 7, 'date': '02-02-2020'}])
+    records = {record.id: record for record in pa.get_finance_records()}
+    assert (records[1].category, records[1].description) == ('', '')
+    assert records[2].description == '7'
+
+def test_finance_loads_invalid_dates_from_old_files():
+    write_records(pa.FINANCE_FILE, [{'id': 1, 'amount': 10.0, 'category': 'Еда', 'description': '', 'date': '2020-01-02'},
+                                    {'id': 2, 'amount': -5.0, 'category': 'Еда', 'description': '', 'date': '5-3-2021'}])
+    records = {record.id: record for record in pa.get_finance_records()}
+    assert records[1].date == ''
+    assert records[2].date == '05-03-2021'
+    table = pa.finance_records_repository.refresh()
+    assert table.totals().period(pa.np.datetime64('2021-01-01'), pa.np.datetime64('2021-12-31')) == (0.0, -5.0)
+    pa.finance_records_repository.add(pa.FinanceRecord(3, 1.0, 'Еда', '', '01-01-2022'))
+    assert len(pa.get_finance_records()) == 3
+
+#Поиск строк по id после добавлений без пересборки индекса: новые строки, удалённые и снова добавленные id
+def test_finance_table_rows_for_recent_rows():
+    record = lambda id: {'id': id, 'amount': 1.0, 'category': 'Еда', 'description': '', 'date': '01-01-2024'}
+    table = pa.FinanceTable()
+    table.append([record(id) for id in range(1, 11)])
+    table.build_id_index()
+    table.put_many([record(20), record(3)])
+    table.remove(4)
+    table.remove(20)
+    table.put_many([record(4)])
+    assert table.id_index != None and len(table.recent_rows) > 0
+    ids = [1, 3, 4, 20, 21]
+    live = {int(table.ids[row]): row for row in table.live_rows()}
+    assert table.rows_for(ids).tolist() == [live.get(id, -1) for id in ids]
+
+#Построение индекса контактов сразу по всему разделу совпадает с добавлением по одному
+def test_contact_index_build_matches_add():
+    contacts = [pa.Contact(3, 'Иван  Петров', '8 (900) 111-22-33', 'I@Mail.ru'), pa.Contact(1, 'Анна', '+7 900 111 22 33', 'a@mail.ru'),
+                pa.Contact(2, 'иван петров', '555', '')]
+    index = pa.ContactIndex()
+    for contact in contacts:
+        index.add(contact)
+    assert vars(pa.ContactIndex.build(contacts)) == vars(index)
+
+#Ключ даты в SQLite строится из разобранной даты, а старые ключи из позиций символов пересчитываются при открытии базы
+def test_sqlite_date_keys_for_unpadded_dates():
+    storage = pa.SqliteStorage(pa.FINANCE_FILE)
+    storage.compact([{'id': 1, 'amount': 1.0, 'category': 'Еда', 'description': '', 'date': '5-3-2021'},
+                     {'id': 2, 'amount': 2.0, 'category': 'Еда', 'description': '', 'date': '31-12-2022'}])
+    assert [record['id'] for record in storage.query('date_key BETWEEN ? AND ?', ('2021-03-01', '2021-03-31'))] == [1]
+    storage.db().execute("UPDATE finance SET date_key = '21--2-5-' WHERE id = 1")
+    pa.sqlite_connections.pop(pa.os.path.abspath(pa.SQLITE_FILE)).close()
+    storage = pa.SqliteStorage(pa.FINANCE_FILE)
+    assert [record['id'] for record in storage.query('date_key BETWEEN ? AND ?', ('2021-03-01', '2021-03-31'))] == [1]
+
+#Сортировка задач по сроку идёт по дате, а не по символам строки: 5-3-2021 раньше 31-12-2022
+@pytest.mark.parametrize('backend', ['journal', 'sqlite'])
+def test_tasks_sorted_by_due_date(backend, monkeypatch):
+    monkeypatch.setattr(pa, 'STORAGE_BACKEND', backend)
+    pa.get_storage('tasks').compact([{'id': 1, 'title': 'a', 'description': '', 'done': False, 'priority': 'Средний', 'due_date': '31-12-2022'},
+                                     {'id': 2, 'title': 'b', 'description': '', 'done': False, 'priority': 'Средний', 'due_date': '5-3-2021'},
+                                     {'id': 3, 'title': 'c', 'description': '', 'done': False, 'priority': 'Средний', 'due_date': '01-06-2021'}])
+    tasks, cursor = pa.tasks_repository.page('due_date', limit=2)
+    assert [task.id for task in tasks] == [2, 3]
+    tasks, cursor = pa.tasks_repository.page('due_date', after=cursor, limit=2)
+    assert [task.id for task in tasks] == [1] and cursor == None
+    pa.tasks_repository.refresh()
+    assert [task.id for task in pa.tasks_repository.page('due_date', limit=3)[0]] == [2, 3, 1]
+
+#Для пустого раздела параметры списка не запрашиваются
+@pytest.mark.parametrize('view, empty', [('view_notes', 'Заметки отсутствуют'), ('view_tasks', 'Задачи отсутствуют'), ('view_contacts', 'Контакты отсутствуют')])
+def test_view_empty_section_skips_list_options(view, empty, monkeypatch, capsys):
+    monkeypatch.setattr('builtins.input', lambda prompt='': pytest.fail(f'неожиданный запрос: {prompt}'))
+    getattr(pa, view)()
+    assert capsys.readouterr().out.strip() == empty
+
+def fail_commit(changes, expected=None):
+    raise OSError('диск переполнен')
+
+#Ошибка записи одного раздела не оставляет остальные разделы незаписанными
+def test_batch_flush_commits_sections_separately(monkeypatch):
+    executor = pa.BatchExecutor(100)
+    note_id = executor.execute({'section': 'notes', 'op': 'add', 'data': {'title': 'a', 'content': 'b', 'timestamp': '01-01-2024 10:00:00'}})
+    task_id = executor.execute({'section': 'tasks', 'op': 'add', 'data': {'title': 'a', 'description': '', 'done': False, 'priority': 'Средний', 'due_date': '01-01-2024'}})
+    monkeypatch.setattr(pa.notes_repository, 'commit', fail_commit)
+    executor.flush()
+    assert [(command['section'], str(error)) for command, error in executor.failed] == [('notes', 'диск переполнен')]
+    assert executor.pending == {} and executor.errors == 1 and executor.counts['add'] == 1
+    pa.tasks_repository.invalidate()
+    pa.notes_repository.invalidate()
+    assert pa.tasks_repository.get(task_id) != None and pa.notes_repository.get(note_id) == None
+
+#Сервер отвечает ошибкой только на запросы раздела, который не удалось записать
+def test_server_flush_fails_only_failed_section(monkeypatch):
+    monkeypatch.setattr(pa, 'SERVER_FLUSH_INTERVAL', 0)
+    monkeypatch.setattr(pa.notes_repository, 'commit', fail_commit)
+    server = pa.ApiServer()
+
+    async def main():
+        return await pa.asyncio.gather(
+            server.respond('POST', '/notes', json.dumps({'title': 'a', 'content': 'b', 'timestamp': '01-01-2024 10:00:00'}).encode()),
+            server.respond('POST', '/tasks', json.dumps({'title': 'a', 'description': '', 'done': False, 'priority': 'Средний', 'due_date': '01-01-2024'}).encode()))
+
+    (note_status, note_result), (task_status, task_result) = pa.asyncio.run(main())
+    assert (note_status, note_result) == (500, {'error': 'диск переполнен'})
+    assert task_status == 201 and pa.tasks_repository.get(task_result['id']) != None
+
+#Сохранение раздела целиком сдвигает счётчик id за максимальный сохранённый id
+def test_replace_advances_id_sequence():
+    pa.write_json(pa.SEQUENCES_FILE, {'notes': 2})
+    pa.save_notes([pa.Note(1, 'a', 'b', '01-01-2024 10:00:00'), pa.Note(7, 'c', 'd', '01-01-2024 10:00:00')])
+    assert pa.get_free_id('notes') == 8
+
+#Список в SQLite открывается без загрузки раздела: проверка пустоты и первая страница берутся из базы
+def test_view_tasks_sqlite_does_not_load_section(monkeypatch, capsys):
+    monkeypatch.setattr(pa, 'STORAGE_BACKEND', 'sqlite')
+    assert pa.tasks_repository.is_empty()
+    pa.get_storage('tasks').compact([{'id': 1, 'title': 'a', 'description': '', 'done': False, 'priority': 'Средний', 'due_date': '01-01-2024'}])
+    pa.tasks_repository.invalidate()
+    assert pa.tasks_repository.records is None
+    monkeypatch.setattr('builtins.input', lambda prompt='': '')
+    pa.view_tasks()
+    assert 'Краткое описание: a;' in capsys.readouterr().out
+    assert pa.tasks_repository.records is None
+
+def answers(*values):
+    values = iter(values)
+    def answer(prompt=''):
+        value = next(values)
+        if isinstance(value, BaseException):
+            raise value
+        return value
+    return answer
+
+#Прерванное редактирование не меняет запись ни в кэше, ни на диске при следующей записи раздела
+@pytest.mark.parametrize('interrupt', [EOFError(), KeyboardInterrupt()])
+def test_aborted_update_keeps_cached_record(interrupt, monkeypatch):
+    pa.tasks_repository.add(pa.Task(1, 'a', 'Средний', '01-01-2024', 'описание'))
+    monkeypatch.setattr('builtins.input', answers('1', 'изменено', interrupt))
+    try:
+        pa.update_task()
+    except KeyboardInterrupt:
+        pass
+    assert pa.tasks_repository.get(1).title == 'a'
+    pa.tasks_repository.add(pa.Task(2, 'b', 'Средний', '01-01-2024'))
+    pa.tasks_repository.invalidate()
+    assert pa.tasks_repository.get(1).title == 'a'
+
+def test_find_after_invalidate():
+    pa.tasks_repository.add(pa.Task(1, 'a', 'Средний', '01-01-2024'))
+    pa.tasks_repository.invalidate()
+    assert [task.title for task in pa.tasks_repository.find([1])] == ['a']
+
+#tasks.json и notes.json прежней версии с NaN вместо пустых ячеек csv загружаются и переносятся во все хранилища
+@pytest.mark.parametrize('target', ['binary', 'sqlite'])
+def test_migrate_old_files_with_nan_text(target, monkeypatch):
+    nan = float('nan')
+    write_records(pa.TASKS_FILE, [{'id': 1, 'title': 'a', 'description': nan, 'done': False, 'priority': 'Средний', 'due_date': '01-01-2024'},
+                                  {'id': 2, 'title': nan, 'description': 'b', 'done': True, 'priority': nan, 'due_date': nan}])
+    write_records(pa.NOTES_FILE, [{'id': 1, 'title': nan, 'content': nan, 'timestamp': '01-01-2024 10:00:00'}])
+    tasks = {task.id: task for task in pa.get_tasks()}
+    assert (tasks[1].description, tasks[2].title, tasks[2].priority, tasks[2].due_date) == ('', '', '', '')
+    pa.migrate_storage('journal', target)
+    monkeypatch.setattr(pa, 'STORAGE_BACKEND', target)
+    pa.storages.clear()
+    for repository in pa.repositories.values():
+        repository.invalidate()
+    assert [task.to_dict() for task in pa.tasks_repository.find([1, 2])] == [task.to_dict() for task in tasks.values()]
+    assert (pa.notes_repository.get(1).title, pa.notes_repository.get(1).content) == ('', '')
+
+#Заметки сортируются по разобранному времени (5-3-2021 раньше 31-12-2022), текст не строкой - как пустая строка
+@pytest.mark.parametrize('backend', ['journal', 'sqlite'])
+def test_notes_sorted_by_title_and_timestamp(backend, monkeypatch):
+    monkeypatch.setattr(pa, 'STORAGE_BACKEND', backend)
+    pa.notes_repository.add_many([pa.Note(1, 'b', '', '31-12-2022 09:00:00'), pa.Note(2, float('nan'), '', '5-3-2021 10:00:00'),
+                                  pa.Note(3, 'a', '', '05-03-2021 09:30:00'), pa.Note(4, 'c', '', float('nan'))])
+    for cached in [True, False]:
+        if not cached:
+            pa.notes_repository.invalidate()
+        assert [note.id for note in pa.notes_repository.page('title', limit=4)[0]] == [2, 3, 1, 4]
+        assert [note.id for note in pa.notes_repository.page('timestamp', limit=4)[0]] == [4, 3, 2, 1]
+
+#В базе прежней версии у заметок нет столбца timestamp_key: он добавляется и заполняется при открытии
+def test_sqlite_adds_timestamp_key_to_old_databases():
+    connection = pa.sqlite_connection()
+    connection.execute('CREATE TABLE notes (id INTEGER PRIMARY KEY, title TEXT, content TEXT, timestamp TEXT)')
+    connection.execute("INSERT INTO notes VALUES (1, 'a', '', '5-3-2021 10:00:00')")
+    storage = pa.SqliteStorage(pa.NOTES_FILE)
+    assert storage.db().execute('SELECT timestamp_key FROM notes').fetchall() == [('2021-03-05 10:00:00',)]
+
+#В SQLite без загруженного кэша фильтры, суммы, очередь задач и поиск контактов идут запросами по индексам
+#и дают те же результаты, что и пути в памяти; записи раздел в память не загружают
+def test_sqlite_lookups_match_cached(monkeypatch):
+    monkeypatch.setattr(pa, 'STORAGE_BACKEND', 'sqlite')
+    pa.get_storage('finance').compact([{'id': 1, 'amount': 10.0, 'category': 'Еда', 'description': '', 'date': '5-3-2021'},
+                                       {'id': 2, 'amount': -4.5, 'category': 'Еда', 'description': 'x', 'date': '20-03-2021'},
+                                       {'id': 3, 'amount': -1.0, 'category': 'Дом', 'description': '', 'date': '01-05-2021'},
+                                       {'id': 4, 'amount': 2.0, 'category': 'Дом', 'description': '', 'date': ''}])
+    pa.get_storage('tasks').compact([{'id': 1, 'title': 'a', 'description': '', 'done': False, 'priority': 'Низкий', 'due_date': '01-01-2020'},
+                                     {'id': 2, 'title': 'b', 'description': '', 'done': False, 'priority': 'Высокий', 'due_date': '1-1-2020'},
+                                     {'id': 3, 'title': 'c', 'description': '', 'done': True, 'priority': 'Высокий', 'due_date': '01-01-2020'},
+                                     {'id': 4, 'title': 'd', 'description': '', 'done': False, 'priority': 'Средний', 'due_date': '10-01-2020'},
+                                     {'id': 5, 'title': 'e', 'description': '', 'done': False, 'priority': 'Средний', 'due_date': ''}])
+    pa.get_storage('contacts').compact([{'id': 1, 'name': 'Иван  Петров', 'phone': '8 (900) 111-22-33', 'email': 'I@Mail.ru'},
+                                        {'id': 2, 'name': 'иван петров', 'phone': '+7 900 111 22 33', 'email': 'i@mail.ru '},
+                                        {'id': 3, 'name': 'Анна', 'phone': '555-22-33', 'email': 'a@mail.ru'}])
+    finance, tasks, contacts = pa.finance_records_repository, pa.tasks_repository, pa.contacts_repository
+    start, end, today = pa.np.datetime64('2021-03-01'), pa.np.datetime64('2021-04-30'), pa.date_ordinal('05-01-2020')
+
+    def lookups():
+        return [finance.period_totals(start, end), finance.month_totals(start, end), finance.category_totals('Еда'), finance.category_totals('нет'),
+                finance.filter_records(start, end, offset=1), finance.filter_records(category='Дом'),
+                [record.id for record in finance.page('date', start=start, end=end)[0]], [record.id for record in finance.page('amount', category='Дом')[0]],
+                tasks.next(10), tasks.overdue(today), tasks.due_within(10, today), tasks.filter_done(False, 1, 2),
+                contacts.find_name('ИВАН петров'), contacts.find_phone('89001112233'), contacts.find_email('I@mail.ru'),
+                contacts.find_name_prefix('ив'), contacts.find_phone_suffix('2233', 1), contacts.find_phone_suffix('')]
+
+    for repository in pa.repositories.values():
+        repository.invalidate()
+    from_storage = lookups()
+    assert all(repository.records is None for repository in pa.repositories.values())
+    for repository in pa.repositories.values():
+        repository.refresh()
+    assert lookups() == from_storage
+    assert from_storage[0] == (10.0, -4.5) and from_storage[8] == [2, 1, 4] and from_storage[12] == [1, 2]
+
+    for repository in pa.repositories.values():
+        repository.invalidate()
+    tasks.add(pa.Task(6, 'f', 'Высокий', '01-01-2019'))
+    assert tasks.records is None and tasks.next(1) == [6] and len(tasks) == 6 and tasks.max_id() == 6
+
+#Список за период листается по строкам из индекса дат: вся таблица не просматривается, порядок и курсоры те же
+def test_finance_date_filter_pages_only_matching_rows(monkeypatch):
+    dates = ['01-03-2021', '02-03-2021', '01-03-2021', '03-03-2021', '01-03-2021']
+    pa.save_finance_records([pa.FinanceRecord(id, float(id % 3), 'Еда', '', dates[id % 5]) for id in range(1, 51)])
+    start, end = pa.np.datetime64('2021-03-01'), pa.np.datetime64('2021-03-02')
+    expected = sorted((record.amount, record.id) for record in pa.get_finance_records() if record.date in ('01-03-2021', '02-03-2021'))
+    pa.finance_records_repository.refresh().build_date_index()
+    monkeypatch.setattr(pa.FinanceTable, 'live_rows', lambda table: pytest.fail('просмотр всей таблицы'))
+    for reverse in [False, True]:
+        found, cursor = [], None
+        while True:
+            records, cursor = pa.finance_records_repository.page('amount', reverse, cursor, 7, start=start, end=end)
+            found += [(record.amount, record.id) for record in records]
+            if cursor == None:
+                break
+        assert found == (expected[::-1] if reverse else expected)
+
+#Пустые даты идут первыми и в SQLite, и в таблице в памяти; курсор одного пути продолжает список на другом
+@pytest.mark.parametrize('reverse', [False, True])
+def test_finance_date_pages_match_across_paths(reverse, monkeypatch):
+    monkeypatch.setattr(pa, 'STORAGE_BACKEND', 'sqlite')
+    dates = ['', '05-03-2021', '5-3-2021', '2020-01-02', '31-12-2020', '01-01-2021']
+    write_records(pa.FINANCE_FILE, [{'id': id, 'amount': 1.0, 'category': 'Еда', 'description': '', 'date': dates[id % 6]} for id in range(1, 25)])
+    pa.migrate_storage('json', 'sqlite')
+    repository = pa.finance_records_repository
+
+    def pages(loaded_after_first):
+        repository.invalidate()
+        found, cursor = [], None
+        while True:
+            records, cursor = repository.page('date', reverse, cursor, 5)
+            found += [record.id for record in records]
+            if cursor == None:
+                return found
+            if loaded_after_first:
+                repository.refresh()
+
+    from_storage = pages(False)
+    assert pages(True) == from_storage
+    repository.refresh()
+    assert [record.id for record in repository.page('date', reverse, None, 24)[0]] == from_storage
+    empty = [id for id in range(1, 25) if dates[id % 6] in ('', '2020-01-02')]
+    assert (from_storage[::-1] if reverse else from_storage)[:len(empty)] == empty
+
+#Приоритет и ассоциативность операций калькулятора, свёртка констант и столбцы переменных
+@pytest.mark.parametrize('source, expected', [('2 + 3 * 4', 14), ('(2 + 3) * 4', 20), ('2 ** 3 ** 2', 512), ('-2 ** 2', -4),
+                                              ('2 ** -1', 0.5), ('10 - 4 - 3', 3), ('7 // 2 * 2', 6), ('8 / 4 / 2', 1.0), ('--3', 3)])
+def test_calculator_precedence(source, expected):
+    assert pa.compile_expression(source).evaluate() == expected
+
+def test_calculator_variables_and_columns():
+    expression = pa.compile_expression('price * (1 + rate) - 2 * 3')
+    assert [step[0] for step in expression.program].count('value') == 2
+    assert expression.evaluate({'price': 100, 'rate': 0.5}) == 144.0
+    assert pa.evaluate_expressions(['x * 2'], {'x': [1, 2, 3]})[0].tolist() == [2, 4, 6]
+    with pytest.raises(pa.CalcError):
+        expression.evaluate({'price': 1})
+
+#Ограничения: длина выражения, размер целых результатов, глубина скобок разбирается без рекурсии
+@pytest.mark.parametrize('source', ['1 + ' * 250 + '1', '2 ** 100000', '9 ** 9 ** 9', '(2 ** 5000) * (2 ** 5001)', '1 / 0',
+                                    '__import__("os")', '2 +', '(1', '1)', '1 2', '()'])
+def test_calculator_rejects(source):
+    with pytest.raises(pa.CalcError):
+        pa.compile_expression(source)
+
+def test_calculator_deep_parentheses():
+    depth = (pa.CALC_MAX_LENGTH - 1) // 2
+    assert pa.compile_expression('(' * depth + '1' + ')' * depth).evaluate() == 1
+    with pytest.raises(pa.CalcError):
+        pa.compile_expression('(' * (depth + 1) + '1' + ')' * (depth + 1))
+    assert pa.compile_expression('-' * (pa.CALC_MAX_LENGTH - 1) + '1').evaluate() == -1
+
+def write_notes_csv(filename, count):
+    rows = [{'id': id, 'title': f'Заметка {id}', 'content': f'строка "{id}"\nвторая строка\n' * (id % 3), 'timestamp': '01-01-2024 10:00:00'}
+            for id in range(1, count + 1)]
+    pa.pd.DataFrame(rows).to_csv(filename, index=False)
+    return rows
+
+#Части файла заканчиваются только на концах строк вне кавычек, вместе они разбираются как весь файл
+@pytest.mark.parametrize('chunk_bytes', [1, 16, 100, 10 ** 6])
+def test_import_ranges_keep_quoted_newlines(chunk_bytes):
+    rows = write_notes_csv('notes.csv', 30)
+    header, ranges = pa.import_ranges('notes.csv', chunk_bytes)
+    assert header == b'id,title,content,timestamp\n'
+    assert [start for start, end in ranges[1:]] == [end for start, end in ranges[:-1]]
+    assert ranges[-1][1] == pa.os.path.getsize('notes.csv')
+    parts = list(pa.parse_import_chunks('notes', 'notes.csv', chunk_bytes))
+    assert sum(rejected for part, rejected in parts) == 0
+    df = pa.pd.concat([part for part, rejected in parts], ignore_index=True)
+    assert pa.frame_records(df) == rows
+
+#Импорт, прерванный до или после записи части, продолжается с той же части: без повторов и с теми же новыми id
+@pytest.mark.parametrize('after_apply', [False, True])
+def test_stream_import_resumes_after_interruption(after_apply, monkeypatch):
+    monkeypatch.setattr(pa, 'IMPORT_CHUNK_BYTES', 200)
+    pa.notes_repository.add(pa.Note(1, 'Старая', '', '01-01-2023 09:00:00'))
+    rows = write_notes_csv('notes.csv', 40)
+    storage = pa.notes_repository.storage()
+    apply, calls = storage.apply, []
+
+    def interrupted(ops, snapshot=None, compact=True):
+        calls.append(len(ops))
+        if len(calls) == 3 and not after_apply:
+            raise KeyboardInterrupt()
+        apply(ops, snapshot, compact)
+        if len(calls) == 3:
+            raise KeyboardInterrupt()
+
+    monkeypatch.setattr(storage, 'apply', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        pa.stream_import('notes', 'notes.csv')
+    assert pa.os.path.exists(storage.filename + pa.IMPORT_PROGRESS_SUFFIX)
+    monkeypatch.setattr(storage, 'apply', apply)
+    count, rejected, elapsed = pa.stream_import('notes', 'notes.csv')
+    assert not pa.os.path.exists(storage.filename + pa.IMPORT_PROGRESS_SUFFIX)
+    assert len(calls) >= 3 and rejected == 0
+    pa.notes_repository.invalidate()
+    notes = pa.get_notes()
+    assert len(notes) == 41 and len({note.id for note in notes}) == 41
+    assert sorted(note.title for note in notes if note.title != 'Старая') == sorted(row['title'] for row in rows)
+    assert pa.notes_repository.get(1).title == 'Старая'
+
+#Сбой писателя посреди строки журнала: чтение останавливается перед ней и файл не меняет, следующая запись её обрезает
+def test_journal_replay_skips_truncated_last_line():
+    #Небольшие добавления в непустой раздел пишутся в журнал, а не новым снимком
+    pa.notes_repository.add_many([pa.Note(id, f'Заметка {id}', '', '01-01-2024 10:00:00') for id in range(1, 11)])
+    pa.notes_repository.add(pa.Note(11, 'Заметка 11', '', '01-01-2024 10:00:00'))
+    storage = pa.notes_repository.storage()
+    with open(storage.journal, 'ab') as file:
+        file.write(json.dumps({'op': 'delete', 'id': 1}).encode() + b'\n')
+        file.write('{"op": "insert", "data": {"id": 3, "title": "Обрыв'.encode())
+    size = pa.os.path.getsize(storage.journal)
+    fresh = pa.JournalStorage(storage.filename)
+    records, position = fresh.read()
+    assert sorted(records) == list(range(2, 12)) and position < size
+    assert pa.os.path.getsize(storage.journal) == size
+    pa.storages.clear()
+    pa.notes_repository.invalidate()
+    assert sorted(note.id for note in pa.get_notes()) == list(range(2, 12))
+    pa.notes_repository.add(pa.Note(12, 'После сбоя', '', '02-01-2024 10:00:00'))
+    with open(storage.journal, 'rb') as file:
+        lines = file.read().split(b'\n')
+    assert len(lines) == 4 and lines[-1] == b'' and all(json.loads(line) for line in lines[:-1])
+    pa.storages.clear()
+    pa.notes_repository.invalidate()
+    assert sorted(note.id for note in pa.get_notes()) == list(range(2, 12)) + [12]